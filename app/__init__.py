@@ -1,6 +1,16 @@
+import atexit
+
 from flask import Flask
 from app.config import load_configurations, configure_logging
 from .views import webhook_blueprint
+from .services.worker_pool import MessageWorkerPool
+from .services.graph_client import GraphAPIClient
+from .services.outbound_dispatcher import OutboundDispatcher
+from .services.chat_logger import get_chat_logger
+from .models.chat_history import ChatHistory
+from .models.migrations import prepare_database
+from .utils.whatsapp_utils import process_whatsapp_message
+from rag.registry import get_registry
 
 
 def create_app():
@@ -10,7 +20,69 @@ def create_app():
     load_configurations(app)
     configure_logging()
 
+    # Create tables and apply pending migrations (e.g. reservation slot counters) before serving
+    prepare_database(ChatHistory())
+
+    # Load the embedding model, Chroma collection and OpenAI client once per process
+    registry = get_registry()
+    if app.config["WARM_RESOURCES"]:
+        registry.warm()
+    app.extensions["resource_registry"] = registry
+
+    # One long-lived, pooled session for all Graph API sends
+    graph_client = GraphAPIClient(
+        access_token=app.config["ACCESS_TOKEN"],
+        version=app.config["VERSION"],
+        phone_number_id=app.config["PHONE_NUMBER_ID"],
+        base_url=app.config["GRAPH_API_BASE_URL"],
+        pool_size=app.config["GRAPH_POOL_SIZE"],
+        max_retries=app.config["GRAPH_MAX_RETRIES"],
+        backoff_base=app.config["GRAPH_BACKOFF_BASE"],
+        backoff_max=app.config["GRAPH_BACKOFF_MAX"],
+        timeout=app.config["GRAPH_TIMEOUT"],
+    )
+    app.extensions["graph_client"] = graph_client
+
+    # Async outbound mode: sends run on an asyncio loop, rate limited per phone number id
+    if app.config["OUTBOUND_MODE"] == "async":
+        dispatcher = OutboundDispatcher(
+            access_token=app.config["ACCESS_TOKEN"],
+            version=app.config["VERSION"],
+            base_url=app.config["GRAPH_API_BASE_URL"],
+            rate_per_second=app.config["GRAPH_RATE_LIMIT"],
+            burst=app.config["GRAPH_RATE_BURST"],
+            max_connections=app.config["GRAPH_MAX_CONNECTIONS"],
+            max_retries=app.config["GRAPH_MAX_RETRIES"],
+            backoff_base=app.config["GRAPH_BACKOFF_BASE"],
+            backoff_max=app.config["GRAPH_BACKOFF_MAX"],
+            timeout=app.config["GRAPH_TIMEOUT"],
+        )
+        dispatcher.start()
+        app.extensions["outbound_dispatcher"] = dispatcher
+        # atexit runs in reverse order: the worker pool drains before the dispatcher closes
+        atexit.register(dispatcher.shutdown, app.config["WORKER_DRAIN_TIMEOUT"])
+
+    # Chat records are written behind the reply by a single batching writer thread;
+    # registered before the worker pool so it flushes after the pool has drained
+    chat_logger = get_chat_logger()
+    if chat_logger is not None:
+        app.extensions["chat_logger"] = chat_logger
+        atexit.register(chat_logger.shutdown, app.config["WORKER_DRAIN_TIMEOUT"])
+
     # Import and register blueprints, if any
     app.register_blueprint(webhook_blueprint)
 
+    # Messages are sharded by wa_id: one customer's messages run in order,
+    # different customers run in parallel. In async mode the webhook only enqueues.
+    pool = MessageWorkerPool(
+        app,
+        process_whatsapp_message,
+        num_workers=app.config["WORKER_COUNT"],
+        max_queue_size=app.config["WORKER_QUEUE_SIZE"],
+        max_pending_per_key=app.config["WORKER_MAX_PENDING_PER_CUSTOMER"],
+    )
+    pool.start()
+    app.extensions["message_worker_pool"] = pool
+    atexit.register(pool.shutdown, app.config["WORKER_DRAIN_TIMEOUT"])
+
     return app
@@ -15,6 +15,36 @@ def load_configurations(app):
     app.config["PHONE_NUMBER_ID"] = os.getenv("PHONE_NUMBER_ID")
     app.config["VERIFY_TOKEN"] = os.getenv("VERIFY_TOKEN")
 
+    # Graph API 連接池和重試設定
+    app.config["GRAPH_API_BASE_URL"] = os.getenv("GRAPH_API_BASE_URL", "https://graph.facebook.com")
+    app.config["GRAPH_POOL_SIZE"] = int(os.getenv("GRAPH_POOL_SIZE", "10"))
+    app.config["GRAPH_MAX_RETRIES"] = int(os.getenv("GRAPH_MAX_RETRIES", "3"))
+    app.config["GRAPH_BACKOFF_BASE"] = float(os.getenv("GRAPH_BACKOFF_BASE", "0.5"))
+    app.config["GRAPH_BACKOFF_MAX"] = float(os.getenv("GRAPH_BACKOFF_MAX", "8"))
+    app.config["GRAPH_TIMEOUT"] = float(os.getenv("GRAPH_TIMEOUT", "10"))
+
+    # "sync": 工作線程等待 Graph API 回應；"async": 交給異步發送器，工作線程不等待網絡
+    app.config["OUTBOUND_MODE"] = os.getenv("OUTBOUND_MODE", "sync")
+    # 每個 PHONE_NUMBER_ID 的發送速率上限（條/秒）和突發容量
+    app.config["GRAPH_RATE_LIMIT"] = float(os.getenv("GRAPH_RATE_LIMIT", "80"))
+    app.config["GRAPH_RATE_BURST"] = float(os.getenv("GRAPH_RATE_BURST", "80"))
+    app.config["GRAPH_MAX_CONNECTIONS"] = int(os.getenv("GRAPH_MAX_CONNECTIONS", "100"))
+
+    # 啟動時預先載入 embedding 模型和向量集合
+    app.config["WARM_RESOURCES"] = os.getenv("WARM_RESOURCES", "true").lower() == "true"
+
+    # "async"（默認）: 先回覆 200，交由背景工作池處理；"sync": 等待工作池處理完才回覆
+    # 兩種模式都按 wa_id 分片，同一客戶的訊息按順序處理
+    app.config["WEBHOOK_MODE"] = os.getenv("WEBHOOK_MODE", "async")
+    # sync 模式最多等待的秒數，超時先回覆，訊息在背景繼續處理，避免超過 Meta 的重送時限
+    app.config["WEBHOOK_SYNC_TIMEOUT"] = float(os.getenv("WEBHOOK_SYNC_TIMEOUT", "10"))
+    app.config["WORKER_COUNT"] = int(os.getenv("WORKER_COUNT", "4"))
+    app.config["WORKER_QUEUE_SIZE"] = int(os.getenv("WORKER_QUEUE_SIZE", "1000"))
+    app.config["WORKER_MAX_PENDING_PER_CUSTOMER"] = int(
+        os.getenv("WORKER_MAX_PENDING_PER_CUSTOMER", "20")
+    )
+    app.config["WORKER_DRAIN_TIMEOUT"] = float(os.getenv("WORKER_DRAIN_TIMEOUT", "30"))
+
 
 def configure_logging():
     logging.basicConfig(
@@ -1,12 +1,56 @@
 from datetime import datetime
 import sqlite3
 import logging
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Callable
 import os
 import json
+import threading
 import time
 from contextlib import contextmanager
 
+# 每個線程每個數據庫文件只保留一個連接，PRAGMA 只在建立連接時執行一次
+_local = threading.local()
+
+# 熱點查詢；migrations.QUERY_PLAN_CHECKS 檢查的是同一批語句
+USER_HISTORY_SQL = '''
+SELECT message, response, created_at
+FROM chat_history
+WHERE wa_id = ?
+ORDER BY created_at DESC
+LIMIT ?
+'''
+
+RECENT_CHAT_HISTORY_SQL = '''
+SELECT
+    ch.message,
+    ch.response,
+    ch.created_at,
+    ch.category_id,
+    mc.name as category_name,
+    1 as is_user
+FROM chat_history ch
+LEFT JOIN message_categories mc ON ch.category_id = mc.id
+WHERE ch.wa_id = ?  -- 嚴格匹配 WhatsApp ID
+AND ch.created_at >= datetime('now', ?)
+AND ch.message IS NOT NULL
+ORDER BY ch.created_at ASC
+'''
+
+RESERVATIONS_BY_DATE_SQL = '''
+SELECT
+    id,
+    wa_id,
+    user_name,
+    reservation_time,
+    number_of_people,
+    special_requests,
+    status
+FROM table_reservations
+WHERE reservation_date = ?
+ORDER BY reservation_time
+'''
+
+
 class ChatHistory:
     def __init__(self, db_path="db/chat_history.db"):
         """初始化 ChatHistory 類
@@ -18,25 +62,78 @@ class ChatHistory:
         self.max_retries = 3
         logging.info(f"初始化 ChatHistory，使用數據庫路徑: {self.db_path}")
 
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.timeout,
+            cached_statements=int(os.getenv('SQLITE_STATEMENT_CACHE', '256'))
+        )
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA busy_timeout=5000')
+        conn.execute(f"PRAGMA cache_size=-{int(os.getenv('SQLITE_CACHE_KB', '8192'))}")
+        conn.execute(f"PRAGMA mmap_size={int(os.getenv('SQLITE_MMAP_BYTES', str(64 * 1024 * 1024)))}")
+        return conn
+
+    def _thread_state(self) -> dict:
+        """返回當前線程對這個數據庫的連接狀態，fork 之後重新建立連接"""
+        states = getattr(_local, "states", None)
+        if states is None or getattr(_local, "pid", None) != os.getpid():
+            states = _local.states = {}
+            _local.pid = os.getpid()
+        state = states.get(self.db_path)
+        if state is None:
+            state = states[self.db_path] = {"conn": self._connect(), "depth": 0}
+        return state
+
     @contextmanager
     def get_db_connection(self):
-        """創建數據庫連接的上下文管理器"""
-        retries = 0
-        while retries < self.max_retries:
+        """返回當前線程共用的數據庫連接
+        最外層的 with 結束時提交事務，出錯時回滾；嵌套使用時由最外層負責。
+        """
+        state = self._thread_state()
+        conn = state["conn"]
+        state["depth"] += 1
+        try:
+            yield conn
+            if state["depth"] == 1 and conn.in_transaction:
+                conn.commit()
+        except Exception:
+            if state["depth"] == 1 and conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            state["depth"] -= 1
+
+    def run_transaction(self, work: Callable[[sqlite3.Connection], Any], immediate: bool = True) -> Any:
+        """在一個完整事務中執行 work(conn)，數據庫被鎖時整個事務重試
+        Args:
+            work (callable): 接收連接的函數，返回值會被傳回
+            immediate (bool): 使用 BEGIN IMMEDIATE 一開始就取得寫鎖，避免讀鎖升級時死鎖
+        """
+        for attempt in range(1, self.max_retries + 1):
+            nested = False
             try:
-                conn = sqlite3.connect(self.db_path, timeout=self.timeout)
-                conn.execute('PRAGMA journal_mode=WAL')
-                conn.execute('PRAGMA busy_timeout=5000')
-                yield conn
-                conn.close()
-                break
+                with self.get_db_connection() as conn:
+                    nested = conn.in_transaction
+                    if immediate and not nested:
+                        conn.execute('BEGIN IMMEDIATE')
+                    return work(conn)
             except sqlite3.OperationalError as e:
-                retries += 1
-                if retries == self.max_retries:
-                    raise e
-                time.sleep(1)
-            except Exception as e:
-                raise e
+                message = str(e).lower()
+                busy = "locked" in message or "busy" in message
+                # 嵌套事務無法單獨重試，交給最外層處理
+                if not busy or nested or attempt == self.max_retries:
+                    raise
+                logging.warning(f"數據庫忙碌，第 {attempt} 次重試事務: {str(e)}")
+                time.sleep(0.05 * 2 ** attempt)
+
+    def close(self):
+        """關閉當前線程的連接"""
+        states = getattr(_local, "states", None) or {}
+        state = states.pop(self.db_path, None)
+        if state is not None:
+            state["conn"].close()
 
     def init_db(self):
         """初始化數據庫表"""
@@ -135,53 +232,53 @@ class ChatHistory:
     def add_chat_record(self, wa_id: str, user_name: str, message: str, response: str, 
                         category: str = None, context: str = None, metadata: dict = None) -> bool:
         """添加新的對話記錄"""
+        def write(conn):
+            cursor = conn.cursor()
+            
+            # 確保用戶存在
+            cursor.execute('''
+            INSERT OR IGNORE INTO users (wa_id, name, conversation_count)
+            VALUES (?, ?, 0)
+            ''', (wa_id, user_name))
+            
+            # 更新用戶信息
+            cursor.execute('''
+            UPDATE users 
+            SET last_seen = CURRENT_TIMESTAMP,
+                conversation_count = conversation_count + 1,
+                name = COALESCE(NULLIF(?, ''), name)
+            WHERE wa_id = ?
+            ''', (user_name, wa_id))
+            
+            # 獲取分類ID
+            category_id = None
+            if category:
+                cursor.execute('SELECT id FROM message_categories WHERE name = ?', (category,))
+                result = cursor.fetchone()
+                category_id = result[0] if result else None
+            
+            # 插入新的對話記錄（使用 INSERT，確保是追加）
+            cursor.execute('''
+            INSERT INTO chat_history 
+            (wa_id, user_name, message, response, category_id, context, metadata, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ''', (
+                wa_id, 
+                user_name, 
+                message, 
+                response, 
+                category_id, 
+                context, 
+                json.dumps(metadata) if metadata else None
+            ))
+            
+            # 獲取新插入記錄的ID
+            return cursor.lastrowid
+
         try:
-            with self.get_db_connection() as conn:
-                cursor = conn.cursor()
-                
-                # 確保用戶存在
-                cursor.execute('''
-                INSERT OR IGNORE INTO users (wa_id, name, conversation_count)
-                VALUES (?, ?, 0)
-                ''', (wa_id, user_name))
-                
-                # 更新用戶信息
-                cursor.execute('''
-                UPDATE users 
-                SET last_seen = CURRENT_TIMESTAMP,
-                    conversation_count = conversation_count + 1,
-                    name = COALESCE(NULLIF(?, ''), name)
-                WHERE wa_id = ?
-                ''', (user_name, wa_id))
-                
-                # 獲取分類ID
-                category_id = None
-                if category:
-                    cursor.execute('SELECT id FROM message_categories WHERE name = ?', (category,))
-                    result = cursor.fetchone()
-                    category_id = result[0] if result else None
-                
-                # 插入新的對話記錄（使用 INSERT，確保是追加）
-                cursor.execute('''
-                INSERT INTO chat_history 
-                (wa_id, user_name, message, response, category_id, context, metadata, created_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-                ''', (
-                    wa_id, 
-                    user_name, 
-                    message, 
-                    response, 
-                    category_id, 
-                    context, 
-                    json.dumps(metadata) if metadata else None
-                ))
-                
-                # 獲取新插入記錄的ID
-                new_record_id = cursor.lastrowid
-                
-                conn.commit()
-                logging.info(f"成功添加新對話記錄 ID: {new_record_id} 用戶: {wa_id}")
-                return True
+            new_record_id = self.run_transaction(write)
+            logging.info(f"成功添加新對話記錄 ID: {new_record_id} 用戶: {wa_id}")
+            return True
                 
         except Exception as e:
             logging.error(f"添加對話記錄時出錯: {str(e)}")
@@ -192,13 +289,7 @@ class ChatHistory:
         try:
             with self.get_db_connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute('''
-                SELECT message, response, created_at 
-                FROM chat_history 
-                WHERE wa_id = ? 
-                ORDER BY created_at DESC 
-                LIMIT ?
-                ''', (wa_id, limit))
+                cursor.execute(USER_HISTORY_SQL, (wa_id, limit))
                 return cursor.fetchall()
         except Exception as e:
             logging.error(f"獲取用戶歷史記錄時出錯: {str(e)}")
@@ -217,21 +308,7 @@ class ChatHistory:
                     return []
                 
                 # 獲取指定用戶的最近對話記錄
-                cursor.execute('''
-                SELECT 
-                    ch.message,
-                    ch.response,
-                    ch.created_at,
-                    ch.category_id,
-                    mc.name as category_name,
-                    1 as is_user
-                FROM chat_history ch
-                LEFT JOIN message_categories mc ON ch.category_id = mc.id
-                WHERE ch.wa_id = ?  -- 嚴格匹配 WhatsApp ID
-                AND ch.created_at >= datetime('now', ?)
-                AND ch.message IS NOT NULL
-                ORDER BY ch.created_at ASC
-                ''', (wa_id, f'-{hours} hours'))
+                cursor.execute(RECENT_CHAT_HISTORY_SQL, (wa_id, f'-{hours} hours'))
                 
                 history = []
                 for msg, resp, timestamp, cat_id, cat_name, is_user in cursor.fetchall():
@@ -273,88 +350,25 @@ class ChatHistory:
     def add_human_support_request(self, wa_id: str, user_name: str, request_type: str, message: str) -> bool:
         """記錄需要人工客服處理的請求"""
         try:
-            with self.get_db_connection() as conn:
-                cursor = conn.cursor()
-                
-                # 添加請求記錄
-                cursor.execute('''
+            # 添加請求記錄
+            self.run_transaction(lambda conn: conn.execute('''
                 INSERT INTO human_support_requests 
                 (wa_id, user_name, request_type, message)
                 VALUES (?, ?, ?, ?)
-                ''', (wa_id, user_name, request_type, message))
-                
-                conn.commit()
-                return True
+                ''', (wa_id, user_name, request_type, message)))
+            return True
                 
         except Exception as e:
             logging.error(f"添加人工客服請求時出錯: {str(e)}")
             return False
 
-    def add_reservation(self, 
-                       wa_id: str,
-                       user_name: str,
-                       reservation_date: str,
-                       reservation_time: str,
-                       number_of_people: int,
-                       special_requests: str = None) -> bool:
-        """添加新的訂枱記錄（移除 table_type 參數）"""
-        try:
-            with self.get_db_connection() as conn:
-                cursor = conn.cursor()
-                
-                # 添加訂位記錄（移除 table_type）
-                cursor.execute('''
-                INSERT INTO table_reservations 
-                (wa_id, user_name, reservation_date, reservation_time, 
-                 number_of_people, special_requests)
-                VALUES (?, ?, ?, ?, ?, ?)
-                ''', (wa_id, user_name, reservation_date, reservation_time, 
-                     number_of_people, special_requests))
-                
-                conn.commit()
-                return True
-                
-        except Exception as e:
-            logging.error(f"添加訂位記錄時出錯: {str(e)}")
-            return False
-
     def get_reservations_by_date(self, date: str) -> list:
         """獲取指定日期的所有訂位"""
         try:
             with self.get_db_connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute('''
-                SELECT 
-                    id,
-                    wa_id,
-                    user_name,
-                    reservation_time,
-                    number_of_people,
-                    special_requests,
-                    status
-                FROM table_reservations 
-                WHERE reservation_date = ?
-                ORDER BY reservation_time
-                ''', (date,))
+                cursor.execute(RESERVATIONS_BY_DATE_SQL, (date,))
                 return cursor.fetchall()
         except Exception as e:
             logging.error(f"獲取訂位記錄時出錯: {str(e)}")
             return []
-
-    def update_reservation_status(self, reservation_id: int, status: str) -> bool:
-        """更新訂位狀態"""
-        try:
-            with self.get_db_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                UPDATE table_reservations 
-                SET status = ?,
-                    updated_at = CURRENT_TIMESTAMP
-                WHERE id = ?
-                ''', (status, reservation_id))
-                
-                conn.commit()
-                return True
-        except Exception as e:
-            logging.error(f"更新訂位狀態時出錯: {str(e)}")
-            return False
\ No newline at end of file
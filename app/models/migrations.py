@@ -0,0 +1,110 @@
+import logging
+from typing import Callable, Dict, List, Tuple, Union
+
+from app.models.chat_history import (
+    ChatHistory, RECENT_CHAT_HISTORY_SQL, RESERVATIONS_BY_DATE_SQL, USER_HISTORY_SQL
+)
+from app.models.reservation_slots import SLOT_OCCUPANCY_SQL, rebuild_slot_counters
+
+# (版本號, 說明, 步驟)；步驟是 SQL 語句或接收連接的函數
+# 已發佈的遷移不要修改，只在最後追加新版本
+MIGRATIONS: List[Tuple[int, str, List[Union[str, Callable]]]] = [
+    (1, "add indexes for history and reservation lookups", [
+        '''
+        CREATE INDEX IF NOT EXISTS idx_chat_history_wa_id_created_at
+        ON chat_history (wa_id, created_at)
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_table_reservations_date_time_status
+        ON table_reservations (reservation_date, reservation_time, status)
+        ''',
+    ]),
+    (2, "add per-date 30-minute reservation slot counters", [
+        '''
+        CREATE TABLE IF NOT EXISTS reservation_slots (
+            reservation_date DATE NOT NULL,
+            slot INTEGER NOT NULL,
+            booked INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (reservation_date, slot)
+        ) WITHOUT ROWID
+        ''',
+    ]),
+    # 用 slot_of 重新計算計數，未補零的時間（如 9:30）也歸入正確的時段
+    (3, "backfill reservation slot counters with slot_of", [
+        rebuild_slot_counters,
+    ]),
+]
+
+# (名稱, SQL, 參數, 應該使用的索引)；SQL 直接引用代碼中執行的語句，查詢改動後檢查會跟著改變
+QUERY_PLAN_CHECKS = [
+    ("get_recent_chat_history", RECENT_CHAT_HISTORY_SQL, ("test_user", "-1 hours"),
+     "idx_chat_history_wa_id_created_at"),
+    ("get_user_history", USER_HISTORY_SQL, ("test_user", 10), "idx_chat_history_wa_id_created_at"),
+    ("get_reservations_by_date", RESERVATIONS_BY_DATE_SQL, ("2025-01-01",),
+     "idx_table_reservations_date_time_status"),
+    ("reservation_slot_occupancy", SLOT_OCCUPANCY_SQL, ("2025-01-01", 38), "PRIMARY KEY"),
+]
+
+
+def get_schema_version(chat_history: ChatHistory) -> int:
+    with chat_history.get_db_connection() as conn:
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+        row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+        return row[0] or 0
+
+
+def run_migrations(chat_history: ChatHistory, analyze: bool = True) -> List[int]:
+    """依次執行尚未套用的遷移，每個版本在一個事務中完成；返回本次套用的版本號"""
+    current = get_schema_version(chat_history)
+    applied = []
+    for version, description, statements in MIGRATIONS:
+        if version <= current:
+            continue
+
+        def apply(conn, version=version, description=description, statements=statements):
+            for statement in statements:
+                if callable(statement):
+                    statement(conn)
+                else:
+                    conn.execute(statement)
+            conn.execute(
+                'INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                (version, description)
+            )
+
+        chat_history.run_transaction(apply)
+        logging.info(f"已套用數據庫遷移 {version}: {description}")
+        applied.append(version)
+
+    if analyze and applied:
+        # 更新統計信息，讓查詢規劃器選用新索引
+        with chat_history.get_db_connection() as conn:
+            conn.execute('ANALYZE')
+    return applied
+
+
+def prepare_database(chat_history: ChatHistory) -> int:
+    """應用啟動時建立表並套用遷移，返回目前的結構版本；失敗時拋出 RuntimeError，不帶著舊結構啟動"""
+    if not chat_history.init_db():
+        raise RuntimeError(f"無法初始化數據庫 {chat_history.db_path}")
+    try:
+        run_migrations(chat_history)
+    except Exception as e:
+        raise RuntimeError(f"數據庫遷移失敗（{chat_history.db_path}）: {str(e)}") from e
+    return get_schema_version(chat_history)
+
+
+def check_query_plans(chat_history: ChatHistory) -> Dict[str, Tuple[bool, List[str]]]:
+    """檢查熱點查詢是否使用了預期的索引，返回 {名稱: (是否通過, 查詢計劃)}"""
+    results = {}
+    with chat_history.get_db_connection() as conn:
+        for name, sql, params, expected_index in QUERY_PLAN_CHECKS:
+            plan = [row[-1] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()]
+            results[name] = (any(expected_index in step for step in plan), plan)
+    return results
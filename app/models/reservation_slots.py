@@ -0,0 +1,49 @@
+import logging
+
+SLOT_MINUTES = 30
+CANCELLED_STATUS = '已取消'
+
+SLOT_OCCUPANCY_SQL = '''
+SELECT booked FROM reservation_slots WHERE reservation_date = ? AND slot = ?
+'''
+
+# 只有在計數未達上限時才會插入或遞增，changes() 為 0 表示時段已滿
+CLAIM_SLOT_SQL = '''
+INSERT INTO reservation_slots (reservation_date, slot, booked)
+VALUES (?, ?, 1)
+ON CONFLICT(reservation_date, slot) DO UPDATE SET booked = booked + 1
+WHERE booked < ?
+'''
+
+RELEASE_SLOT_SQL = '''
+UPDATE reservation_slots SET booked = booked - 1
+WHERE reservation_date = ? AND slot = ? AND booked > 0
+'''
+
+
+def slot_of(time_str: str) -> int:
+    """把 HH:MM（也接受 9:30、19:10:00）轉換為當天的 30 分鐘時段編號（例如 19:10 -> 38）"""
+    hours, minutes = time_str.strip().split(':')[:2]
+    return (int(hours) * 60 + int(minutes)) // SLOT_MINUTES
+
+
+def rebuild_slot_counters(conn) -> int:
+    """用未取消的訂位重新計算 reservation_slots，與 slot_of 使用同一套時段規則；返回時段數量"""
+    counters = {}
+    rows = conn.execute(
+        'SELECT reservation_date, reservation_time FROM table_reservations WHERE status != ?',
+        (CANCELLED_STATUS,)
+    ).fetchall()
+    for date, time_str in rows:
+        try:
+            key = (date, slot_of(time_str))
+        except (AttributeError, ValueError):
+            logging.warning(f"無法解析訂位時間，略過: {date} {time_str}")
+            continue
+        counters[key] = counters.get(key, 0) + 1
+    conn.execute('DELETE FROM reservation_slots')
+    conn.executemany(
+        'INSERT INTO reservation_slots (reservation_date, slot, booked) VALUES (?, ?, ?)',
+        [(date, slot, booked) for (date, slot), booked in counters.items()]
+    )
+    return len(counters)
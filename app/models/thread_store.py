@@ -0,0 +1,194 @@
+import logging
+import os
+import pickle
+import shelve
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from app.models.chat_history import ChatHistory
+
+
+class ThreadStore:
+    def __init__(self, chat_history: ChatHistory = None, ttl_hours: float = None,
+                 cache_size: int = None, legacy_shelve_path: str = "threads_db"):
+        """wa_id → OpenAI thread_id 的對應表，存放在 chat_history 數據庫中
+        Args:
+            chat_history (ChatHistory): 提供數據庫連接
+            ttl_hours (float): 超過多久未使用的 thread 視為過期，默認 30 天
+            cache_size (int): 進程內 LRU 緩存的大小
+            legacy_shelve_path (str): 舊 shelve 文件路徑，首次啟動時會遷移
+        """
+        self.chat_history = chat_history or ChatHistory()
+        self.ttl_seconds = (ttl_hours or float(os.getenv('THREAD_TTL_HOURS', '720'))) * 3600
+        self.cache_size = cache_size or int(os.getenv('THREAD_CACHE_SIZE', '10000'))
+        # 緩存最多保留一小時，之後重新讀取數據庫並刷新 last_used_at
+        self.cache_ttl_seconds = min(self.ttl_seconds, 3600)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        # 每寫入 purge_every 個新 thread 清理一次過期記錄，啟動時也清理一次
+        self.purge_every = int(os.getenv('THREAD_PURGE_EVERY', '100'))
+        self._sets_since_purge = 0
+        self._ensure_table()
+        self._migrate_from_shelve(legacy_shelve_path)
+        self._purge_quietly()
+
+    def _ensure_table(self):
+        with self.chat_history.get_db_connection() as conn:
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS assistant_threads (
+                wa_id TEXT PRIMARY KEY,
+                thread_id TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            ''')
+            conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_assistant_threads_last_used_at
+            ON assistant_threads (last_used_at)
+            ''')
+            conn.commit()
+
+    def _migrate_from_shelve(self, path: str):
+        """一次性把舊的 threads_db shelve 文件匯入數據庫"""
+        marker = f"{path}.migrated"
+        if not path or os.path.exists(marker):
+            return
+        try:
+            rows = self._read_legacy_threads(path)
+        except Exception as e:
+            # 沒有舊文件（或無法讀取）就不需要遷移
+            logging.info(f"未找到可遷移的 thread 記錄: {str(e)}")
+            return
+
+        with self.chat_history.get_db_connection() as conn:
+            conn.executemany('''
+            INSERT OR IGNORE INTO assistant_threads (wa_id, thread_id)
+            VALUES (?, ?)
+            ''', rows)
+            conn.commit()
+        with open(marker, 'w') as f:
+            f.write(f"{len(rows)}\n")
+        logging.info(f"已從 {path} 遷移 {len(rows)} 個 thread 記錄")
+
+    @staticmethod
+    def _read_legacy_threads(path: str) -> list:
+        """讀取舊 shelve 文件；Python 3.13 以 SQLite 格式寫入的 shelve 也能讀取"""
+        try:
+            with shelve.open(path, flag='r') as threads_shelf:
+                return [(str(wa_id), thread_id) for wa_id, thread_id in threads_shelf.items()]
+        except Exception:
+            if not os.path.exists(path):
+                raise
+
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            return [
+                (key.decode('utf-8') if isinstance(key, bytes) else str(key), pickle.loads(value))
+                for key, value in conn.execute('SELECT key, value FROM Dict')
+            ]
+        finally:
+            conn.close()
+
+    def _cache_get(self, wa_id: str) -> Optional[str]:
+        with self._lock:
+            entry = self._cache.get(wa_id)
+            if entry is None:
+                return None
+            thread_id, expires_at = entry
+            if time.monotonic() > expires_at:
+                del self._cache[wa_id]
+                return None
+            self._cache.move_to_end(wa_id)
+            return thread_id
+
+    def _cache_put(self, wa_id: str, thread_id: str):
+        with self._lock:
+            self._cache[wa_id] = (thread_id, time.monotonic() + self.cache_ttl_seconds)
+            self._cache.move_to_end(wa_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def get(self, wa_id: str) -> Optional[str]:
+        """獲取用戶的 thread_id，過期或不存在時返回 None"""
+        thread_id = self._cache_get(wa_id)
+        if thread_id is not None:
+            return thread_id
+
+        try:
+            with self.chat_history.get_db_connection() as conn:
+                row = conn.execute('''
+                SELECT thread_id FROM assistant_threads
+                WHERE wa_id = ?
+                AND last_used_at >= datetime('now', ?)
+                ''', (wa_id, f'-{int(self.ttl_seconds)} seconds')).fetchone()
+                if row:
+                    conn.execute('''
+                    UPDATE assistant_threads SET last_used_at = CURRENT_TIMESTAMP
+                    WHERE wa_id = ?
+                    ''', (wa_id,))
+                    conn.commit()
+        except Exception as e:
+            logging.error(f"獲取用戶 {wa_id} 的 thread 時出錯: {str(e)}")
+            return None
+
+        if not row:
+            return None
+        self._cache_put(wa_id, row[0])
+        return row[0]
+
+    def set(self, wa_id: str, thread_id: str):
+        """保存用戶的 thread_id"""
+        with self.chat_history.get_db_connection() as conn:
+            conn.execute('''
+            INSERT INTO assistant_threads (wa_id, thread_id)
+            VALUES (?, ?)
+            ON CONFLICT(wa_id) DO UPDATE SET
+                thread_id = excluded.thread_id,
+                created_at = CURRENT_TIMESTAMP,
+                last_used_at = CURRENT_TIMESTAMP
+            ''', (wa_id, thread_id))
+            conn.commit()
+        self._cache_put(wa_id, thread_id)
+
+        with self._lock:
+            self._sets_since_purge += 1
+            should_purge = self._sets_since_purge >= self.purge_every
+            if should_purge:
+                self._sets_since_purge = 0
+        if should_purge:
+            self._purge_quietly()
+
+    def purge_expired(self) -> int:
+        """刪除過期的 thread 記錄，返回刪除數量"""
+        with self.chat_history.get_db_connection() as conn:
+            cursor = conn.execute('''
+            DELETE FROM assistant_threads
+            WHERE last_used_at < datetime('now', ?)
+            ''', (f'-{int(self.ttl_seconds)} seconds',))
+            conn.commit()
+            return cursor.rowcount
+
+    def _purge_quietly(self):
+        try:
+            purged = self.purge_expired()
+            if purged:
+                logging.info(f"已清理 {purged} 個過期的 thread 記錄")
+        except Exception as e:
+            logging.error(f"清理過期 thread 記錄時出錯: {str(e)}")
+
+
+_thread_store: Optional[ThreadStore] = None
+_thread_store_lock = threading.Lock()
+
+
+def get_thread_store() -> ThreadStore:
+    """返回進程內共用的 ThreadStore"""
+    global _thread_store
+    if _thread_store is None:
+        with _thread_store_lock:
+            if _thread_store is None:
+                _thread_store = ThreadStore()
+    return _thread_store
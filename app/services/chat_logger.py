@@ -0,0 +1,268 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from app.models.chat_history import ChatHistory
+
+DURABILITY_LEVELS = ("none", "commit", "fsync")
+
+_STOP = object()
+
+
+class _FlushMarker:
+    def __init__(self):
+        self.future = Future()
+
+
+class WriteBehindChatLogger:
+    def __init__(self, chat_history: ChatHistory = None, max_queue_size: int = None,
+                 batch_size: int = None, flush_interval: float = None, durability: str = None):
+        """異步寫入對話記錄：回覆不必等待數據庫，單一寫入線程分批提交
+        Args:
+            chat_history (ChatHistory): 提供數據庫連接
+            max_queue_size (int): 隊列上限，隊列滿時改為同步寫入
+            batch_size (int): 每個事務最多寫入的記錄數量
+            flush_interval (float): 湊批次時最多等待的秒數
+            durability (str): none（不等待）、commit（等待所在批次提交）、
+                              fsync（等待提交且寫入連接使用 synchronous=FULL）
+        """
+        self.chat_history = chat_history or ChatHistory()
+        self.max_queue_size = max_queue_size or int(os.getenv('CHAT_LOG_QUEUE_SIZE', '10000'))
+        self.batch_size = batch_size or int(os.getenv('CHAT_LOG_BATCH_SIZE', '200'))
+        self.flush_interval = flush_interval if flush_interval is not None else float(
+            os.getenv('CHAT_LOG_FLUSH_INTERVAL', '0.05')
+        )
+        self.durability = (durability or os.getenv('CHAT_LOG_DURABILITY', 'none')).lower()
+        if self.durability not in DURABILITY_LEVELS:
+            raise ValueError(f"未知的 CHAT_LOG_DURABILITY: {self.durability}")
+
+        self._queue: queue.Queue = queue.Queue(maxsize=self.max_queue_size)
+        self._category_ids: Dict[str, Optional[int]] = {}
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "records": 0,
+            "batches": 0,
+            "max_batch": 0,
+            "flush_seconds": 0.0,
+            "max_flush_seconds": 0.0,
+            "failed_records": 0,
+            "overflow_sync_writes": 0,
+            "fallback_sync_writes": 0,
+            "writer_errors": 0,
+        }
+        self._thread = threading.Thread(target=self._run, name="chat-log-writer", daemon=True)
+        self._thread.start()
+
+    def log(self, wa_id: str, user_name: str, message: str, response: str, category: str = None,
+            context: str = None, metadata: dict = None) -> bool:
+        """加入一條對話記錄；durability 為 commit/fsync 時等待寫入完成"""
+        if not self._thread.is_alive():
+            # 寫入線程已停止（例如已關閉），改為同步寫入，不讓記錄留在無人處理的隊列裡
+            return self._write_sync(
+                "fallback_sync_writes", wa_id, user_name, message, response, category, context, metadata
+            )
+        record = {
+            "wa_id": wa_id,
+            "user_name": user_name,
+            "message": message,
+            "response": response,
+            "category": category,
+            "context": context,
+            "metadata": json.dumps(metadata) if metadata else None,
+            # 與 CURRENT_TIMESTAMP 相同的 UTC 格式，記錄的是收到的時間而不是寫入時間
+            "created_at": datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+            "future": Future() if self.durability != "none" else None,
+        }
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            # 隊列滿時退回同步寫入，形成背壓而不是丟失記錄
+            return self._write_sync(
+                "overflow_sync_writes", wa_id, user_name, message, response, category, context, metadata
+            )
+
+        if record["future"] is None:
+            return True
+        while True:
+            try:
+                return record["future"].result(timeout=1.0)
+            except FutureTimeoutError:
+                if not self._thread.is_alive():
+                    # 寫入線程在處理這條記錄之前停止了，避免永遠等待
+                    return self._write_sync(
+                        "fallback_sync_writes", wa_id, user_name, message, response, category, context, metadata
+                    )
+
+    def _write_sync(self, reason: str, wa_id, user_name, message, response, category, context, metadata) -> bool:
+        with self._stats_lock:
+            self._stats[reason] += 1
+        return self.chat_history.add_chat_record(
+            wa_id, user_name, message, response, category, context, metadata
+        )
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """等待目前已加入隊列的記錄全部提交（讀取歷史記錄前調用）"""
+        if not self._thread.is_alive():
+            return False
+        marker = _FlushMarker()
+        try:
+            self._queue.put(marker, timeout=timeout)
+            return marker.future.result(timeout=timeout)
+        except Exception:
+            logging.warning("等待對話記錄寫入超時")
+            return False
+
+    def _category_id(self, conn, name: Optional[str]) -> Optional[int]:
+        if not name:
+            return None
+        if name not in self._category_ids:
+            row = conn.execute('SELECT id FROM message_categories WHERE name = ?', (name,)).fetchone()
+            self._category_ids[name] = row[0] if row else None
+        return self._category_ids[name]
+
+    def _run(self):
+        if self.durability == "fsync":
+            try:
+                with self.chat_history.get_db_connection() as conn:
+                    conn.execute('PRAGMA synchronous=FULL')
+            except Exception as e:
+                logging.error(f"無法設定 synchronous=FULL，繼續使用默認同步模式: {str(e)}")
+
+        stopping = False
+        while not stopping:
+            batch, markers = [], []
+            try:
+                stopping = self._collect(batch, markers)
+                ok = self._flush(batch) if batch else True
+            except Exception as e:
+                # 單個批次出錯不能讓寫入線程退出，否則之後的記錄不會再被寫入
+                logging.error(f"對話記錄寫入線程出錯: {str(e)}")
+                with self._stats_lock:
+                    self._stats["writer_errors"] += 1
+                ok = False
+                for record in batch:
+                    if record["future"] is not None and not record["future"].done():
+                        record["future"].set_result(False)
+            for marker in markers:
+                marker.future.set_result(ok)
+
+    def _collect(self, batch: List[dict], markers: List[_FlushMarker]) -> bool:
+        """從隊列取出一個批次，收到停止信號時返回 True"""
+        item = self._queue.get()
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            if item is _STOP:
+                return True
+            elif isinstance(item, _FlushMarker):
+                markers.append(item)
+            else:
+                batch.append(item)
+            if len(batch) >= self.batch_size:
+                return False
+            try:
+                item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                return False
+
+    def _flush(self, batch: List[dict]) -> bool:
+        start = time.monotonic()
+
+        def write(conn):
+            # 同一批次中每個用戶只更新一次
+            users = {}
+            for record in batch:
+                name, count = users.get(record["wa_id"], ("", 0))
+                users[record["wa_id"]] = (record["user_name"] or name, count + 1)
+            conn.executemany('''
+            INSERT INTO users (wa_id, name, last_seen, conversation_count)
+            VALUES (?, ?, CURRENT_TIMESTAMP, ?)
+            ON CONFLICT(wa_id) DO UPDATE SET
+                last_seen = CURRENT_TIMESTAMP,
+                conversation_count = users.conversation_count + excluded.conversation_count,
+                name = COALESCE(NULLIF(excluded.name, ''), users.name)
+            ''', [(wa_id, name, count) for wa_id, (name, count) in users.items()])
+
+            conn.executemany('''
+            INSERT INTO chat_history
+            (wa_id, user_name, message, response, category_id, context, metadata, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [(
+                record["wa_id"],
+                record["user_name"],
+                record["message"],
+                record["response"],
+                self._category_id(conn, record["category"]),
+                record["context"],
+                record["metadata"],
+                record["created_at"],
+            ) for record in batch])
+
+        try:
+            self.chat_history.run_transaction(write)
+            ok = True
+        except Exception as e:
+            logging.error(f"批量寫入 {len(batch)} 條對話記錄時出錯: {str(e)}")
+            ok = False
+
+        elapsed = time.monotonic() - start
+        with self._stats_lock:
+            if ok:
+                self._stats["records"] += len(batch)
+                self._stats["batches"] += 1
+                self._stats["max_batch"] = max(self._stats["max_batch"], len(batch))
+                self._stats["flush_seconds"] += elapsed
+                self._stats["max_flush_seconds"] = max(self._stats["max_flush_seconds"], elapsed)
+            else:
+                self._stats["failed_records"] += len(batch)
+        for record in batch:
+            if record["future"] is not None:
+                record["future"].set_result(ok)
+        return ok
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            batches = self._stats["batches"]
+            return {
+                "durability": self.durability,
+                "queue_depth": self._queue.qsize(),
+                "records": self._stats["records"],
+                "batches": batches,
+                "avg_batch_size": round(self._stats["records"] / batches, 2) if batches else 0.0,
+                "max_batch_size": self._stats["max_batch"],
+                "avg_flush_ms": round(self._stats["flush_seconds"] / batches * 1000, 2) if batches else 0.0,
+                "max_flush_ms": round(self._stats["max_flush_seconds"] * 1000, 2),
+                "failed_records": self._stats["failed_records"],
+                "overflow_sync_writes": self._stats["overflow_sync_writes"],
+                "fallback_sync_writes": self._stats["fallback_sync_writes"],
+                "writer_errors": self._stats["writer_errors"],
+            }
+
+    def shutdown(self, timeout: float = 10.0):
+        """寫完隊列中剩餘的記錄後停止寫入線程"""
+        if not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        logging.info(f"對話記錄寫入線程已停止: {self.stats()}")
+
+
+_chat_logger: Optional[WriteBehindChatLogger] = None
+_chat_logger_lock = threading.Lock()
+
+
+def get_chat_logger() -> Optional[WriteBehindChatLogger]:
+    """返回進程內共用的異步對話記錄器；CHAT_LOG_WRITE_BEHIND=false 時返回 None"""
+    global _chat_logger
+    if os.getenv('CHAT_LOG_WRITE_BEHIND', 'true').lower() != 'true':
+        return None
+    if _chat_logger is None:
+        with _chat_logger_lock:
+            if _chat_logger is None:
+                _chat_logger = WriteBehindChatLogger()
+    return _chat_logger
@@ -0,0 +1,158 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from app.models.chat_history import ChatHistory
+
+try:
+    import opencc
+    _t2s = opencc.OpenCC('t2s')
+except ImportError:
+    _t2s = None
+
+# 沒有安裝 opencc 時使用的常用繁簡對照（只需覆蓋客服常見字）
+_TRADITIONAL = "幾點開門時間營業電話廳個們這會預約號裡邊來後還沒務價錢單飯雞魚湯麵飲賣買請問謝對關臺檯枱訂週換確認員優說樣車場嗎麼環境餐單燒鵝豬牛蝦蟹飯堂齊類選擇壽慶節禮"
+_SIMPLIFIED = "几点开门时间营业电话厅个们这会预约号里边来后还没务价钱单饭鸡鱼汤面饮卖买请问谢对关台台台订周换确认员优说样车场吗么环境餐单烧鹅猪牛虾蟹饭堂齐类选择寿庆节礼"
+_FALLBACK_T2S = str.maketrans(_TRADITIONAL, _SIMPLIFIED)
+
+
+# 中日文字之間的空白不分詞，「幾點 開門」和「幾點開門」應該是同一個鍵
+_CJK_CHARS = r"\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff"
+_CJK_SPACE = re.compile(rf"(?<=[{_CJK_CHARS}]) (?=[{_CJK_CHARS}])")
+
+
+def normalize_text(text: str) -> str:
+    """標準化訊息文字：全形轉半形、統一繁簡、去除標點和多餘空白，中日文字之間不留空白"""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    text = _t2s.convert(text) if _t2s else text.translate(_FALLBACK_T2S)
+    text = "".join(" " if unicodedata.category(ch).startswith("P") else ch for ch in text)
+    text = re.sub(r"\s+", " ", text).strip()
+    return _CJK_SPACE.sub("", text)
+
+
+class ClassificationCache:
+    def __init__(self, version: str, max_entries: int = None, ttl_seconds: int = None,
+                 chat_history: ChatHistory = None):
+        """分類結果緩存（LRU + TTL），可選擇持久化到 SQLite
+        Args:
+            version (str): 分類器版本指紋，prompt 或模型改變時緩存自動失效
+            max_entries (int): 內存中最多保留的結果數量
+            ttl_seconds (int): 結果有效時間
+            chat_history (ChatHistory): 提供數據庫連接；None 時只使用內存
+        """
+        self.version = version
+        self.max_entries = max_entries or int(os.getenv('CLASSIFICATION_CACHE_SIZE', '5000'))
+        self.ttl_seconds = ttl_seconds or int(os.getenv('CLASSIFICATION_CACHE_TTL', '604800'))
+        self.chat_history = chat_history
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if self.chat_history is not None:
+            self._ensure_table()
+
+    @staticmethod
+    def fingerprint(*parts: str) -> str:
+        """由 prompt、模型名稱等計算版本指紋"""
+        return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()[:16]
+
+    def _ensure_table(self):
+        try:
+            with self.chat_history.get_db_connection() as conn:
+                conn.execute('''
+                CREATE TABLE IF NOT EXISTS classification_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    version TEXT NOT NULL,
+                    result TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+                ''')
+                # 舊版本 prompt/模型的結果不再有效
+                conn.execute('DELETE FROM classification_cache WHERE version != ?', (self.version,))
+                conn.commit()
+        except Exception as e:
+            logging.error(f"創建分類緩存表時出錯: {str(e)}")
+            self.chat_history = None
+
+    def _memory_put(self, key: str, result: Dict[str, Any], expires_at: float):
+        with self._lock:
+            self._entries[key] = (result, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, text: str) -> Optional[Dict[str, Any]]:
+        """查詢緩存，未命中時返回 None"""
+        key = normalize_text(text)
+        if not key:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                result, expires_at = entry
+                if time.monotonic() <= expires_at:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return dict(result, source="cache")
+                del self._entries[key]
+
+        result = self._db_get(key)
+        with self._lock:
+            if result is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        self._memory_put(key, result, time.monotonic() + self.ttl_seconds)
+        return dict(result, source="cache")
+
+    def _db_get(self, key: str) -> Optional[Dict[str, Any]]:
+        if self.chat_history is None:
+            return None
+        try:
+            with self.chat_history.get_db_connection() as conn:
+                row = conn.execute('''
+                SELECT result FROM classification_cache
+                WHERE cache_key = ? AND version = ?
+                AND created_at >= datetime('now', ?)
+                ''', (key, self.version, f'-{self.ttl_seconds} seconds')).fetchone()
+            return json.loads(row[0]) if row else None
+        except Exception as e:
+            logging.error(f"讀取分類緩存時出錯: {str(e)}")
+            return None
+
+    def put(self, text: str, result: Dict[str, Any]):
+        """保存分類結果"""
+        key = normalize_text(text)
+        if not key:
+            return
+        self._memory_put(key, result, time.monotonic() + self.ttl_seconds)
+        if self.chat_history is None:
+            return
+        try:
+            with self.chat_history.get_db_connection() as conn:
+                conn.execute('''
+                INSERT OR REPLACE INTO classification_cache (cache_key, version, result)
+                VALUES (?, ?, ?)
+                ''', (key, self.version, json.dumps(result, ensure_ascii=False)))
+                conn.commit()
+        except Exception as e:
+            logging.error(f"保存分類緩存時出錯: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "version": self.version,
+            }
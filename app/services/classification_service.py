@@ -1,35 +1,127 @@
-from openai import OpenAI
 import json
 import os
+import threading
+import time
 from typing import Dict, Any
 import logging
+from rag.registry import get_registry
+from app.models.chat_history import ChatHistory
+from app.services.intent_classifier import get_intent_classifier
+from app.services.classification_cache import ClassificationCache
 
-class MessageClassifier:
-    def __init__(self):
-        self.client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-        
-    def classify_message(self, message: str) -> Dict[str, Any]:
-        """使用 OpenAI 對訊息進行分類"""
-        try:
-            response = self.client.chat.completions.create(
-                model="gpt-4-1106-preview",
-                response_format={ "type": "json_object" },
-                messages=[
-                    {
-                        "role": "system",
-                        "content": """你是一個專門分類餐廳客服對話的AI。
+CLASSIFIER_MODEL = "gpt-4-1106-preview"
+CLASSIFIER_PROMPT = """你是一個專門分類餐廳客服對話的AI。
                         請將用戶訊息分類為以下類別之一：
                         - restaurant_info: 餐廳資料詢問（如：營業時間、地址、環境等）
                         - food_info: 食物資料詢問（如：菜單、食材、價格等）
                         - reservation: 訂位相關（如：訂位、更改訂位、取消訂位等）
                         - service: 其他服務（如：外賣、包場、特別要求等）
                         - others: 其他查詢
-                        
+
                         請返回 JSON 格式，包含：
                         - category: 分類名稱
                         - confidence: 信心指數（0-1）
                         - reason: 分類原因
                         """
+
+# 所有 MessageClassifier 實例共用的統計數據
+_stats_lock = threading.Lock()
+_stats = {
+    "local_hits": 0,
+    "llm_calls": 0,
+    "llm_seconds": 0.0,
+    "local_seconds": 0.0,
+}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_classification_cache() -> ClassificationCache:
+    """返回共用的分類緩存；版本指紋由 prompt 和模型計算，修改任一項緩存即失效"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                persist = os.getenv('CLASSIFICATION_CACHE_PERSIST', 'false').lower() == 'true'
+                _cache = ClassificationCache(
+                    version=ClassificationCache.fingerprint(CLASSIFIER_MODEL, CLASSIFIER_PROMPT),
+                    chat_history=ChatHistory() if persist else None
+                )
+    return _cache
+
+
+def get_classification_stats() -> Dict[str, Any]:
+    """本地分類避免 LLM 調用的比例和節省的時間"""
+    with _stats_lock:
+        total = _stats["local_hits"] + _stats["llm_calls"]
+        avg_llm = _stats["llm_seconds"] / _stats["llm_calls"] if _stats["llm_calls"] else 0.0
+        avg_local = _stats["local_seconds"] / _stats["local_hits"] if _stats["local_hits"] else 0.0
+        return {
+            "total": total,
+            "local_hits": _stats["local_hits"],
+            "llm_calls": _stats["llm_calls"],
+            "llm_avoidance_rate": round(_stats["local_hits"] / total, 4) if total else 0.0,
+            "avg_llm_ms": round(avg_llm * 1000, 1),
+            "avg_local_ms": round(avg_local * 1000, 1),
+            "estimated_seconds_saved": round(_stats["local_hits"] * max(avg_llm - avg_local, 0), 2),
+            "cache": get_classification_cache().stats(),
+        }
+
+
+def _record(kind: str, seconds: float):
+    with _stats_lock:
+        if kind == "local":
+            _stats["local_hits"] += 1
+            _stats["local_seconds"] += seconds
+        else:
+            _stats["llm_calls"] += 1
+            _stats["llm_seconds"] += seconds
+
+
+class MessageClassifier:
+    def __init__(self):
+        self.client = get_registry().get_openai_client()
+        self.local_classifier = get_intent_classifier()
+        self.cache = get_classification_cache()
+
+    def classify_message(self, message: str) -> Dict[str, Any]:
+        """依次查詢緩存、本地 embedding 分類，信心不足時才使用 OpenAI"""
+        cached = self.cache.get(message)
+        if cached is not None:
+            logging.info(f"訊息分類結果（緩存）: {cached}")
+            return cached
+
+        if self.local_classifier is not None:
+            try:
+                start = time.monotonic()
+                result = self.local_classifier.predict(message)
+                if result["confidence"] >= self.local_classifier.threshold:
+                    _record("local", time.monotonic() - start)
+                    logging.info(f"訊息分類結果（本地）: {result}")
+                    return result
+            except Exception as e:
+                logging.error(f"本地分類出錯，改用 LLM: {str(e)}")
+
+        start = time.monotonic()
+        result = self._classify_with_llm(message)
+        _record("llm", time.monotonic() - start)
+        # 分類失敗的結果不緩存
+        if result.get("confidence"):
+            self.cache.put(message, result)
+        return result
+
+    def _classify_with_llm(self, message: str) -> Dict[str, Any]:
+        """使用 OpenAI 對訊息進行分類"""
+        try:
+            response = self.client.chat.completions.create(
+                model=CLASSIFIER_MODEL,
+                response_format={ "type": "json_object" },
+                messages=[
+                    {
+                        "role": "system",
+                        "content": CLASSIFIER_PROMPT
                     },
                     {
                         "role": "user",
@@ -37,16 +129,17 @@ class MessageClassifier:
                     }
                 ]
             )
-            
+
             # 解析回應
             result = json.loads(response.choices[0].message.content)
+            result["source"] = "llm"
             logging.info(f"訊息分類結果: {result}")
             return result
-            
+
         except Exception as e:
             logging.error(f"訊息分類出錯: {str(e)}")
             return {
                 "category": "others",
                 "confidence": 0,
                 "reason": "分類過程出錯"
-            } 
\ No newline at end of file
+            }
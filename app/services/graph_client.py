@@ -0,0 +1,129 @@
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 標頭，支援秒數或 HTTP 日期格式"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def compute_backoff(attempt: int, base: float, cap: float, retry_after: float = None) -> float:
+    """計算重試等待時間：有 Retry-After 就照做，否則使用帶隨機抖動的指數退避"""
+    if retry_after is not None:
+        return min(retry_after, cap)
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class GraphAPIClient:
+    def __init__(self, access_token: str, version: str, phone_number_id: str,
+                 base_url: str = "https://graph.facebook.com", pool_size: int = 10,
+                 max_retries: int = 3, backoff_base: float = 0.5, backoff_max: float = 8.0,
+                 timeout: float = 10):
+        """長期保持連接的 Graph API 客戶端，帶連接池和自動重試
+        Args:
+            access_token (str): WhatsApp Cloud API 存取權杖
+            version (str): Graph API 版本，例如 v18.0
+            phone_number_id (str): 發送訊息使用的電話號碼 ID
+            base_url (str): Graph API 地址，測試時可指向本地模擬服務
+            pool_size (int): 連接池大小
+            max_retries (int): 遇到 429/5xx 或網絡錯誤時的最大重試次數
+            backoff_base (float): 指數退避的基礎秒數
+            backoff_max (float): 單次等待的上限秒數
+            timeout (float): 每次請求的超時秒數
+        """
+        self.url = f"{base_url.rstrip('/')}/{version}/{phone_number_id}/messages"
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Content-type": "application/json",
+            "Authorization": f"Bearer {access_token}",
+        })
+
+        self._lock = threading.Lock()
+        self.requests_sent = 0
+        self.retries = 0
+        self.failures = 0
+        self.total_latency = 0.0
+
+    def send(self, data) -> requests.Response:
+        """發送訊息，可重試的錯誤會自動重試；最終失敗時拋出 requests.RequestException"""
+        attempt = 0
+        while True:
+            start = time.monotonic()
+            try:
+                response = self.session.post(self.url, data=data, timeout=self.timeout)
+                error = None
+            except (requests.ConnectionError, requests.Timeout) as e:
+                response, error = None, e
+            latency = time.monotonic() - start
+            self._record(latency)
+
+            status = response.status_code if response is not None else type(error).__name__
+            logging.info(f"Graph API 第 {attempt + 1} 次請求: {status}，耗時 {latency * 1000:.0f}ms")
+
+            retryable = error is not None or response.status_code in RETRYABLE_STATUS_CODES
+            if not retryable or attempt >= self.max_retries:
+                if error is not None:
+                    self._record_failure()
+                    raise error
+                try:
+                    response.raise_for_status()
+                except requests.HTTPError:
+                    self._record_failure()
+                    raise
+                return response
+
+            retry_after = parse_retry_after(response.headers.get("Retry-After")) if response is not None else None
+            delay = compute_backoff(attempt, self.backoff_base, self.backoff_max, retry_after)
+            logging.warning(f"Graph API 請求失敗（{status}），{delay:.2f} 秒後重試")
+            with self._lock:
+                self.retries += 1
+            time.sleep(delay)
+            attempt += 1
+
+    def _record(self, latency: float):
+        with self._lock:
+            self.requests_sent += 1
+            self.total_latency += latency
+
+    def _record_failure(self):
+        with self._lock:
+            self.failures += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests_sent,
+                "retries": self.retries,
+                "failures": self.failures,
+                "avg_latency_ms": round(self.total_latency / self.requests_sent * 1000, 1)
+                if self.requests_sent else 0.0,
+            }
+
+    def close(self):
+        self.session.close()
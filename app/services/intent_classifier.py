@@ -0,0 +1,157 @@
+import logging
+import os
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from rag.registry import get_registry
+
+CATEGORIES = ["restaurant_info", "food_info", "reservation", "service", "others"]
+
+# 冷啟動用的示例句子，數據庫有足夠標註記錄後會與之合併訓練
+SEED_EXAMPLES = {
+    "restaurant_info": [
+        "幾點開門", "營業時間係幾點", "你哋喺邊度", "地址係咩", "有冇停車場",
+        "電話幾多號", "餐廳環境點樣", "星期日有冇開", "What are your opening hours?",
+        "Where is the restaurant located?",
+    ],
+    "food_info": [
+        "有咩好食推介", "有冇素食", "個餐幾錢", "菜單有咩", "有冇海鮮",
+        "呢個菜用咩材料", "有冇兒童餐", "甜品有咩揀", "What's on the menu?",
+        "Do you have vegetarian dishes?",
+    ],
+    "reservation": [
+        "我想訂枱", "訂位", "聽晚七點兩位", "想改訂位時間", "取消訂位",
+        "星期六晚有冇位", "訂枱四個人", "我想book位", "I want to book a table",
+        "Can I reserve a table for two tonight?",
+    ],
+    "service": [
+        "有冇外賣", "可唔可以包場", "有冇送餐服務", "可唔可以帶蛋糕入去", "生日有冇優惠",
+        "可唔可以開發票", "有冇BB櫈", "可以帶狗入去嗎", "Do you do delivery?",
+        "Can we book the whole restaurant for a party?",
+    ],
+    "others": [
+        "你好", "多謝", "你係邊個", "hello", "thank you",
+        "今日天氣點", "bye", "好的", "ok", "Who are you?",
+    ],
+}
+
+
+def default_model_path() -> str:
+    return os.getenv('INTENT_MODEL_PATH', 'db/intent_centroids.npz')
+
+
+class EmbeddingIntentClassifier:
+    def __init__(self, model_path: str = None, threshold: float = None, temperature: float = 0.05):
+        """用已載入的 MiniLM 模型在本地分類訊息（最近類別中心）
+        Args:
+            model_path (str): 類別中心文件路徑
+            threshold (float): 信心指數低於此值時交給 LLM 分類
+            temperature (float): 把餘弦相似度轉成信心指數時的 softmax 溫度
+        """
+        self.model_path = model_path or default_model_path()
+        self.threshold = threshold if threshold is not None else float(
+            os.getenv('INTENT_CONFIDENCE_THRESHOLD', '0.75')
+        )
+        self.temperature = temperature
+        self.labels: List[str] = []
+        self.centroids: Optional[np.ndarray] = None
+        self.load()
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        return get_registry().embed(texts, normalize=True)
+
+    def load(self):
+        """載入訓練好的類別中心，沒有文件時用示例句子建立"""
+        if os.path.exists(self.model_path):
+            data = np.load(self.model_path, allow_pickle=False)
+            self.labels = [str(label) for label in data["labels"]]
+            self.centroids = data["centroids"].astype(np.float32)
+            logging.info(f"已載入本地分類模型: {self.model_path}")
+        else:
+            self.train(SEED_EXAMPLES)
+
+    def train(self, examples: Dict[str, List[str]]) -> Dict[str, int]:
+        """按類別計算 embedding 中心，返回每個類別使用的樣本數"""
+        labels, centroids, counts = [], [], {}
+        for label, texts in examples.items():
+            texts = [t for t in texts if t and t.strip()]
+            if not texts:
+                continue
+            vectors = self._embed(texts)
+            centroid = vectors.mean(axis=0)
+            centroids.append(centroid / (np.linalg.norm(centroid) or 1.0))
+            labels.append(label)
+            counts[label] = len(texts)
+        self.labels = labels
+        self.centroids = np.vstack(centroids).astype(np.float32)
+        return counts
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.model_path) or '.', exist_ok=True)
+        np.savez(self.model_path, labels=np.array(self.labels), centroids=self.centroids)
+        logging.info(f"本地分類模型已保存: {self.model_path}")
+
+    def predict(self, message: str) -> Dict[str, object]:
+        """返回與 MessageClassifier 相同格式的分類結果"""
+        vector = self._embed([message])[0]
+        scores = self.centroids @ vector
+        weights = np.exp((scores - scores.max()) / self.temperature)
+        probabilities = weights / weights.sum()
+        best = int(np.argmax(probabilities))
+        return {
+            "category": self.labels[best],
+            "confidence": round(float(probabilities[best]), 4),
+            "reason": f"本地 embedding 分類（相似度 {float(scores[best]):.3f}）",
+            "source": "local",
+        }
+
+    @staticmethod
+    def load_examples_from_db(chat_history, limit_per_category: int = 500) -> Dict[str, List[str]]:
+        """從 chat_history 讀取由 LLM 標註過的訊息作為訓練數據"""
+        examples = {label: [] for label in CATEGORIES}
+        with chat_history.get_db_connection() as conn:
+            rows = conn.execute('''
+            SELECT mc.name, ch.message
+            FROM chat_history ch
+            JOIN message_categories mc ON ch.category_id = mc.id
+            WHERE ch.message IS NOT NULL
+            AND COALESCE(json_extract(ch.metadata, '$.classification.source'), 'llm') = 'llm'
+            AND COALESCE(json_extract(ch.metadata, '$.classification.confidence'), 1) > 0
+            ORDER BY ch.created_at DESC
+            ''').fetchall()
+        for category, message in rows:
+            bucket = examples.setdefault(category, [])
+            if len(bucket) < limit_per_category:
+                bucket.append(message)
+        return examples
+
+
+_intent_classifier: Optional[EmbeddingIntentClassifier] = None
+_intent_classifier_unavailable = False
+_intent_classifier_lock = threading.Lock()
+
+
+def get_intent_classifier() -> Optional[EmbeddingIntentClassifier]:
+    """返回共用的本地分類器；停用、沒有訓練好的模型或載入失敗時返回 None
+    示例句子的類別中心沒有在粵語訊息上驗證過，只有 scripts/train_intent_classifier.py
+    訓練出的模型文件存在時才啟用。載入失敗的結果也會記住，不會每條訊息都重試。
+    """
+    global _intent_classifier, _intent_classifier_unavailable
+    if os.getenv('LOCAL_INTENT_CLASSIFIER', 'true').lower() != 'true':
+        return None
+    if _intent_classifier is None and not _intent_classifier_unavailable:
+        with _intent_classifier_lock:
+            if _intent_classifier is None and not _intent_classifier_unavailable:
+                model_path = default_model_path()
+                if not os.path.exists(model_path):
+                    logging.info(f"沒有訓練好的本地分類模型 {model_path}，全部訊息交給 LLM 分類")
+                    _intent_classifier_unavailable = True
+                    return None
+                try:
+                    _intent_classifier = EmbeddingIntentClassifier(model_path=model_path)
+                except Exception as e:
+                    logging.error(f"載入本地分類器時出錯，本進程不再重試: {str(e)}")
+                    _intent_classifier_unavailable = True
+    return _intent_classifier
@@ -0,0 +1,139 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from app.models.chat_history import ChatHistory
+
+
+class MessageDeduplicator:
+    def __init__(self, chat_history: ChatHistory = None, ttl_seconds: int = None,
+                 max_entries: int = None):
+        """按 WhatsApp 訊息 ID 去重，避免 Meta 重送的訊息被重複處理
+        Args:
+            chat_history (ChatHistory): 提供數據庫連接，記錄會跨重啟和多進程共用
+            ttl_seconds (int): 訊息 ID 保留時間，默認 24 小時
+            max_entries (int): 內存緩存最多保留的訊息 ID 數量
+        """
+        self.chat_history = chat_history or ChatHistory()
+        self.ttl_seconds = ttl_seconds or int(os.getenv('DEDUPE_TTL_SECONDS', '86400'))
+        self.max_entries = max_entries or int(os.getenv('DEDUPE_MAX_ENTRIES', '10000'))
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+        self._claims_since_purge = 0
+        self.duplicates = 0
+        self._ensure_table()
+
+    def _ensure_table(self):
+        try:
+            with self.chat_history.get_db_connection() as conn:
+                conn.execute('''
+                CREATE TABLE IF NOT EXISTS processed_messages (
+                    message_id TEXT PRIMARY KEY,
+                    wa_id TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+                ''')
+                conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_processed_messages_created_at
+                ON processed_messages (created_at)
+                ''')
+                conn.commit()
+        except Exception as e:
+            logging.error(f"創建訊息去重表時出錯: {str(e)}")
+
+    def _seen_recently(self, message_id: str) -> bool:
+        with self._lock:
+            seen_at = self._seen.get(message_id)
+            if seen_at is None:
+                return False
+            if time.monotonic() - seen_at > self.ttl_seconds:
+                del self._seen[message_id]
+                return False
+            self._seen.move_to_end(message_id)
+            return True
+
+    def _remember(self, message_id: str):
+        with self._lock:
+            self._seen[message_id] = time.monotonic()
+            self._seen.move_to_end(message_id)
+            while len(self._seen) > self.max_entries:
+                self._seen.popitem(last=False)
+
+    def claim(self, message_id: Optional[str], wa_id: str = None) -> bool:
+        """嘗試認領訊息，第一次見到返回 True，重送的訊息返回 False"""
+        if not message_id:
+            return True
+
+        if self._seen_recently(message_id):
+            with self._lock:
+                self.duplicates += 1
+            return False
+
+        try:
+            with self.chat_history.get_db_connection() as conn:
+                cursor = conn.execute('''
+                INSERT OR IGNORE INTO processed_messages (message_id, wa_id)
+                VALUES (?, ?)
+                ''', (message_id, wa_id))
+                conn.commit()
+                claimed = cursor.rowcount == 1
+        except Exception as e:
+            # 數據庫不可用時只依賴內存緩存，寧可重複處理也不丟訊息
+            logging.error(f"記錄已處理訊息時出錯: {str(e)}")
+            claimed = True
+
+        self._remember(message_id)
+        with self._lock:
+            if not claimed:
+                self.duplicates += 1
+                return False
+            self._claims_since_purge += 1
+            should_purge = self._claims_since_purge >= 1000
+            if should_purge:
+                self._claims_since_purge = 0
+
+        if should_purge:
+            self.purge_expired()
+        return True
+
+    def release(self, message_id: Optional[str]):
+        """處理失敗時釋放認領，讓 Meta 重送時可以再處理"""
+        if not message_id:
+            return
+        with self._lock:
+            self._seen.pop(message_id, None)
+        try:
+            with self.chat_history.get_db_connection() as conn:
+                conn.execute('DELETE FROM processed_messages WHERE message_id = ?', (message_id,))
+                conn.commit()
+        except Exception as e:
+            logging.error(f"釋放訊息 {message_id} 時出錯: {str(e)}")
+
+    def purge_expired(self):
+        """刪除超過保留時間的訊息 ID"""
+        try:
+            with self.chat_history.get_db_connection() as conn:
+                conn.execute('''
+                DELETE FROM processed_messages
+                WHERE created_at < datetime('now', ?)
+                ''', (f'-{self.ttl_seconds} seconds',))
+                conn.commit()
+        except Exception as e:
+            logging.error(f"清理已處理訊息記錄時出錯: {str(e)}")
+
+
+_deduplicator: Optional[MessageDeduplicator] = None
+_deduplicator_lock = threading.Lock()
+
+
+def get_deduplicator() -> MessageDeduplicator:
+    """返回進程內共用的去重器"""
+    global _deduplicator
+    if _deduplicator is None:
+        with _deduplicator_lock:
+            if _deduplicator is None:
+                _deduplicator = MessageDeduplicator()
+    return _deduplicator
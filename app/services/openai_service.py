@@ -1,14 +1,33 @@
-from openai import OpenAI
-import shelve
 from dotenv import load_dotenv
 import os
 import time
 import logging
+import threading
+from rag.registry import get_registry
+from app.models.thread_store import get_thread_store
 
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_ASSISTANT_ID = os.getenv("OPENAI_ASSISTANT_ID")
-client = OpenAI(api_key=OPENAI_API_KEY)
+client = get_registry().get_openai_client()
+
+# Overall deadline for one assistant run, and the adaptive polling interval bounds
+ASSISTANT_RUN_TIMEOUT = float(os.getenv("ASSISTANT_RUN_TIMEOUT", "60"))
+ASSISTANT_POLL_INITIAL = float(os.getenv("ASSISTANT_POLL_INITIAL", "0.05"))
+ASSISTANT_POLL_MAX = float(os.getenv("ASSISTANT_POLL_MAX", "1.0"))
+ASSISTANT_STREAMING = os.getenv("ASSISTANT_STREAMING", "true").lower() == "true"
+
+# Model for answers that are shared through the semantic answer cache
+SHARED_ANSWER_MODEL = os.getenv("SHARED_ANSWER_MODEL", "gpt-4-1106-preview")
+
+# Fallback replies sent to the customer when the assistant cannot answer
+ERROR_RESPONSE = "唔好意思，我暫時回應唔到，請稍後再試。"
+TIMEOUT_RESPONSE = "唔好意思，回應時間過長，請重新發送你嘅問題。"
+SYSTEM_ERROR_RESPONSE = "唔好意思，系統發生錯誤，請稍後再試。"
+FALLBACK_RESPONSES = {ERROR_RESPONSE, TIMEOUT_RESPONSE, SYSTEM_ERROR_RESPONSE}
+
+_assistant = None
+_assistant_lock = threading.Lock()
 
 
 def upload_file(path):
@@ -59,56 +78,139 @@ def create_assistant(file):
     return assistant
 
 
-# Use context manager to ensure the shelf file is closed properly
+# Thread ids live in the chat_history database behind an in-process LRU cache
 def check_if_thread_exists(wa_id):
-    with shelve.open("threads_db") as threads_shelf:
-        return threads_shelf.get(wa_id, None)
+    return get_thread_store().get(wa_id)
 
 
 def store_thread(wa_id, thread_id):
-    with shelve.open("threads_db", writeback=True) as threads_shelf:
-        threads_shelf[wa_id] = thread_id
+    get_thread_store().set(wa_id, thread_id)
+
+
+def get_assistant():
+    """Retrieve the Assistant once and reuse it for every run."""
+    global _assistant
+    if _assistant is None:
+        with _assistant_lock:
+            if _assistant is None:
+                _assistant = client.beta.assistants.retrieve(OPENAI_ASSISTANT_ID)
+    return _assistant
+
+
+def _latest_message_text(thread_id):
+    messages = client.beta.threads.messages.list(thread_id=thread_id, order="desc", limit=1)
+    if messages.data:
+        return messages.data[0].content[0].text.value
+    return None
+
+
+def _run_options(additional_instructions):
+    return {"additional_instructions": additional_instructions} if additional_instructions else {}
+
+
+def _cancel_run(thread_id, run_id):
+    """Cancel an unfinished run so the next message on the thread is not rejected."""
+    try:
+        client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id)
+    except Exception as e:
+        logging.error(f"Failed to cancel assistant run: {str(e)}")
 
 
-def run_assistant(thread, name):
+def _run_streaming(thread_id, assistant_id, deadline, additional_instructions=None):
+    """Run with streamed events; returns (status, text)."""
+    timeout = max(deadline - time.monotonic(), 1)
+    run_id = None
+    finished = False
     try:
-        # Retrieve the Assistant
-        assistant = client.beta.assistants.retrieve(OPENAI_ASSISTANT_ID)
+        with client.with_options(timeout=timeout).beta.threads.runs.stream(
+            thread_id=thread_id,
+            assistant_id=assistant_id,
+            **_run_options(additional_instructions),
+        ) as stream:
+            for event in stream:
+                if event.event == "thread.run.created":
+                    run_id = event.data.id
+                elif event.event == "thread.run.failed":
+                    finished = True
+                    logging.error(f"Assistant run failed: {event.data.last_error}")
+                    return "failed", None
+                elif event.event == "thread.run.expired":
+                    finished = True
+                    return "expired", None
+                elif event.event == "thread.run.cancelled":
+                    finished = True
+                    return "cancelled", None
+                if time.monotonic() > deadline:
+                    stream.close()
+                    return "timeout", None
+            final_messages = stream.get_final_messages()
+            finished = True
+    finally:
+        # Timeouts and errors leave the run active on the thread unless it is cancelled
+        if not finished and run_id:
+            _cancel_run(thread_id, run_id)
+
+    if final_messages:
+        return "completed", final_messages[-1].content[0].text.value
+    return "completed", _latest_message_text(thread_id)
+
+
+def _run_polling(thread_id, assistant_id, deadline, additional_instructions=None):
+    """Run with adaptive polling that starts at tens of milliseconds; returns (status, text)."""
+    run = client.beta.threads.runs.create(
+        thread_id=thread_id,
+        assistant_id=assistant_id,
+        **_run_options(additional_instructions),
+    )
+
+    interval = ASSISTANT_POLL_INITIAL
+    while run.status in ("queued", "in_progress", "cancelling"):
+        if time.monotonic() + interval > deadline:
+            _cancel_run(thread_id, run.id)
+            return "timeout", None
+        time.sleep(interval)
+        interval = min(interval * 1.5, ASSISTANT_POLL_MAX)
+        run = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
+
+    if run.status == "failed":
+        logging.error(f"Assistant run failed: {run.last_error}")
+    if run.status != "completed":
+        return run.status, None
+    return "completed", _latest_message_text(thread_id)
 
-        # Run the assistant
-        run = client.beta.threads.runs.create(
-            thread_id=thread.id,
-            assistant_id=assistant.id,
-        )
 
-        # Wait for completion
-        while True:
-            run = client.beta.threads.runs.retrieve(thread_id=thread.id, run_id=run.id)
-            if run.status == "completed":
-                break
-            elif run.status == "failed":
-                logging.error(f"Assistant run failed: {run.last_error}")
-                return "唔好意思，我暫時回應唔到，請稍後再試。"
-            elif run.status == "expired":
-                logging.error("Assistant run expired")
-                return "唔好意思，回應時間過長，請重新發送你嘅問題。"
-            time.sleep(1)
-
-        # Retrieve the Messages
-        messages = client.beta.threads.messages.list(thread_id=thread.id)
-        if messages.data:
-            new_message = messages.data[0].content[0].text.value
-            logging.info(f"Generated message: {new_message}")
-            return new_message
+def run_assistant(thread_id, name, additional_instructions=None):
+    started = time.monotonic()
+    deadline = started + ASSISTANT_RUN_TIMEOUT
+    try:
+        assistant = get_assistant()
+
+        # Prefer streamed run events; fall back to polling on SDKs without streaming
+        if ASSISTANT_STREAMING and hasattr(client.beta.threads.runs, "stream"):
+            status, new_message = _run_streaming(
+                thread_id, assistant.id, deadline, additional_instructions
+            )
         else:
-            return "唔好意思，我暫時回應唔到，請稍後再試。"
+            status, new_message = _run_polling(
+                thread_id, assistant.id, deadline, additional_instructions
+            )
+
+        logging.info(f"Assistant run {status} in {time.monotonic() - started:.2f}s")
+        if status in ("expired", "timeout"):
+            logging.error(f"Assistant run {status}")
+            return TIMEOUT_RESPONSE
+        if status != "completed" or not new_message:
+            return ERROR_RESPONSE
+
+        logging.info(f"Generated message: {new_message}")
+        return new_message
             
     except Exception as e:
         logging.error(f"Error in run_assistant: {str(e)}")
-        return "唔好意思，系統發生錯誤，請稍後再試。"
+        return SYSTEM_ERROR_RESPONSE
 
 
-def generate_response(message_body, wa_id, name):
+def get_or_create_thread(wa_id, name):
     # Check if there is already a thread_id for the wa_id
     thread_id = check_if_thread_exists(wa_id)
 
@@ -118,11 +220,53 @@ def generate_response(message_body, wa_id, name):
         thread = client.beta.threads.create()
         store_thread(wa_id, thread.id)
         thread_id = thread.id
-
-    # Otherwise, retrieve the existing thread
     else:
-        logging.info(f"Retrieving existing thread for {name} with wa_id {wa_id}")
-        thread = client.beta.threads.retrieve(thread_id)
+        # The thread id is all the run needs, so skip fetching the thread itself
+        logging.info(f"Using existing thread for {name} with wa_id {wa_id}")
+    return thread_id
+
+
+def generate_shared_response(message_body, context):
+    """
+    Answer from the retrieved restaurant information only, without any customer's
+    thread history, so the answer can be cached and sent to other customers.
+    """
+    try:
+        response = client.with_options(timeout=ASSISTANT_RUN_TIMEOUT).chat.completions.create(
+            model=SHARED_ANSWER_MODEL,
+            messages=[
+                {
+                    "role": "system",
+                    "content": get_assistant().instructions
+                    + f"\n\n以下是相關的餐廳資訊，請根據這些資訊回答：\n{context or ''}",
+                },
+                {"role": "user", "content": message_body},
+            ],
+            temperature=0.3,
+        )
+        return response.choices[0].message.content or ERROR_RESPONSE
+    except Exception as e:
+        logging.error(f"Error generating shared response: {str(e)}")
+        return SYSTEM_ERROR_RESPONSE
+
+
+def append_to_thread(wa_id, name, message_body, answer):
+    """
+    Record a question answered outside the assistant (for example from the answer
+    cache) on the customer's thread, so follow-up questions keep their context.
+    """
+    try:
+        thread_id = get_or_create_thread(wa_id, name)
+        client.beta.threads.messages.create(thread_id=thread_id, role="user", content=message_body)
+        client.beta.threads.messages.create(thread_id=thread_id, role="assistant", content=answer)
+        return True
+    except Exception as e:
+        logging.error(f"Failed to append answer to thread: {str(e)}")
+        return False
+
+
+def generate_response(message_body, wa_id, name, context=None):
+    thread_id = get_or_create_thread(wa_id, name)
 
     # Add message to thread
     message = client.beta.threads.messages.create(
@@ -131,7 +275,12 @@ def generate_response(message_body, wa_id, name):
         content=message_body,
     )
 
+    # Pass the already retrieved restaurant information to this run only
+    additional_instructions = None
+    if context:
+        additional_instructions = f"以下是相關的餐廳資訊，請根據這些資訊回答：\n{context}"
+
     # Run the assistant and get the new message
-    new_message = run_assistant(thread, name)
+    new_message = run_assistant(thread_id, name, additional_instructions)
 
     return new_message
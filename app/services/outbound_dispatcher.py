@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+
+import aiohttp
+
+from app.services.graph_client import (
+    RETRYABLE_STATUS_CODES,
+    compute_backoff,
+    parse_retry_after,
+)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        """令牌桶限流：平均每秒 rate 個請求，允許最多 capacity 個突發請求"""
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """取得一個令牌，不夠時等待補充"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class OutboundDispatcher:
+    def __init__(self, access_token: str, version: str,
+                 base_url: str = "https://graph.facebook.com", rate_per_second: float = 80,
+                 burst: float = 80, max_connections: int = 100, max_retries: int = 3,
+                 backoff_base: float = 0.5, backoff_max: float = 8.0, timeout: float = 10):
+        """基於 asyncio 的發送器：在背景事件循環中並行發送訊息，每個電話號碼 ID 獨立限流
+        Args:
+            access_token (str): WhatsApp Cloud API 存取權杖
+            version (str): Graph API 版本
+            base_url (str): Graph API 地址
+            rate_per_second (float): 每個電話號碼 ID 每秒最多發送的訊息數
+            burst (float): 令牌桶容量，允許的突發訊息數
+            max_connections (int): aiohttp 連接池上限
+            max_retries (int): 遇到 429/5xx 或網絡錯誤時的最大重試次數
+            backoff_base (float): 指數退避的基礎秒數
+            backoff_max (float): 單次等待的上限秒數
+            timeout (float): 每次請求的超時秒數
+        """
+        self.access_token = access_token
+        self.version = version
+        self.base_url = base_url.rstrip('/')
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+
+    def start(self):
+        """在背景線程中啟動事件循環和 aiohttp 會話"""
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever,
+            name="outbound-dispatcher",
+            daemon=True
+        )
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._create_session(), self._loop).result()
+        logging.info(f"異步發送器已啟動，每個號碼限速 {self.rate_per_second} 條/秒")
+
+    async def _create_session(self):
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_connections),
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            headers={
+                "Content-type": "application/json",
+                "Authorization": f"Bearer {self.access_token}",
+            }
+        )
+
+    def send(self, phone_number_id: str, data: str,
+             callback: Callable[[Future], None] = None) -> Future:
+        """提交一條訊息，立即返回 Future；callback 會在發送完成後被調用"""
+        with self._lock:
+            self.in_flight += 1
+        future = asyncio.run_coroutine_threadsafe(self._send(phone_number_id, data), self._loop)
+        future.add_done_callback(self._on_done)
+        if callback:
+            future.add_done_callback(callback)
+        return future
+
+    def send_batch(self, messages: List[Tuple[str, str]],
+                   callback: Callable[[Future], None] = None) -> List[Future]:
+        """批量提交多條訊息 (phone_number_id, data)，各收件人並行發送"""
+        return [self.send(phone_number_id, data, callback) for phone_number_id, data in messages]
+
+    def _on_done(self, future: Future):
+        with self._lock:
+            self.in_flight -= 1
+            if future.cancelled() or future.exception() is not None:
+                self.failed += 1
+            else:
+                self.sent += 1
+
+    def _bucket_for(self, phone_number_id: str) -> TokenBucket:
+        bucket = self._buckets.get(phone_number_id)
+        if bucket is None:
+            bucket = TokenBucket(self.rate_per_second, self.burst)
+            self._buckets[phone_number_id] = bucket
+        return bucket
+
+    async def _send(self, phone_number_id: str, data: str) -> dict:
+        url = f"{self.base_url}/{self.version}/{phone_number_id}/messages"
+        bucket = self._bucket_for(phone_number_id)
+        attempt = 0
+        while True:
+            await bucket.acquire()
+            start = time.monotonic()
+            retry_after = None
+            try:
+                async with self._session.post(url, data=data) as response:
+                    body = await response.text()
+                    status = response.status
+                    retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                    error = None
+                    if status >= 400 and (status not in RETRYABLE_STATUS_CODES or attempt >= self.max_retries):
+                        response.raise_for_status()
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                status, body, error = type(e).__name__, None, e
+            latency = time.monotonic() - start
+            logging.info(f"Graph API 異步第 {attempt + 1} 次請求: {status}，耗時 {latency * 1000:.0f}ms")
+
+            retryable = error is not None or status in RETRYABLE_STATUS_CODES
+            if not retryable:
+                return {"status": status, "body": body, "latency_ms": round(latency * 1000, 1)}
+            if attempt >= self.max_retries:
+                raise error
+
+            delay = compute_backoff(attempt, self.backoff_base, self.backoff_max, retry_after)
+            logging.warning(f"Graph API 異步請求失敗（{status}），{delay:.2f} 秒後重試")
+            with self._lock:
+                self.retries += 1
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "in_flight": self.in_flight,
+                "sent": self.sent,
+                "failed": self.failed,
+                "retries": self.retries,
+                "rate_limited_numbers": len(self._buckets),
+            }
+
+    def shutdown(self, timeout: float = 30):
+        """等待發送中的訊息完成，然後關閉會話和事件循環"""
+        if self._loop is None or not self._loop.is_running():
+            return
+        deadline = time.monotonic() + timeout
+        while self.in_flight and time.monotonic() < deadline:
+            time.sleep(0.05)
+        if self.in_flight:
+            logging.warning(f"異步發送器關閉逾時，仍有 {self.in_flight} 條訊息未完成")
+        try:
+            asyncio.run_coroutine_threadsafe(self._session.close(), self._loop).result(timeout=5)
+        except Exception as e:
+            logging.error(f"關閉異步發送器會話時出錯: {str(e)}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
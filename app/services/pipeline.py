@@ -0,0 +1,125 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+@dataclass
+class RequestContext:
+    """一條訊息在處理流程中的狀態，每個階段的結果只計算一次並傳給後續階段"""
+    message: Dict[str, Any]
+    contact: Dict[str, Any]
+    message_id: Optional[str] = None
+    wa_id: Optional[str] = None
+    user_name: str = ""
+    message_body: Optional[str] = None
+    claimed: bool = False
+    classification: Dict[str, Any] = field(default_factory=dict)
+    query_vector: Any = None
+    retrieval_context: Optional[str] = None
+    response: Optional[str] = None
+    # 回應來源：cache（語義回答緩存）、shared（無對話歷史、可共用）、assistant 或 reservation
+    answer_source: Optional[str] = None
+    answer_cache_version: Optional[str] = None
+    is_reservation_complete: Optional[bool] = None
+    send_result: Any = None
+    halted: bool = False
+    halt_reason: Optional[str] = None
+    timings: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def category(self) -> str:
+        return self.classification.get('category', 'others')
+
+    def halt(self, reason: str):
+        """停止執行後續階段"""
+        self.halted = True
+        self.halt_reason = reason
+
+
+Stage = Callable[[RequestContext], None]
+
+
+class MessagePipeline:
+    def __init__(self, stages: List[Tuple[str, Stage]] = None):
+        """按順序執行的訊息處理流程，每個階段都可以替換並單獨計時
+        Args:
+            stages (list): (名稱, 函數) 列表，函數接收 RequestContext
+        """
+        self.stages: List[Tuple[str, Stage]] = list(stages or [])
+        self.error_handlers: List[Callable[[RequestContext, Exception], None]] = []
+        self._lock = threading.Lock()
+        self._timings: Dict[str, List[float]] = {}
+
+    def _index(self, name: str) -> int:
+        for i, (stage_name, _) in enumerate(self.stages):
+            if stage_name == name:
+                return i
+        raise KeyError(f"找不到處理階段: {name}")
+
+    def add_stage(self, name: str, stage: Stage, before: str = None, after: str = None):
+        """加入新階段，默認放在最後"""
+        if before:
+            self.stages.insert(self._index(before), (name, stage))
+        elif after:
+            self.stages.insert(self._index(after) + 1, (name, stage))
+        else:
+            self.stages.append((name, stage))
+
+    def replace_stage(self, name: str, stage: Stage):
+        self.stages[self._index(name)] = (name, stage)
+
+    def remove_stage(self, name: str):
+        del self.stages[self._index(name)]
+
+    def on_error(self, handler: Callable[[RequestContext, Exception], None]):
+        """註冊出錯時的處理函數（例如釋放去重認領）"""
+        self.error_handlers.append(handler)
+
+    def run(self, message: Dict[str, Any], contact: Dict[str, Any]) -> RequestContext:
+        ctx = RequestContext(message=message, contact=contact)
+        try:
+            for name, stage in self.stages:
+                start = time.monotonic()
+                try:
+                    stage(ctx)
+                finally:
+                    ctx.timings[name] = time.monotonic() - start
+                if ctx.halted:
+                    break
+        except Exception as e:
+            for handler in self.error_handlers:
+                try:
+                    handler(ctx, e)
+                except Exception as handler_error:
+                    logging.error(f"處理流程錯誤回調出錯: {str(handler_error)}")
+            raise
+        finally:
+            self._record(ctx.timings)
+            logging.info(
+                "處理流程耗時: " + ", ".join(
+                    f"{name}={seconds * 1000:.0f}ms" for name, seconds in ctx.timings.items()
+                )
+            )
+        return ctx
+
+    def _record(self, timings: Dict[str, float]):
+        with self._lock:
+            for name, seconds in timings.items():
+                stat = self._timings.setdefault(name, [0, 0.0, 0.0])
+                stat[0] += 1
+                stat[1] += seconds
+                stat[2] = max(stat[2], seconds)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """每個階段的執行次數、平均和最長耗時"""
+        with self._lock:
+            return {
+                name: {
+                    "count": count,
+                    "avg_ms": round(total / count * 1000, 1) if count else 0.0,
+                    "max_ms": round(longest * 1000, 1),
+                }
+                for name, (count, total, longest) in self._timings.items()
+            }
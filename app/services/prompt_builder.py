@@ -0,0 +1,117 @@
+import logging
+import os
+import re
+from functools import lru_cache
+from typing import Callable, List, Optional, Tuple
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+_CJK_PATTERN = re.compile(r'[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]')
+
+
+def _estimate_tokens(text: str) -> int:
+    """沒有 tiktoken 時的估算：中日文每字約 1 個 token，其他文字每 4 個字符約 1 個 token"""
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+@lru_cache(maxsize=8)
+def get_tokenizer(model: str = "gpt-4") -> Callable[[str], int]:
+    """返回計算 token 數的函數，同一模型只載入一次編碼表"""
+    if tiktoken is not None:
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base")
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+    return _estimate_tokens
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text: str, model: str = "gpt-4") -> int:
+    return get_tokenizer(model)(text)
+
+
+class PromptBuilder:
+    def __init__(self, context_budget: int = None, history_budget: int = None, model: str = "gpt-4"):
+        """按 token 預算組裝提示詞：檢索片段按相關性從高到低放入，對話歷史從最新開始放入
+        Args:
+            context_budget (int): 檢索片段最多佔用的 token 數
+            history_budget (int): 對話歷史最多佔用的 token 數
+            model (str): 用於選擇 tokenizer 的模型名稱
+        """
+        self.context_budget = context_budget if context_budget is not None else int(
+            os.getenv('PROMPT_CONTEXT_BUDGET', '1500')
+        )
+        self.history_budget = history_budget if history_budget is not None else int(
+            os.getenv('PROMPT_HISTORY_BUDGET', '1000')
+        )
+        self.model = model
+
+    def count(self, text: str) -> int:
+        return count_tokens(text, self.model)
+
+    def truncate(self, text: str, budget: int) -> str:
+        """返回不超過 budget 個 token 的最長前綴"""
+        low, high = 0, len(text)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.count(text[:middle]) <= budget:
+                low = middle
+            else:
+                high = middle - 1
+        return text[:low]
+
+    def pack_chunks(self, chunks: List[Tuple[str, float]], budget: Optional[int] = None) -> str:
+        """把 (片段, 分數) 按分數從高到低放入預算，放不下的片段跳過，返回拼接好的上下文
+        分數只用於排序，可以是餘弦相似度、BM25 或 RRF 分數。
+        最相關的片段本身就超出預算時截斷它，而不是返回空上下文。
+        """
+        budget = budget if budget is not None else self.context_budget
+        kept, used, total = [], 0, 0
+        for chunk, _ in sorted(chunks, key=lambda item: item[1], reverse=True):
+            tokens = self.count(chunk)
+            total += tokens
+            if used + tokens <= budget:
+                kept.append(chunk)
+                used += tokens
+            elif not kept and budget > 0:
+                truncated = self.truncate(chunk, budget)
+                if truncated:
+                    kept.append(truncated)
+                    used += self.count(truncated)
+        self._log_savings("檢索片段", total, used, len(kept), len(chunks))
+        return "\n\n".join(kept)
+
+    def pack_history(self, history: List[dict], budget: Optional[int] = None,
+                     render: Callable[[dict], str] = None) -> List[dict]:
+        """從最新的訊息開始放入預算，放不下時停止，返回按時間順序排列的訊息"""
+        budget = budget if budget is not None else self.history_budget
+        render = render or (lambda msg: msg.get("content", ""))
+        kept, used, total = [], 0, 0
+        full = True
+        for msg in reversed(history):
+            tokens = self.count(render(msg))
+            total += tokens
+            # 保持歷史連續，較舊的訊息一旦放不下就全部捨棄
+            if full and used + tokens <= budget:
+                kept.append(msg)
+                used += tokens
+            else:
+                full = False
+        kept.reverse()
+        self._log_savings("對話歷史", total, used, len(kept), len(history))
+        return kept
+
+    @staticmethod
+    def _log_savings(label: str, total: int, used: int, kept: int, available: int):
+        if total > used:
+            logging.info(
+                f"提示詞預算（{label}）: 保留 {kept}/{available} 項，"
+                f"{used}/{total} tokens，節省 {total - used} tokens"
+            )
+        else:
+            logging.debug(f"提示詞預算（{label}）: 全部保留，{used} tokens")
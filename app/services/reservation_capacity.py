@@ -0,0 +1,85 @@
+import logging
+import os
+from typing import Optional, Tuple
+
+from app.models.chat_history import ChatHistory
+# 時段規則和 SQL 屬於 models 層（遷移也會用到），這裡重新導出，slot_of 等仍可從此處導入
+from app.models.reservation_slots import (  # noqa: F401
+    CANCELLED_STATUS, CLAIM_SLOT_SQL, RELEASE_SLOT_SQL, SLOT_MINUTES, SLOT_OCCUPANCY_SQL,
+    rebuild_slot_counters, slot_of
+)
+
+
+class ReservationCapacity:
+    def __init__(self, chat_history: ChatHistory = None, max_per_slot: int = None):
+        """以每日每 30 分鐘時段計數的訂位容量控制
+        reservation_slots 表記錄每個時段已確認的訂位數量，容量檢查只需一次主鍵查詢；
+        檢查和寫入在同一個 BEGIN IMMEDIATE 事務中完成，並發請求不會超賣同一時段。
+        Args:
+            chat_history (ChatHistory): 提供數據庫連接和事務重試
+            max_per_slot (int): 每個時段最多接受的訂位數量
+        """
+        self.chat_history = chat_history or ChatHistory()
+        self.max_per_slot = max_per_slot or int(os.getenv('MAX_BOOKINGS_PER_SLOT', '3'))
+
+    def occupancy(self, date: str, time_str: str) -> int:
+        """返回時段已有的訂位數量"""
+        with self.chat_history.get_db_connection() as conn:
+            row = conn.execute(SLOT_OCCUPANCY_SQL, (date, slot_of(time_str))).fetchone()
+            return row[0] if row else 0
+
+    def book(self, wa_id: str, user_name: str, date: str, time_str: str, number_of_people: int,
+             special_requests: str = None) -> Tuple[bool, Optional[int]]:
+        """時段未滿時佔用一個名額並寫入訂位，返回 (是否成功, 訂位 ID)；時段已滿返回 (False, None)"""
+        slot = slot_of(time_str)
+
+        def work(conn):
+            cursor = conn.execute(CLAIM_SLOT_SQL, (date, slot, self.max_per_slot))
+            if cursor.rowcount == 0:
+                return None
+            cursor = conn.execute('''
+            INSERT INTO table_reservations
+            (wa_id, user_name, reservation_date, reservation_time,
+             number_of_people, special_requests)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ''', (wa_id, user_name, date, time_str, number_of_people, special_requests))
+            return cursor.lastrowid
+
+        reservation_id = self.chat_history.run_transaction(work)
+        if reservation_id is None:
+            logging.info(f"時段已滿: {date} {time_str}（上限 {self.max_per_slot}）")
+            return False, None
+        return True, reservation_id
+
+    def update_status(self, reservation_id: int, status: str) -> bool:
+        """更新訂位狀態；取消時釋放名額，恢復已取消的訂位時重新佔用名額
+        恢復時與 book 一樣使用 CLAIM_SLOT_SQL，時段已滿則拒絕並保持取消狀態，返回 False。
+        """
+        def work(conn):
+            row = conn.execute(
+                'SELECT reservation_date, reservation_time, status FROM table_reservations WHERE id = ?',
+                (reservation_id,)
+            ).fetchone()
+            if row is None:
+                return False
+            date, time_str, old_status = row
+            if old_status != CANCELLED_STATUS and status == CANCELLED_STATUS:
+                conn.execute(RELEASE_SLOT_SQL, (date, slot_of(time_str)))
+            elif old_status == CANCELLED_STATUS and status != CANCELLED_STATUS:
+                cursor = conn.execute(CLAIM_SLOT_SQL, (date, slot_of(time_str), self.max_per_slot))
+                if cursor.rowcount == 0:
+                    logging.info(f"時段已滿，無法恢復訂位 {reservation_id}: {date} {time_str}")
+                    return False
+            conn.execute('''
+            UPDATE table_reservations
+            SET status = ?,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+            ''', (status, reservation_id))
+            return True
+
+        try:
+            return self.chat_history.run_transaction(work)
+        except Exception as e:
+            logging.error(f"更新訂位狀態時出錯: {str(e)}")
+            return False
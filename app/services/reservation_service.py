@@ -1,15 +1,18 @@
-from openai import OpenAI
 import json
-import os
 from datetime import datetime, time
 import logging
 from app.models.chat_history import ChatHistory
 from typing import Tuple
+from rag.registry import get_registry
+from app.services.prompt_builder import PromptBuilder
+from app.services.chat_logger import get_chat_logger
+from app.services.reservation_capacity import ReservationCapacity
 
 class ReservationHandler:
     def __init__(self):
-        self.client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+        self.client = get_registry().get_openai_client()
         self.chat_history = ChatHistory()
+        self.prompt_builder = PromptBuilder()
         self.MAX_RETRIES = 2
         
         # 定義營業時間
@@ -18,7 +21,9 @@ class ReservationHandler:
             'dinner': {'start': time(18, 00), 'end': time(22, 00)}
         }
         self.MAX_PARTY_SIZE = 8
-        self.MAX_CONCURRENT_BOOKINGS = 3
+        # 每個 30 分鐘時段的容量由 MAX_BOOKINGS_PER_SLOT 設定
+        self.capacity = ReservationCapacity(self.chat_history)
+        self.MAX_CONCURRENT_BOOKINGS = self.capacity.max_per_slot
 
     def extract_reservation_info(self, message: str, conversation_history: list = None) -> dict:
         """使用 OpenAI 提取訂枱相關信息"""
@@ -85,10 +90,11 @@ class ReservationHandler:
 
             # 添加對話歷史
             if conversation_history:
-                history_context = "對話歷史：\n"
-                for msg in conversation_history:
-                    role = "用戶" if msg["is_user"] else "助手"
-                    history_context += f"{role}: {msg['content']}\n"
+                # 只保留 token 預算內最新的對話
+                render = lambda msg: f"{'用戶' if msg['is_user'] else '助手'}: {msg['content']}\n"
+                history_context = "對話歷史：\n" + "".join(
+                    render(msg) for msg in self.prompt_builder.pack_history(conversation_history, render=render)
+                )
                 messages.append({
                     "role": "system",
                     "content": history_context
@@ -189,30 +195,18 @@ class ReservationHandler:
             return False, "驗證訂位時出現錯誤，請稍後再試"
 
     def _check_concurrent_bookings(self, date: str, time_str: str) -> int:
-        """檢查指定時段的訂位數量"""
-        try:
-            # 獲取指定時間前後30分鐘的訂位
-            booking_time = datetime.strptime(f"{date} {time_str}", "%Y-%m-%d %H:%M")
-            
-            with self.chat_history.get_db_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                SELECT COUNT(*) 
-                FROM table_reservations 
-                WHERE reservation_date = ? 
-                AND ABS(strftime('%s', reservation_time) - strftime('%s', ?)) < 1800
-                AND status != '已取消'
-                ''', (date, time_str))
-                
-                return cursor.fetchone()[0]
-                
-        except Exception as e:
-            logging.error(f"檢查同時段訂位時出錯: {str(e)}")
-            return 0
+        """檢查指定 30 分鐘時段的訂位數量（主鍵查詢，不掃描訂位表）
+        查詢失敗時拋出異常，由驗證流程返回錯誤，而不是當作時段沒有訂位。
+        """
+        return self.capacity.occupancy(date, time_str)
 
     def process_reservation_request(self, wa_id: str, user_name: str, message: str, retry_count: int = 0) -> tuple:
         """處理訂位請求"""
         try:
+            # 異步寫入的對話記錄可能仍在隊列中，讀取歷史前先寫入
+            chat_logger = get_chat_logger()
+            if chat_logger is not None:
+                chat_logger.flush()
             conversation_history = self.chat_history.get_recent_chat_history(wa_id, hours=1)
             reservation_info = self.extract_reservation_info(message, conversation_history)
             
@@ -226,6 +220,28 @@ class ReservationHandler:
                     info["number_of_people"]
                 )
                 
+                if is_valid:
+                    # 驗證只是預先檢查，容量以檢查和寫入在同一事務中的結果為準
+                    try:
+                        booked, _ = self.capacity.book(
+                            wa_id=wa_id,
+                            user_name=user_name,
+                            date=info["reservation_date"],
+                            time_str=info["reservation_time"],
+                            number_of_people=info["number_of_people"],
+                            special_requests=info.get("special_requests")
+                        )
+                        success = True
+                    except Exception as e:
+                        logging.error(f"添加訂位記錄時出錯: {str(e)}")
+                        booked = success = False
+                    if success and not booked:
+                        is_valid, validation_message = False, (
+                            "非常抱歉，您選擇的時段訂位較多。"
+                            "為了確保為您提供最好的服務，"
+                            "我們的客服人員會盡快與您聯繫確認可行的安排。"
+                        )
+
                 if not is_valid:
                     # 如果是人數超限或同時段訂位過多，添加人工支援請求
                     if "客服人員會盡快與您聯繫" in validation_message:
@@ -239,16 +255,6 @@ class ReservationHandler:
                         )
                     return validation_message, False
                 
-                # 如果驗證通過，繼續處理訂位
-                success = self.chat_history.add_reservation(
-                    wa_id=wa_id,
-                    user_name=user_name,
-                    reservation_date=info["reservation_date"],
-                    reservation_time=info["reservation_time"],
-                    number_of_people=info["number_of_people"],
-                    special_requests=info.get("special_requests")
-                )
-                
                 if success:
                     response = (
                         f"好的，已收到您的訂位請求：\n"
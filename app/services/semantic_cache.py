@@ -0,0 +1,132 @@
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from rag.registry import get_registry
+
+
+class _Scope:
+    def __init__(self, dim: int):
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.answers = []
+        self.created_at = []
+        self.last_used = []
+
+    def remove(self, indexes):
+        drop = set(indexes)
+        keep = [i for i in range(len(self.answers)) if i not in drop]
+        self.vectors = self.vectors[keep]
+        self.answers = [self.answers[i] for i in keep]
+        self.created_at = [self.created_at[i] for i in keep]
+        self.last_used = [self.last_used[i] for i in keep]
+
+
+class SemanticAnswerCache:
+    def __init__(self, threshold: float = None, max_entries_per_scope: int = None,
+                 ttl_seconds: int = None):
+        """語義回答緩存：意思相近的問題直接返回之前生成的答案
+        Args:
+            threshold (float): 餘弦相似度高於此值才視為命中
+            max_entries_per_scope (int): 每個（類別, 集合版本）最多保留的答案數量
+            ttl_seconds (int): 答案有效時間
+        """
+        self.threshold = threshold or float(os.getenv('ANSWER_CACHE_THRESHOLD', '0.92'))
+        self.max_entries_per_scope = max_entries_per_scope or int(os.getenv('ANSWER_CACHE_SIZE', '500'))
+        self.ttl_seconds = ttl_seconds or int(os.getenv('ANSWER_CACHE_TTL', '86400'))
+        self._scopes: Dict[Tuple[str, str], _Scope] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.seconds_saved = 0.0
+        self._generation_seconds: Dict[str, Tuple[float, int]] = {}
+
+    def embed(self, text: str) -> np.ndarray:
+        return get_registry().embed([text], normalize=True)[0]
+
+    def _avg_generation_seconds(self, category: str) -> float:
+        total, count = self._generation_seconds.get(category, (0.0, 0))
+        return total / count if count else 0.0
+
+    def lookup(self, question: str, category: str, version: str,
+               vector: np.ndarray = None) -> Optional[str]:
+        """查詢相近問題的答案，未命中返回 None；vector 可傳入已計算的問題向量"""
+        if vector is None:
+            vector = self.embed(question)
+        now = time.monotonic()
+        with self._lock:
+            scope = self._scopes.get((category, version))
+            if scope is None or not scope.answers:
+                self.misses += 1
+                return None
+
+            expired = [i for i, created in enumerate(scope.created_at) if now - created > self.ttl_seconds]
+            if expired:
+                scope.remove(expired)
+                if not scope.answers:
+                    self.misses += 1
+                    return None
+
+            scores = scope.vectors @ vector
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            scope.last_used[best] = now
+            self.hits += 1
+            self.seconds_saved += self._avg_generation_seconds(category)
+            logging.info(f"語義緩存命中（{category}，相似度 {float(scores[best]):.3f}）")
+            return scope.answers[best]
+
+    def store(self, question: str, answer: str, category: str, version: str,
+              generation_seconds: float = None, vector: np.ndarray = None):
+        """保存新生成的答案；超過容量時淘汰最久未使用的答案"""
+        if vector is None:
+            vector = self.embed(question)
+        now = time.monotonic()
+        with self._lock:
+            # 不同集合版本的答案已經過時，直接丟棄
+            for key in [key for key in self._scopes if key[0] == category and key[1] != version]:
+                del self._scopes[key]
+
+            scope = self._scopes.setdefault((category, version), _Scope(vector.shape[0]))
+            scope.vectors = np.vstack([scope.vectors, vector[None, :]])
+            scope.answers.append(answer)
+            scope.created_at.append(now)
+            scope.last_used.append(now)
+            if len(scope.answers) > self.max_entries_per_scope:
+                scope.remove([int(np.argmin(scope.last_used))])
+
+            if generation_seconds is not None:
+                total, count = self._generation_seconds.get(category, (0.0, 0))
+                self._generation_seconds[category] = (total + generation_seconds, count + 1)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": sum(len(scope.answers) for scope in self._scopes.values()),
+                "scopes": len(self._scopes),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "estimated_seconds_saved": round(self.seconds_saved, 2),
+            }
+
+
+_answer_cache: Optional[SemanticAnswerCache] = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> SemanticAnswerCache:
+    """返回進程內共用的語義回答緩存"""
+    global _answer_cache
+    if _answer_cache is None:
+        with _answer_cache_lock:
+            if _answer_cache is None:
+                _answer_cache = SemanticAnswerCache()
+    return _answer_cache
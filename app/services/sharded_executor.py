@@ -0,0 +1,156 @@
+import logging
+import queue
+import threading
+import time
+import zlib
+from concurrent.futures import Future
+from typing import Dict
+
+# 通知分片線程停止的標記
+_STOP = object()
+
+
+class _Shard:
+    def __init__(self, index: int, max_queue_size: int):
+        self.index = index
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.thread = None
+        self.processed = 0
+        self.busy_seconds = 0.0
+
+
+class ShardedExecutor:
+    def __init__(self, num_shards: int = 4, max_queue_per_shard: int = 250,
+                 max_pending_per_key: int = 20, name: str = "shard"):
+        """按 key 分片的執行器：同一個 key 的任務嚴格按順序執行，不同 key 可以並行
+        Args:
+            num_shards (int): 分片數量，每個分片只有一個工作線程
+            max_queue_per_shard (int): 每個分片的隊列上限
+            max_pending_per_key (int): 每個 key 最多可排隊的任務數量
+            name (str): 線程名稱前綴
+        """
+        self.num_shards = max(1, num_shards)
+        self.max_pending_per_key = max_pending_per_key
+        self.name = name
+        self._shards = [_Shard(i, max_queue_per_shard) for i in range(self.num_shards)]
+        self._pending: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self.rejected = 0
+
+    def start(self):
+        """啟動每個分片的工作線程"""
+        for shard in self._shards:
+            shard.thread = threading.Thread(
+                target=self._worker_loop,
+                args=(shard,),
+                name=f"{self.name}-{shard.index}",
+                daemon=True
+            )
+            shard.thread.start()
+
+    def shard_for(self, key) -> int:
+        """計算 key 所屬的分片（使用穩定的哈希，不受 PYTHONHASHSEED 影響）"""
+        return zlib.crc32(str(key).encode("utf-8")) % self.num_shards
+
+    def submit(self, key, fn, *args, **kwargs) -> Future:
+        """提交任務，隊列已滿時拋出 queue.Full"""
+        future = Future()
+        shard = self._shards[self.shard_for(key)]
+        # 檢查和入隊都在鎖內完成：shutdown 在同一把鎖內設置 _stopping，
+        # 之後才放入停止標記，所以任務不會排在停止標記之後而永遠沒有結果
+        with self._lock:
+            if self._stopping.is_set():
+                raise RuntimeError("執行器正在關閉，不再接收新任務")
+            pending = self._pending.get(key, 0)
+            if pending >= self.max_pending_per_key:
+                self.rejected += 1
+                raise queue.Full(f"key {key} 已有 {pending} 個任務排隊")
+            try:
+                shard.queue.put_nowait((key, future, fn, args, kwargs))
+            except queue.Full:
+                self.rejected += 1
+                raise queue.Full(f"分片 {shard.index} 隊列已滿")
+            self._pending[key] = pending + 1
+        return future
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(shard.queue.qsize() for shard in self._shards)
+
+    def stats(self) -> dict:
+        """分片狀態和負載不平衡指標"""
+        depths = [shard.queue.qsize() for shard in self._shards]
+        processed = [shard.processed for shard in self._shards]
+
+        def imbalance(values):
+            # 最大值與平均值之比，1.0 代表完全平均
+            mean = sum(values) / len(values)
+            return round(max(values) / mean, 3) if mean else 1.0
+
+        with self._lock:
+            return {
+                "shards": [
+                    {
+                        "index": shard.index,
+                        "queue_depth": depths[shard.index],
+                        "processed": shard.processed,
+                        "busy_seconds": round(shard.busy_seconds, 3),
+                        "alive": bool(shard.thread and shard.thread.is_alive()),
+                    }
+                    for shard in self._shards
+                ],
+                "queue_depth": sum(depths),
+                "active_keys": len(self._pending),
+                "max_pending_per_key": max(self._pending.values(), default=0),
+                "depth_imbalance": imbalance(depths),
+                "load_imbalance": imbalance(processed),
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self, timeout: float = 30):
+        """停止接收新任務，等待各分片處理完已排隊的任務"""
+        with self._lock:
+            if self._stopping.is_set():
+                return
+            self._stopping.set()
+
+        deadline = time.monotonic() + timeout
+        # 停止標記排在已有任務之後，確保隊列先被清空
+        for shard in self._shards:
+            try:
+                shard.queue.put(_STOP, timeout=max(deadline - time.monotonic(), 0.01))
+            except queue.Full:
+                logging.warning(f"分片 {shard.index} 隊列已滿，無法發送停止標記")
+        for shard in self._shards:
+            if shard.thread:
+                shard.thread.join(max(deadline - time.monotonic(), 0))
+
+    def _release_key(self, key):
+        pending = self._pending.get(key, 0) - 1
+        if pending > 0:
+            self._pending[key] = pending
+        else:
+            self._pending.pop(key, None)
+
+    def _worker_loop(self, shard: _Shard):
+        while True:
+            item = shard.queue.get()
+            if item is _STOP:
+                shard.queue.task_done()
+                return
+
+            key, future, fn, args, kwargs = item
+            start = time.monotonic()
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(fn(*args, **kwargs))
+                    except BaseException as e:
+                        future.set_exception(e)
+            finally:
+                shard.busy_seconds += time.monotonic() - start
+                shard.processed += 1
+                with self._lock:
+                    self._release_key(key)
+                shard.queue.task_done()
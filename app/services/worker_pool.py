@@ -0,0 +1,96 @@
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Optional
+
+from app.services.sharded_executor import ShardedExecutor
+
+
+class MessageWorkerPool:
+    def __init__(self, app, handler, num_workers: int = 4, max_queue_size: int = 1000,
+                 max_pending_per_key: int = 20):
+        """背景工作池：按 wa_id 分片，同一客戶的訊息按順序處理，不同客戶並行處理
+        Args:
+            app: Flask app，工作線程需要 app context 才能讀取設定
+            handler: 處理單條訊息的函數，參數與 submit 相同（不含 key）
+            num_workers (int): 工作線程（分片）數量
+            max_queue_size (int): 所有分片合計的隊列上限
+            max_pending_per_key (int): 單個客戶最多可排隊的訊息數量
+        """
+        self.app = app
+        self.handler = handler
+        self.num_workers = num_workers
+        self.max_queue_size = max_queue_size
+        self._executor = ShardedExecutor(
+            num_shards=num_workers,
+            max_queue_per_shard=max(1, max_queue_size // max(1, num_workers)),
+            max_pending_per_key=max_pending_per_key,
+            name="message-worker"
+        )
+        self._lock = threading.Lock()
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def start(self):
+        """啟動工作線程"""
+        self._executor.start()
+        logging.info(f"訊息工作池已啟動，共 {self.num_workers} 個工作線程")
+
+    def submit(self, key, *args) -> Optional[Future]:
+        """按 key（wa_id）放入對應分片，隊列已滿或正在關閉時返回 None"""
+        try:
+            return self._executor.submit(key, self._run, *args)
+        except (queue.Full, RuntimeError) as e:
+            with self._lock:
+                self.rejected += 1
+            logging.warning(f"拒絕新訊息: {str(e)}")
+            return None
+
+    @property
+    def queue_depth(self) -> int:
+        return self._executor.queue_depth
+
+    def stats(self) -> dict:
+        """工作池狀態，用於監控"""
+        executor_stats = self._executor.stats()
+        with self._lock:
+            return {
+                "workers": self.num_workers,
+                "alive_workers": sum(1 for shard in executor_stats["shards"] if shard["alive"]),
+                "queue_depth": executor_stats["queue_depth"],
+                "max_queue_size": self.max_queue_size,
+                "processed": self.processed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "active_keys": executor_stats["active_keys"],
+                "max_pending_per_key": executor_stats["max_pending_per_key"],
+                "depth_imbalance": executor_stats["depth_imbalance"],
+                "load_imbalance": executor_stats["load_imbalance"],
+                "shards": executor_stats["shards"],
+            }
+
+    def shutdown(self, timeout: float = 30):
+        """停止接收新訊息，處理完隊列中已有的訊息後再結束"""
+        logging.info(f"正在關閉訊息工作池，待處理訊息: {self.queue_depth}")
+        self._executor.shutdown(timeout)
+
+        remaining = self.queue_depth
+        if remaining:
+            logging.warning(f"訊息工作池關閉逾時，仍有 {remaining} 條訊息未處理")
+        else:
+            logging.info("訊息工作池已關閉")
+
+    def _run(self, *args):
+        try:
+            with self.app.app_context():
+                result = self.handler(*args)
+            with self._lock:
+                self.processed += 1
+            return result
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+            logging.error(f"工作線程處理訊息時出錯: {str(e)}")
+            raise
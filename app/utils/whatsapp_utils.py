@@ -1,14 +1,35 @@
 import logging
-from flask import current_app, jsonify
+from flask import current_app
 import json
 import requests
 from rag.query_handler import QueryHandler
 import re
-from app.services.openai_service import generate_response as openai_generate_response, client
+import threading
+import time
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from app.services.openai_service import (
+    generate_response as openai_generate_response,
+    generate_shared_response,
+    append_to_thread,
+    client,
+    FALLBACK_RESPONSES,
+)
+from app.services.semantic_cache import get_answer_cache
+from rag.registry import get_registry
 from document_processor.embeddings import EmbeddingGenerator
 from app.models.chat_history import ChatHistory
 from app.services.classification_service import MessageClassifier
 from app.services.reservation_service import ReservationHandler
+from app.services.message_deduplicator import get_deduplicator
+from app.services.pipeline import MessagePipeline
+from app.services.chat_logger import get_chat_logger
+from app.services.prompt_builder import PromptBuilder
+
+
+# Categories whose answers only depend on the knowledge base, so they can be reused
+ANSWER_CACHE_CATEGORIES = ("restaurant_info", "food_info")
+# Categories handled by the reservation flow instead of the assistant
+RESERVATION_CATEGORIES = ("reservation", "table_service")
 
 
 def log_http_response(response):
@@ -80,14 +101,15 @@ def clean_text(text: str) -> str:
     return '\n\n'.join(formatted_paragraphs)
 
 
-def generate_response(message_body, wa_id, name):
+def generate_response(message_body, wa_id, name, relevant_docs=None):
     """
     使用 OpenAI 生成回應，並使用 RAG 系統提供上下文
+    已經檢索過的 relevant_docs 可直接傳入，避免重複查詢
     """
     try:
         # 使用 QueryHandler 獲取相關文檔內容
-        query_handler = QueryHandler()
-        relevant_docs = query_handler.process_query(message_body)
+        if relevant_docs is None:
+            relevant_docs = retrieve_context(message_body)
         
         # 修正：將檢索到的文檔內容正確插入到提示中
         system_content = f"""你是 CookingPapa，一個餐廳接待員。
@@ -130,27 +152,43 @@ def generate_response(message_body, wa_id, name):
         return "唔好意思，我而家暫時回應唔到，請稍後再試。"
 
 
+def log_delivery_result(future):
+    """Callback for asynchronous sends: log the final delivery result."""
+    try:
+        result = future.result()
+        logging.info(f"Status: {result['status']} ({result['latency_ms']}ms)")
+        logging.info(f"Body: {result['body']}")
+    except Exception as e:
+        logging.error(f"Async send failed due to: {e}")
+
+
 def send_message(data):
-    headers = {
-        "Content-type": "application/json",
-        "Authorization": f"Bearer {current_app.config['ACCESS_TOKEN']}",
-    }
+    """
+    Send a message through the app's pooled Graph API client. Retryable
+    failures are retried by the client; returns the response, or None if the
+    message could not be delivered.
+
+    In async outbound mode the message is handed to the outbound dispatcher and
+    a future is returned immediately, so workers never wait on the network.
+    """
+    dispatcher = current_app.extensions.get("outbound_dispatcher")
+    if dispatcher is not None:
+        return dispatcher.send(
+            current_app.config["PHONE_NUMBER_ID"], data, callback=log_delivery_result
+        )
 
-    url = f"https://graph.facebook.com/{current_app.config['VERSION']}/{current_app.config['PHONE_NUMBER_ID']}/messages"
+    graph_client = current_app.extensions["graph_client"]
 
     try:
-        response = requests.post(
-            url, data=data, headers=headers, timeout=10
-        )  # 10 seconds timeout as an example
-        response.raise_for_status()  # Raises an HTTPError if the HTTP request returned an unsuccessful status code
+        response = graph_client.send(data)
     except requests.Timeout:
         logging.error("Timeout occurred while sending message")
-        return jsonify({"status": "error", "message": "Request timed out"}), 408
+        return None
     except (
         requests.RequestException
     ) as e:  # This will catch any general request exception
         logging.error(f"Request failed due to: {e}")
-        return jsonify({"status": "error", "message": "Failed to send message"}), 500
+        return None
     else:
         # Process the response as normal
         log_http_response(response)
@@ -166,73 +204,261 @@ def process_text_for_whatsapp(text: str) -> str:
     return text
 
 
-def process_whatsapp_message(body):
-    try:
-        # 獲取消息內容
-        message = body["entry"][0]["changes"][0]["value"]["messages"][0]
-        wa_id = body["entry"][0]["changes"][0]["value"]["contacts"][0]["wa_id"]
-        user_name = body["entry"][0]["changes"][0]["value"]["contacts"][0]["profile"]["name"]
-        message_body = message["text"]["body"]
-        
-        # 對訊息進行分類
-        classifier = MessageClassifier()
-        classification = classifier.classify_message(message_body)
-        logging.info(f"訊息分類結果: {classification}")
-        
-        # 如果是訂枱相關的類別
-        if classification.get('category') in ['reservation', 'table_service']:
-            logging.info("檢測到訂枱請求，啟動訂枱處理流程")
-            reservation_handler = ReservationHandler()
-            response, is_complete = reservation_handler.process_reservation_request(
-                wa_id, user_name, message_body
-            )
-            context = "訂枱服務處理"
+def iter_whatsapp_messages(body):
+    """
+    Yield a (message, contact) pair for every message in every entry and change
+    of a webhook payload. Meta batches several messages into one POST under load.
+    """
+    for entry in body.get("entry") or []:
+        for change in entry.get("changes") or []:
+            value = change.get("value") or {}
+            contacts = value.get("contacts") or []
+            contacts_by_wa_id = {contact.get("wa_id"): contact for contact in contacts}
+            for message in value.get("messages") or []:
+                contact = contacts_by_wa_id.get(message.get("from"))
+                if contact is None:
+                    contact = contacts[0] if contacts else {"wa_id": message.get("from")}
+                yield message, contact
+
+
+def count_whatsapp_statuses(body):
+    """
+    Count the delivery status updates (sent, delivered, read) in a webhook payload.
+    """
+    return sum(
+        len((change.get("value") or {}).get("statuses") or [])
+        for entry in body.get("entry") or []
+        for change in entry.get("changes") or []
+    )
+
+
+def dispatch_whatsapp_messages(body, pool, timeout=None):
+    """
+    Process every message in a webhook payload on the worker pool and wait for
+    the results. Messages from different customers run concurrently, messages
+    from the same customer run in order. Returns one result dict per message.
+
+    The whole payload waits at most `timeout` seconds; messages still running
+    then are reported as "timeout" and keep processing in the background.
+    """
+    submitted = []
+    for message, contact in iter_whatsapp_messages(body):
+        future = pool.submit(contact.get("wa_id"), message, contact)
+        submitted.append((message, contact, future))
+
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    results = []
+    for message, contact, future in submitted:
+        result = {"message_id": message.get("id"), "wa_id": contact.get("wa_id")}
+        if future is None:
+            result["status"] = "error"
+            result["error"] = "Message queue is full"
         else:
-            # 使用一般的回應生成流程
-            query_handler = QueryHandler()
-            context = query_handler.process_query(message_body)
-            response = openai_generate_response(message_body, wa_id, user_name)
-        
-        # 記錄對話
-        chat_history = ChatHistory()
-        success = chat_history.add_chat_record(
-            wa_id=wa_id,
-            user_name=user_name,
-            message=message_body,
-            response=response,
-            category=classification.get('category', 'others'),
-            context=context,
-            metadata={
-                "message_id": message.get("id"),
-                "timestamp": message.get("timestamp"),
-                "classification": classification,
-                "is_reservation_complete": is_complete if 'is_complete' in locals() else None
-            }
+            try:
+                future.result(
+                    timeout=max(deadline - time.monotonic(), 0) if deadline is not None else None
+                )
+                result["status"] = "ok"
+            except FuturesTimeoutError:
+                result["status"] = "timeout"
+            except Exception as e:
+                result["status"] = "error"
+                result["error"] = str(e)
+        results.append(result)
+    return results
+
+
+def parse_stage(ctx):
+    """解析訊息內容和發送者；圖片、貼圖、表情回應等非文字訊息直接結束處理"""
+    ctx.message_id = ctx.message.get("id")
+    ctx.wa_id = ctx.contact["wa_id"]
+    ctx.user_name = ctx.contact.get("profile", {}).get("name", "")
+    message_type = ctx.message.get("type")
+    if message_type != "text":
+        logging.info(f"略過非文字訊息 {ctx.message_id}（類型: {message_type}）")
+        ctx.halt("unsupported_type")
+        return
+    ctx.message_body = ctx.message["text"]["body"]
+
+
+def dedupe_stage(ctx):
+    """Meta 會重送未及時確認的 webhook，先去重再做任何昂貴的處理"""
+    if not get_deduplicator().claim(ctx.message_id, ctx.wa_id):
+        logging.info(f"訊息 {ctx.message_id} 已處理過，略過重送")
+        ctx.halt("duplicate")
+        return
+    ctx.claimed = True
+
+
+def classify_stage(ctx):
+    """對訊息進行分類"""
+    ctx.classification = MessageClassifier().classify_message(ctx.message_body)
+    logging.info(f"訊息分類結果: {ctx.classification}")
+
+
+def retrieve_context(message_body, query_vector=None, k=3):
+    """檢索相關文檔，並按相關性排名在 token 預算內組裝上下文"""
+    try:
+        chunks = QueryHandler().search(message_body, k=k, query_embedding=query_vector)
+    except Exception as e:
+        logging.error(f"查詢處理出錯: {str(e)}")
+        return "抱歉，處理您的問題時出現錯誤。"
+    if not chunks:
+        return "沒有找到相關資訊。"
+    return PromptBuilder().pack_chunks(chunks)
+
+
+def answer_cache_stage(ctx):
+    """FAQ 類問題在檢索之前先查語義回答緩存，命中時跳過檢索和生成
+    問題向量只計算一次，未命中時與向量檢索共用。
+    """
+    if ctx.category not in ANSWER_CACHE_CATEGORIES:
+        return
+    # 緩存按類別和向量集合版本區分
+    try:
+        answer_cache = get_answer_cache()
+        ctx.query_vector = answer_cache.embed(ctx.message_body)
+        ctx.answer_cache_version = get_registry().get_collection_version()
+        cached = answer_cache.lookup(
+            ctx.message_body, ctx.category, ctx.answer_cache_version, vector=ctx.query_vector
         )
-        
-        if not success:
-            logging.error("對話記錄保存失敗")
-            
-        logging.info(f"準備發送回應: {response}")
-        
-        # 發送回應
-        data = get_text_message_input(recipient=wa_id, text=response)
-        return send_message(data)
-        
     except Exception as e:
-        logging.error(f"處理 WhatsApp 消息時出錯: {str(e)}")
-        return None
+        logging.error(f"查詢語義回答緩存時出錯: {str(e)}")
+        ctx.answer_cache_version, cached = None, None
+    if cached is not None:
+        ctx.response = cached
+        ctx.answer_source = "cache"
+
+
+def retrieve_stage(ctx):
+    """檢索相關餐廳資訊；緩存命中或訂枱請求時不需要檢索
+    其他類別在詞彙索引直接命中時完全不需要 embedding，走向量檢索時才計算。
+    """
+    if ctx.answer_source == "cache":
+        return
+    if ctx.category in RESERVATION_CATEGORIES:
+        ctx.retrieval_context = "訂枱服務處理"
+        return
+    ctx.retrieval_context = retrieve_context(ctx.message_body, query_vector=ctx.query_vector)
+
+
+def generate_stage(ctx):
+    """生成回應：訂枱交給 ReservationHandler，FAQ 類問題用不帶對話歷史的回答，其他交給 Assistant
+    FAQ 答案會共用給其他客人，所以只根據檢索到的餐廳資訊生成，不使用客人自己的 thread。
+    """
+    if ctx.answer_source == "cache":
+        return
+
+    if ctx.category in RESERVATION_CATEGORIES:
+        logging.info("檢測到訂枱請求，啟動訂枱處理流程")
+        ctx.response, ctx.is_reservation_complete = ReservationHandler().process_reservation_request(
+            ctx.wa_id, ctx.user_name, ctx.message_body
+        )
+        ctx.answer_source = "reservation"
+        return
+
+    if ctx.category not in ANSWER_CACHE_CATEGORIES:
+        ctx.response = openai_generate_response(
+            ctx.message_body, ctx.wa_id, ctx.user_name, context=ctx.retrieval_context
+        )
+        ctx.answer_source = "assistant"
+        return
+
+    start = time.monotonic()
+    ctx.response = generate_shared_response(ctx.message_body, ctx.retrieval_context)
+    ctx.answer_source = "shared"
+    if ctx.answer_cache_version is not None and ctx.response not in FALLBACK_RESPONSES:
+        get_answer_cache().store(
+            ctx.message_body, ctx.response, ctx.category, ctx.answer_cache_version,
+            generation_seconds=time.monotonic() - start, vector=ctx.query_vector
+        )
+
+
+def persist_stage(ctx):
+    """記錄對話；啟用異步寫入時只加入隊列，不阻塞回覆"""
+    chat_logger = get_chat_logger()
+    write = chat_logger.log if chat_logger is not None else ChatHistory().add_chat_record
+    success = write(
+        wa_id=ctx.wa_id,
+        user_name=ctx.user_name,
+        message=ctx.message_body,
+        response=ctx.response,
+        category=ctx.category,
+        context=ctx.retrieval_context,
+        metadata={
+            "message_id": ctx.message_id,
+            "timestamp": ctx.message.get("timestamp"),
+            "classification": ctx.classification,
+            "is_reservation_complete": ctx.is_reservation_complete
+        }
+    )
+    if not success:
+        logging.error("對話記錄保存失敗")
+
+
+def send_stage(ctx):
+    """發送回應"""
+    logging.info(f"準備發送回應: {ctx.response}")
+    data = get_text_message_input(recipient=ctx.wa_id, text=ctx.response)
+    ctx.send_result = send_message(data)
+    if ctx.send_result is None:
+        logging.error(f"回應發送失敗，訊息 ID: {ctx.message_id}")
+
+
+def thread_sync_stage(ctx):
+    """不經 Assistant 生成的 FAQ 答案在發送後補記到客人的 thread，追問時仍有上下文"""
+    if ctx.answer_source in ("cache", "shared") and ctx.response not in FALLBACK_RESPONSES:
+        append_to_thread(ctx.wa_id, ctx.user_name, ctx.message_body, ctx.response)
+
+
+def release_claim_on_error(ctx, error):
+    """處理失敗時釋放去重認領，讓重送的訊息可以再處理"""
+    logging.error(f"處理 WhatsApp 消息 {ctx.message_id} 時出錯: {str(error)}")
+    if ctx.claimed:
+        get_deduplicator().release(ctx.message_id)
+
+
+def build_default_pipeline():
+    """parse → dedupe → classify → answer_cache → retrieve → generate → persist → send → thread_sync"""
+    pipeline = MessagePipeline([
+        ("parse", parse_stage),
+        ("dedupe", dedupe_stage),
+        ("classify", classify_stage),
+        ("answer_cache", answer_cache_stage),
+        ("retrieve", retrieve_stage),
+        ("generate", generate_stage),
+        ("persist", persist_stage),
+        ("send", send_stage),
+        ("thread_sync", thread_sync_stage),
+    ])
+    pipeline.on_error(release_claim_on_error)
+    return pipeline
+
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def get_pipeline():
+    """Return the process-wide message pipeline; stages can be swapped on it."""
+    global _pipeline
+    if _pipeline is None:
+        with _pipeline_lock:
+            if _pipeline is None:
+                _pipeline = build_default_pipeline()
+    return _pipeline
+
+
+def process_whatsapp_message(message, contact):
+    ctx = get_pipeline().run(message, contact)
+    return ctx.send_result
 
 
 def is_valid_whatsapp_message(body):
     """
-    Check if the incoming webhook event has a valid WhatsApp message structure.
+    Check if the incoming webhook event contains at least one WhatsApp message
+    in any of its entries and changes.
     """
-    return (
-        body.get("object")
-        and body.get("entry")
-        and body["entry"][0].get("changes")
-        and body["entry"][0]["changes"][0].get("value")
-        and body["entry"][0]["changes"][0]["value"].get("messages")
-        and body["entry"][0]["changes"][0]["value"]["messages"][0]
+    return bool(body.get("object")) and any(
+        message for message, _ in iter_whatsapp_messages(body)
     )
@@ -4,9 +4,14 @@ import json
 from flask import Blueprint, request, jsonify, current_app
 
 from .decorators.security import signature_required
+from .services.classification_service import get_classification_stats
+from .services.semantic_cache import get_answer_cache
 from .utils.whatsapp_utils import (
-    process_whatsapp_message,
+    count_whatsapp_statuses,
+    dispatch_whatsapp_messages,
     is_valid_whatsapp_message,
+    iter_whatsapp_messages,
+    get_pipeline,
 )
 
 webhook_blueprint = Blueprint("webhook", __name__)
@@ -22,6 +27,8 @@ def handle_message():
     an error is returned.
 
     Every message send will trigger 4 HTTP requests to your webhook: message, sent, delivered, read.
+    Meta may batch several messages and statuses into one request, so every entry,
+    change and message is handled and a per-message result is returned.
 
     Returns:
         response: A tuple containing a JSON response and an HTTP status code.
@@ -29,19 +36,52 @@ def handle_message():
     body = request.get_json()
     # logging.info(f"request body: {body}")
 
-    # Check if it's a WhatsApp status update
-    if (
-        body.get("entry", [{}])[0]
-        .get("changes", [{}])[0]
-        .get("value", {})
-        .get("statuses")
-    ):
-        logging.info("Received a WhatsApp status update.")
-        return jsonify({"status": "ok"}), 200
+    status_count = count_whatsapp_statuses(body)
+    if status_count:
+        logging.info(f"Received {status_count} WhatsApp status update(s).")
 
     try:
         if is_valid_whatsapp_message(body):
-            process_whatsapp_message(body)
+            pool = current_app.extensions["message_worker_pool"]
+            if current_app.config["WEBHOOK_MODE"] != "async":
+                results = dispatch_whatsapp_messages(
+                    body, pool, timeout=current_app.config["WEBHOOK_SYNC_TIMEOUT"]
+                )
+                failed = any(result["status"] != "ok" for result in results)
+                return (
+                    jsonify(
+                        {
+                            "status": "partial_error" if failed else "ok",
+                            "results": results,
+                        }
+                    ),
+                    200,
+                )
+
+            # Async mode: acknowledge right away so Meta does not time out and redeliver
+            results = []
+            for message, contact in iter_whatsapp_messages(body):
+                queued = pool.submit(contact.get("wa_id"), message, contact)
+                results.append(
+                    {
+                        "message_id": message.get("id"),
+                        "wa_id": contact.get("wa_id"),
+                        "status": "queued" if queued is not None else "rejected",
+                    }
+                )
+            if any(result["status"] == "rejected" for result in results):
+                return (
+                    jsonify(
+                        {
+                            "status": "error",
+                            "message": "Message queue is full",
+                            "results": results,
+                        }
+                    ),
+                    503,
+                )
+            return jsonify({"status": "ok", "results": results}), 200
+        elif status_count:
             return jsonify({"status": "ok"}), 200
         else:
             # if the request is not a WhatsApp API event, return an error
@@ -77,6 +117,29 @@ def verify():
         return jsonify({"status": "error", "message": "Missing parameters"}), 400
 
 
+@webhook_blueprint.route("/health", methods=["GET"])
+def health():
+    pool = current_app.extensions["message_worker_pool"]
+    dispatcher = current_app.extensions.get("outbound_dispatcher")
+    chat_logger = current_app.extensions.get("chat_logger")
+    return (
+        jsonify(
+            {
+                "status": "ok",
+                "mode": current_app.config["WEBHOOK_MODE"],
+                "workers": pool.stats(),
+                "graph_api": current_app.extensions["graph_client"].stats(),
+                "outbound": dispatcher.stats() if dispatcher else None,
+                "classifier": get_classification_stats(),
+                "answer_cache": get_answer_cache().stats(),
+                "pipeline": get_pipeline().stats(),
+                "chat_log": chat_logger.stats() if chat_logger else None,
+            }
+        ),
+        200,
+    )
+
+
 @webhook_blueprint.route("/webhook", methods=["GET"])
 def webhook_get():
     return verify()
@@ -0,0 +1,235 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, List, Optional
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows 沒有 fcntl，只保證單進程安全
+    fcntl = None
+
+
+class EmbeddingCache:
+    def __init__(self, directory: str, model_name: str, dtype: str = "float16",
+                 memory_size: int = 10000):
+        """以 (模型名稱, 文本哈希) 為鍵的持久化 embedding 緩存
+        向量以連續的 float16/float32 矩陣存放在 vectors.bin（memory-mapped 讀取），
+        index.tsv 記錄每個文本哈希對應的行號，前面再加一層內存 LRU。
+        Args:
+            directory (str): 緩存根目錄，每個模型一個子目錄
+            model_name (str): embedding 模型名稱
+            dtype (str): 磁碟上的存儲精度，float16 或 float32
+            memory_size (int): 內存 LRU 最多保留的向量數量
+        """
+        self.model_name = model_name
+        self.dtype = np.dtype(dtype)
+        self.memory_size = memory_size
+        self.directory = os.path.join(directory, re.sub(r'[^A-Za-z0-9_.-]+', '_', model_name))
+        self.vectors_path = os.path.join(self.directory, "vectors.bin")
+        self.index_path = os.path.join(self.directory, "index.tsv")
+        self.meta_path = os.path.join(self.directory, "meta.json")
+        os.makedirs(self.directory, exist_ok=True)
+
+        self.dim: Optional[int] = None
+        self._index = {}
+        self._index_offset = 0
+        self._matrix = None
+        self._memory = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self._load_meta()
+        with self._file_lock():
+            # 上次寫入中途崩潰時，去掉殘留的半行向量和半行索引
+            self._repair()
+        self._refresh_index()
+
+    @staticmethod
+    def key(text: str) -> str:
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def _load_meta(self):
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                meta = json.load(f)
+            if meta.get("dtype") != self.dtype.name:
+                # 沿用已有文件的精度，避免同一文件混合兩種格式
+                self.dtype = np.dtype(meta["dtype"])
+            self.dim = meta.get("dim")
+
+    def _write_meta(self):
+        fd, tmp_path = tempfile.mkstemp(prefix="meta.", suffix=".tmp", dir=self.directory)
+        with os.fdopen(fd, "w") as f:
+            json.dump({"model": self.model_name, "dim": self.dim, "dtype": self.dtype.name}, f)
+        os.replace(tmp_path, self.meta_path)
+
+    def _repair(self):
+        """把 vectors.bin 截斷為整數行，並去掉 index.tsv 末尾不完整的一行（需持有文件鎖）"""
+        if self.dim and os.path.exists(self.vectors_path):
+            row_bytes = self.dim * self.dtype.itemsize
+            size = os.path.getsize(self.vectors_path)
+            if size % row_bytes:
+                logging.warning(f"embedding 緩存向量文件有不完整的行，截斷 {size % row_bytes} 字節")
+                os.truncate(self.vectors_path, size - size % row_bytes)
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "rb+") as f:
+                size = f.seek(0, os.SEEK_END)
+                end = size
+                # 只從文件末尾往回找最後一個換行符，不讀整個索引
+                while end > 0:
+                    start = max(end - 4096, 0)
+                    f.seek(start)
+                    newline = f.read(end - start).rfind(b"\n")
+                    if newline >= 0:
+                        end = start + newline + 1
+                        break
+                    end = start
+                if end != size:
+                    logging.warning("embedding 緩存索引文件末尾有不完整的行，已截斷")
+                    f.truncate(end)
+
+    @contextmanager
+    def _file_lock(self):
+        with open(os.path.join(self.directory, ".lock"), "a") as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _refresh_index(self):
+        """讀取其他進程新寫入的索引行，並重新映射向量文件"""
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path) as f:
+            f.seek(self._index_offset)
+            for line in f:
+                if not line.endswith("\n"):
+                    break
+                self._index_offset += len(line.encode("utf-8"))
+                parts = line.rstrip("\n").split("\t")
+                if len(parts) != 2 or not parts[1].isdigit():
+                    logging.warning(f"略過損壞的 embedding 緩存索引行: {line[:80]!r}")
+                    continue
+                self._index[parts[0]] = int(parts[1])
+        self._remap()
+
+    def _remap(self):
+        if not self.dim or not os.path.exists(self.vectors_path):
+            self._matrix = None
+            return
+        rows = os.path.getsize(self.vectors_path) // (self.dim * self.dtype.itemsize)
+        self._matrix = np.memmap(self.vectors_path, dtype=self.dtype, mode="r",
+                                 shape=(rows, self.dim)) if rows else None
+
+    def _memory_get(self, digest: str) -> Optional[np.ndarray]:
+        vector = self._memory.get(digest)
+        if vector is not None:
+            self._memory.move_to_end(digest)
+        return vector
+
+    def _memory_put(self, digest: str, vector: np.ndarray):
+        self._memory[digest] = vector
+        self._memory.move_to_end(digest)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _disk_get(self, digest: str) -> Optional[np.ndarray]:
+        row = self._index.get(digest)
+        if row is None or self._matrix is None or row >= self._matrix.shape[0]:
+            return None
+        return np.asarray(self._matrix[row], dtype=np.float32)
+
+    def _append(self, digests: List[str], vectors: np.ndarray):
+        with self._file_lock():
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                self._write_meta()
+            # 其他進程可能在寫入中途崩潰，先修復再計算起始行號
+            self._repair()
+            # 先讀入其他進程的新記錄，避免重複寫入
+            self._refresh_index()
+            fresh = [(d, v) for d, v in zip(digests, vectors) if d not in self._index]
+            if not fresh:
+                return
+            row_bytes = self.dim * self.dtype.itemsize
+            start_row = os.path.getsize(self.vectors_path) // row_bytes if os.path.exists(self.vectors_path) else 0
+            # 向量落盤之後才寫索引，索引行永遠不會指向不存在或寫了一半的向量
+            with open(self.vectors_path, "ab") as f:
+                f.write(np.asarray([v for _, v in fresh], dtype=self.dtype).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            lines = "".join(f"{d}\t{start_row + i}\n" for i, (d, _) in enumerate(fresh))
+            with open(self.index_path, "a") as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+            self._refresh_index()
+
+    def encode(self, texts: List[str], encode_fn: Callable[[List[str]], np.ndarray],
+               persist: bool = True) -> np.ndarray:
+        """返回 texts 的向量，只對緩存中沒有的文本調用 encode_fn
+        persist=False 時新算出的向量只放進內存 LRU，不寫磁碟：用於用戶查詢等不會重複出現的文本，
+        避免回覆路徑上的 fsync 和文件鎖，磁碟緩存也不會隨訊息數量無限增長。
+        """
+        digests = [self.key(text) for text in texts]
+        results: List[Optional[np.ndarray]] = [None] * len(texts)
+        with self._lock:
+            for i, digest in enumerate(digests):
+                vector = self._memory_get(digest)
+                if vector is None:
+                    vector = self._disk_get(digest)
+                    if vector is not None:
+                        self._memory_put(digest, vector)
+                results[i] = vector
+
+            missing = [i for i, vector in enumerate(results) if vector is None]
+            if missing and os.path.exists(self.index_path):
+                # 其他進程可能剛寫入這些文本
+                self._refresh_index()
+                for i in missing:
+                    results[i] = self._disk_get(digests[i])
+                missing = [i for i in missing if results[i] is None]
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            # 同一批次中的重複文本只計算一次
+            unique = list(OrderedDict((digests[i], texts[i]) for i in missing).items())
+            computed = np.asarray(encode_fn([text for _, text in unique]), dtype=np.float32)
+            by_digest = dict(zip((digest for digest, _ in unique), computed))
+            with self._lock:
+                if persist:
+                    try:
+                        self._append(list(by_digest), computed)
+                    except Exception as e:
+                        logging.error(f"寫入 embedding 緩存時出錯: {str(e)}")
+                for digest, vector in by_digest.items():
+                    self._memory_put(digest, vector)
+            for i in missing:
+                results[i] = by_digest[digests[i]]
+
+        if not texts:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        return np.vstack(results).astype(np.float32)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "disk_entries": len(self._index),
+                "memory_entries": len(self._memory),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
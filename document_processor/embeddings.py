@@ -1,11 +1,11 @@
-from sentence_transformers import SentenceTransformer
-import torch
+from rag.registry import get_registry
 
 class EmbeddingGenerator:
     def __init__(self):
-        # 檢查是否可用 CUDA
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2', device=self.device)
+        # 使用註冊表中已載入的模型，向量經由持久化緩存讀取
+        self.registry = get_registry()
+        self.backend = self.registry.get_embedding_backend()
+        self.device = str(self.backend.device)
     
     def generate_embeddings(self, texts):
         """
@@ -14,8 +14,7 @@ class EmbeddingGenerator:
         :return: 嵌入向量列表
         """
         try:
-            embeddings = self.model.encode(texts, convert_to_tensor=True)
-            return embeddings.cpu().numpy() if self.device == "cuda" else embeddings.numpy()
+            return self.registry.embed(list(texts), persist=True)
         except Exception as e:
             print(f"生成嵌入向量時出錯: {str(e)}")
             raise
\ No newline at end of file
@@ -1,6 +1,6 @@
 import os
 from dotenv import load_dotenv
-from rag.document_processor import DocumentProcessor
+from rag.ingestion import StreamingIngestion
 import logging
 
 # 設置日誌
@@ -12,10 +12,7 @@ def init_vector_database():
     load_dotenv()
     
     try:
-        # 初始化文檔處理器
-        doc_processor = DocumentProcessor()
-        
-        # 獲取PDF路徑
+        # PDF_SOURCE_PATH 可以是單個文件、目錄或 glob（例如 data/*.pdf）
         pdf_path = os.getenv('PDF_SOURCE_PATH')
         if not pdf_path:
             logger.error("PDF_SOURCE_PATH 未在 .env 中設置")
@@ -23,24 +20,14 @@ def init_vector_database():
             
         logger.info(f"開始處理PDF文件: {pdf_path}")
         
-        # 提取文本
-        paragraphs = doc_processor.extract_text_from_pdf(pdf_path)
-        if not paragraphs:
-            logger.error("無法從PDF中提取文本")
-            return
-            
-        logger.info(f"成功提取 {len(paragraphs)} 個段落")
+        # 多進程提取頁面，分批計算向量並寫入向量數據庫
+        stats = StreamingIngestion(collection_name="restaurant_info").run(pdf_path)
         
-        # 創建向量數據庫
-        success = doc_processor.create_or_update_collection(
-            collection_name="restaurant_info",
-            documents=paragraphs
+        logger.info(
+            f"向量數據庫更新成功: {stats['files']} 個文件，{stats['pages']} 頁，"
+            f"{stats['paragraphs']} 個段落（新增 {stats['added']}，刪除 {stats['deleted']}）"
         )
-        
-        if success:
-            logger.info("向量數據庫創建成功")
-        else:
-            logger.error("向量數據庫創建失敗")
+        logger.info(f"提取速度 {stats['pages_per_second']} 頁/秒，峰值內存 {stats['peak_rss_mb']} MB")
         
     except Exception as e:
         logger.error(f"初始化過程出錯: {str(e)}")
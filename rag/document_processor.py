@@ -1,26 +1,37 @@
-import pdfplumber
+import hashlib
 import os
-from typing import List
-import chromadb
-from chromadb.utils import embedding_functions
-from dotenv import load_dotenv
+import pdfplumber
+from datetime import datetime
+from typing import Dict, List
 import logging
+from rag.registry import get_registry
+from rag.lexical_index import build_lexical_index, lexical_index_path
+
+
+def publish_collection_changes(registry, collection_name: str, changed: bool):
+    """集合內容有變化時更新匯入版本並重建詞彙索引"""
+    if changed:
+        # 更新匯入版本，讓語義回答緩存和 NumPy 索引失效
+        collection = registry.get_collection(collection_name)
+        metadata = dict(collection.metadata or {})
+        metadata["ingest_version"] = datetime.now().strftime("%Y%m%d%H%M%S%f")
+        collection.modify(metadata=metadata)
+        registry.invalidate_collection(collection_name)
+    if changed or not os.path.exists(lexical_index_path(collection_name)):
+        # 詞彙索引在匯入時建立，查詢時不需要再掃描集合
+        build_lexical_index(registry.get_collection(collection_name))
+
 
 class DocumentProcessor:
     def __init__(self):
-        load_dotenv()
-        # 使用 ChromaDB 的內建 embedding 函數
-        self.embedding_function = embedding_functions.SentenceTransformerEmbeddingFunction(
-            model_name='sentence-transformers/all-MiniLM-L6-v2'
-        )
-        self.client = chromadb.PersistentClient(path=os.getenv('VECTOR_DB_PATH'))
+        # 使用註冊表共用的 embedding 模型和 ChromaDB 客戶端
+        self.registry = get_registry()
+        self.embedding_function = self.registry.get_embedding_function()
+        self.client = self.registry.get_chroma_client()
         
         # 獲取或創建集合
         try:
-            self.collection = self.client.get_or_create_collection(
-                name="restaurant_info",
-                embedding_function=self.embedding_function
-            )
+            self.collection = self.registry.get_collection("restaurant_info", create=True)
         except Exception as e:
             logging.error(f"創建集合時出錯: {str(e)}")
             raise
@@ -43,40 +54,64 @@ class DocumentProcessor:
             logging.error(f"PDF處理錯誤: {str(e)}")
             return []
 
+    @staticmethod
+    def document_id(text: str) -> str:
+        """由內容哈希得到穩定的文檔 id，內容不變 id 就不變"""
+        return "doc_" + hashlib.sha1(text.encode("utf-8")).hexdigest()[:20]
+
+    def diff_collection(self, collection, documents: List[str]) -> Dict[str, list]:
+        """比較新文檔與集合現有內容，返回需要新增和刪除的 id；內容不變的段落完全不動"""
+        wanted: Dict[str, str] = {}
+        for text in documents:
+            # 重複段落只保留一份
+            wanted.setdefault(self.document_id(text), text)
+
+        existing_ids = set(collection.get(include=[])["ids"])
+
+        return {
+            "add": [doc_id for doc_id in wanted if doc_id not in existing_ids],
+            "delete": [doc_id for doc_id in existing_ids if doc_id not in wanted],
+            "documents": wanted,
+        }
+
     def create_or_update_collection(self, collection_name: str, documents: List[str]) -> bool:
         """
-        創建或更新向量數據庫集合
+        增量更新向量數據庫集合：只寫入有變化的段落，集合在更新過程中不會被清空
         """
         try:
-            # 刪除現有集合（如果存在）
-            try:
-                self.client.delete_collection(collection_name)
-            except:
-                pass
+            collection = self.registry.get_collection(collection_name, create=True)
+            diff = self.diff_collection(collection, documents)
+            wanted = diff["documents"]
+            batch_size = int(os.getenv('INGEST_BATCH_SIZE', '64'))
 
-            # 創建新集合
-            collection = self.client.create_collection(
-                name=collection_name,
-                embedding_function=self.embedding_function
-            )
+            # 先新增再刪除，查詢在任何時候都能找到文檔
+            for i in range(0, len(diff["add"]), batch_size):
+                batch = diff["add"][i:i + batch_size]
+                collection.upsert(
+                    ids=batch,
+                    documents=[wanted[doc_id] for doc_id in batch]
+                )
+            for i in range(0, len(diff["delete"]), batch_size):
+                collection.delete(ids=diff["delete"][i:i + batch_size])
 
-            # 添加文檔到集合
-            collection.add(
-                documents=documents,
-                ids=[f"doc_{i}" for i in range(len(documents))]
+            publish_collection_changes(self.registry, collection_name, bool(diff["add"] or diff["delete"]))
+            if collection_name == self.collection.name:
+                self.collection = self.registry.get_collection(collection_name)
+
+            logging.info(
+                f"集合 {collection_name} 更新完成: 新增 {len(diff['add'])}，"
+                f"刪除 {len(diff['delete'])}，未變 {len(wanted) - len(diff['add'])}"
             )
-            
-            logging.info(f"成功創建集合 {collection_name} 包含 {len(documents)} 個文檔")
             return True
             
         except Exception as e:
-            logging.error(f"創建集合時出錯: {str(e)}")
+            logging.error(f"更新集合時出錯: {str(e)}")
             return False
 
     def query_documents(self, query_text, n_results=3):
         try:
             results = self.collection.query(
-                query_texts=[query_text],
+                query_embeddings=self.registry.embed([query_text]).tolist(),
                 n_results=n_results
             )
             return results
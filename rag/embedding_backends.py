@@ -0,0 +1,141 @@
+import logging
+import os
+from typing import List
+
+import numpy as np
+
+
+def _sorted_batches(texts: List[str], batch_size: int):
+    """按長度排序後分批，同一批次的填充更少；返回 (原始位置, 文本) 批次"""
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    for start in range(0, len(order), batch_size):
+        indexes = order[start:start + batch_size]
+        yield indexes, [texts[i] for i in indexes]
+
+
+class TorchEmbeddingBackend:
+    name = "torch"
+
+    def __init__(self, model_name: str, batch_size: int = 32, threads: int = None):
+        """原本的 SentenceTransformer（PyTorch fp32）後端
+        Args:
+            model_name (str): 模型名稱
+            batch_size (int): 每批文本數量
+            threads (int): PyTorch intra-op 線程數，None 表示使用默認值
+        """
+        from sentence_transformers import SentenceTransformer
+        import torch
+
+        if threads:
+            torch.set_num_threads(threads)
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        logging.info(f"載入 embedding 模型 {model_name}（torch，{self.device}）")
+        self.model = SentenceTransformer(model_name, device=self.device)
+        self.batch_size = batch_size
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(texts, batch_size=self.batch_size, convert_to_numpy=True).astype(np.float32)
+
+
+def export_onnx_model(model_name: str, output_dir: str, quantize: bool = False) -> str:
+    """把 Hugging Face 模型導出為 ONNX（可選動態 int8 量化），返回 .onnx 文件路徑"""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    fp32_path = os.path.join(output_dir, "model.onnx")
+    int8_path = os.path.join(output_dir, "model-int8.onnx")
+    os.makedirs(output_dir, exist_ok=True)
+
+    if not os.path.exists(fp32_path):
+        logging.info(f"導出 ONNX 模型到 {fp32_path}")
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModel.from_pretrained(model_name)
+        model.eval()
+        inputs = tokenizer(["示例文本"], return_tensors="pt")
+        input_names = ["input_ids", "attention_mask", "token_type_ids"]
+        with torch.no_grad():
+            torch.onnx.export(
+                model,
+                tuple(inputs[name] for name in input_names),
+                fp32_path,
+                input_names=input_names,
+                output_names=["last_hidden_state"],
+                dynamic_axes={name: {0: "batch", 1: "sequence"} for name in input_names + ["last_hidden_state"]},
+                opset_version=14
+            )
+        tokenizer.save_pretrained(output_dir)
+
+    if not quantize:
+        return fp32_path
+    if not os.path.exists(int8_path):
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+
+        logging.info(f"量化 ONNX 模型到 {int8_path}")
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    return int8_path
+
+
+class OnnxEmbeddingBackend:
+    def __init__(self, model_name: str, batch_size: int = 32, threads: int = None,
+                 quantized: bool = False, export_dir: str = None, max_length: int = 256):
+        """ONNX Runtime 後端，直接返回 NumPy，不經過 PyTorch tensor
+        Args:
+            model_name (str): 模型名稱
+            batch_size (int): 每批文本數量
+            threads (int): ONNX Runtime intra-op 線程數
+            quantized (bool): 是否使用動態 int8 量化模型
+            export_dir (str): 導出模型的目錄，沒有模型時自動導出
+            max_length (int): 最大 token 長度（與 SentenceTransformer 的 max_seq_length 一致）
+        """
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.name = "onnx-int8" if quantized else "onnx"
+        self.device = "cpu"
+        export_dir = export_dir or os.path.join(
+            os.getenv('ONNX_MODEL_DIR', './onnx_models'), model_name.replace('/', '_')
+        )
+        model_path = export_onnx_model(model_name, export_dir, quantize=quantized)
+
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        logging.info(f"載入 embedding 模型 {model_path}（{self.name}）")
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {item.name for item in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(export_dir)
+        self.batch_size = batch_size
+        self.max_length = max_length
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        output = np.zeros((len(texts), 0), dtype=np.float32)
+        for indexes, batch in _sorted_batches(texts, self.batch_size):
+            inputs = self.tokenizer(batch, padding=True, truncation=True,
+                                    max_length=self.max_length, return_tensors="np")
+            feed = {name: inputs[name].astype(np.int64) for name in self.input_names if name in inputs}
+            hidden = self.session.run(None, feed)[0]
+
+            # mean pooling + L2 歸一化，與 all-MiniLM-L6-v2 的 SentenceTransformer 流程一致
+            mask = inputs["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+
+            if output.shape[1] == 0:
+                output = np.zeros((len(texts), pooled.shape[1]), dtype=np.float32)
+            output[indexes] = pooled
+        return output
+
+
+def create_embedding_backend(model_name: str, backend: str = None, batch_size: int = None,
+                             threads: int = None):
+    """按 EMBEDDING_BACKEND（torch / onnx / onnx-int8）建立 embedding 後端"""
+    backend = (backend or os.getenv('EMBEDDING_BACKEND', 'torch')).lower()
+    batch_size = batch_size or int(os.getenv('EMBEDDING_BATCH_SIZE', '32'))
+    threads = threads or (int(os.getenv('EMBEDDING_THREADS')) if os.getenv('EMBEDDING_THREADS') else None)
+
+    if backend == "torch":
+        return TorchEmbeddingBackend(model_name, batch_size, threads)
+    if backend in ("onnx", "onnx-int8"):
+        return OnnxEmbeddingBackend(model_name, batch_size, threads, quantized=backend == "onnx-int8")
+    raise ValueError(f"未知的 embedding 後端: {backend}")
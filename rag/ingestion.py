@@ -0,0 +1,231 @@
+import glob
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Tuple
+
+import pdfplumber
+
+from rag.registry import get_registry, DEFAULT_COLLECTION
+from rag.document_processor import DocumentProcessor, publish_collection_changes
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_DONE = object()
+
+
+def resolve_sources(source: str) -> List[str]:
+    """把目錄、glob 或單個文件路徑展開為 PDF 文件列表"""
+    if os.path.isdir(source):
+        pattern = os.path.join(source, "**", "*.pdf")
+        return sorted(glob.glob(pattern, recursive=True))
+    return sorted(path for path in glob.glob(source, recursive=True) if os.path.isfile(path))
+
+
+def extract_pages(path: str, start: int, end: int) -> List[Tuple[int, List[str]]]:
+    """在子進程中提取 [start, end) 頁的段落"""
+    pages = []
+    with pdfplumber.open(path) as pdf:
+        for page_number in range(start, min(end, len(pdf.pages))):
+            text = pdf.pages[page_number].extract_text()
+            paragraphs = [p.strip() for p in text.split('\n\n') if p.strip()] if text else []
+            pages.append((page_number, paragraphs))
+    return pages
+
+
+def peak_rss_mb() -> float:
+    """本進程和子進程的峰值常駐內存（MB）"""
+    if resource is None:
+        return 0.0
+    total = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+             + resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # Linux 的單位是 KB，macOS 是 bytes
+    return total / (1024 * 1024) if os.uname().sysname == "Darwin" else total / 1024
+
+
+class StreamingIngestion:
+    def __init__(self, collection_name: str = DEFAULT_COLLECTION, workers: int = None,
+                 pages_per_task: int = 4, batch_size: int = None, queue_size: int = 8):
+        """流式匯入：多進程提取 PDF 頁面，段落分批經過 embedding 和寫入階段
+        各階段之間使用有界隊列，內存佔用與文件總大小無關。
+        Args:
+            collection_name (str): 目標集合
+            workers (int): 提取頁面的進程數量
+            pages_per_task (int): 每個子進程任務處理的頁數
+            batch_size (int): 每批 embedding/寫入的段落數量
+            queue_size (int): 階段之間隊列最多容納的批次數量
+        """
+        self.registry = get_registry()
+        self.collection_name = collection_name
+        self.workers = workers or int(os.getenv('INGEST_WORKERS', str(os.cpu_count() or 2)))
+        self.pages_per_task = pages_per_task
+        self.batch_size = batch_size or int(os.getenv('INGEST_BATCH_SIZE', '64'))
+        self.queue_size = queue_size
+        self.pages = 0
+        # 無法打開或提取失敗的文件；有失敗時不刪除舊文檔
+        self.failed_sources: List[str] = []
+
+    def _page_tasks(self, sources: List[str]) -> Iterator[Tuple[str, int, int]]:
+        for path in sources:
+            try:
+                with pdfplumber.open(path) as pdf:
+                    page_count = len(pdf.pages)
+            except Exception as e:
+                logging.error(f"無法打開 PDF {path}: {str(e)}")
+                self.failed_sources.append(path)
+                continue
+            for start in range(0, page_count, self.pages_per_task):
+                yield path, start, start + self.pages_per_task
+
+    def iter_paragraphs(self, sources: List[str]) -> Iterator[Tuple[str, int, str]]:
+        """按文件和頁碼順序產生 (文件, 頁碼, 段落)，同時最多只有 2 * workers 個任務在執行"""
+        tasks = self._page_tasks(sources)
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            in_flight = []
+            for task in tasks:
+                in_flight.append((task[0], executor.submit(extract_pages, *task)))
+                if len(in_flight) >= self.workers * 2:
+                    yield from self._drain_one(in_flight)
+            while in_flight:
+                yield from self._drain_one(in_flight)
+
+    def _drain_one(self, in_flight) -> Iterator[Tuple[str, int, str]]:
+        path, future = in_flight.pop(0)
+        try:
+            pages = future.result()
+        except Exception as e:
+            logging.error(f"提取 {path} 時出錯: {str(e)}")
+            self.failed_sources.append(path)
+            return
+        for page_number, paragraphs in pages:
+            self.pages += 1
+            for paragraph in paragraphs:
+                yield path, page_number, paragraph
+
+    def run(self, source: str) -> Dict[str, float]:
+        """匯入 source 下的所有 PDF，返回統計數據"""
+        sources = resolve_sources(source)
+        if not sources:
+            raise FileNotFoundError(f"找不到 PDF 文件: {source}")
+        logging.info(f"開始匯入 {len(sources)} 個 PDF 文件（{self.workers} 個進程）")
+
+        start_time = time.monotonic()
+        self.pages = 0
+        self.failed_sources = []
+        collection = self.registry.get_collection(self.collection_name, create=True)
+        existing_ids = set(collection.get(include=[])["ids"])
+
+        embed_queue: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        write_queue: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        errors: List[Exception] = []
+        stop = threading.Event()
+        seen = set()
+        counts = {"paragraphs": 0, "added": 0, "unchanged": 0}
+
+        def produce():
+            batch = []
+            try:
+                for path, page_number, paragraph in self.iter_paragraphs(sources):
+                    if stop.is_set():
+                        break
+                    # source/page 只在新增時寫入，已存在的段落不改寫 metadata
+                    metadata = {"source": os.path.basename(path), "page": page_number + 1}
+                    doc_id = DocumentProcessor.document_id(paragraph)
+                    if doc_id in seen:
+                        continue
+                    seen.add(doc_id)
+                    batch.append((doc_id, paragraph, metadata))
+                    if len(batch) >= self.batch_size:
+                        embed_queue.put(batch)
+                        batch = []
+                if batch:
+                    embed_queue.put(batch)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                embed_queue.put(_DONE)
+
+        def embed():
+            try:
+                while True:
+                    batch = embed_queue.get()
+                    if batch is _DONE:
+                        break
+                    # 已存在的段落不需要重新計算向量
+                    new = [item for item in batch if item[0] not in existing_ids]
+                    vectors = self.registry.embed([text for _, text, _ in new], persist=True) if new else []
+                    write_queue.put((batch, new, vectors))
+            except Exception as e:
+                errors.append(e)
+                # 讓生產者不會因隊列已滿而永久阻塞
+                while embed_queue.get() is not _DONE:
+                    pass
+            finally:
+                write_queue.put(_DONE)
+
+        threads = [threading.Thread(target=produce, daemon=True), threading.Thread(target=embed, daemon=True)]
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                item = write_queue.get()
+                if item is _DONE:
+                    break
+                batch, new, vectors = item
+                counts["paragraphs"] += len(batch)
+                if new:
+                    collection.upsert(
+                        ids=[doc_id for doc_id, _, _ in new],
+                        documents=[text for _, text, _ in new],
+                        metadatas=[metadata for _, _, metadata in new],
+                        embeddings=[vector.tolist() for vector in vectors]
+                    )
+                    counts["added"] += len(new)
+                counts["unchanged"] += len(batch) - len(new)
+        except Exception:
+            # 寫入失敗時停止上游階段並清空隊列，讓線程可以退出
+            stop.set()
+            while write_queue.get() is not _DONE:
+                pass
+            raise
+        finally:
+            for thread in threads:
+                thread.join()
+
+        if errors:
+            # 提取不完整時不刪除舊文檔，避免誤刪
+            raise errors[0]
+
+        if self.failed_sources:
+            # 失敗文件的段落不在 seen 中，這時刪除會誤刪它們的舊文檔
+            stale = []
+            logging.warning(f"{len(set(self.failed_sources))} 個文件提取失敗，本次不刪除舊文檔")
+        else:
+            stale = [doc_id for doc_id in existing_ids if doc_id not in seen]
+        for i in range(0, len(stale), self.batch_size):
+            collection.delete(ids=stale[i:i + self.batch_size])
+
+        publish_collection_changes(self.registry, self.collection_name, bool(counts["added"] or stale))
+
+        elapsed = time.monotonic() - start_time
+        stats = {
+            "files": len(sources),
+            "pages": self.pages,
+            "paragraphs": counts["paragraphs"],
+            "added": counts["added"],
+            "unchanged": counts["unchanged"],
+            "deleted": len(stale),
+            "failed_files": len(set(self.failed_sources)),
+            "seconds": round(elapsed, 2),
+            "pages_per_second": round(self.pages / elapsed, 2) if elapsed else 0.0,
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+        }
+        logging.info(f"匯入完成: {stats}")
+        return stats
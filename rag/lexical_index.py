@@ -0,0 +1,152 @@
+import json
+import logging
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from rag.registry import get_registry, DEFAULT_COLLECTION
+from rag.snapshot_io import atomic_write_json, file_lock
+
+_TOKEN_PATTERN = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+|[a-z0-9]+')
+_CJK_START = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]')
+
+
+def tokenize(text: str) -> List[str]:
+    """中文按相鄰兩字切分（單字詞保留單字），英文和數字按詞切分"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    tokens = []
+    for run in _TOKEN_PATTERN.findall(text):
+        if _CJK_START.match(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+class LexicalIndex:
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        """以 BM25 計分的倒排索引，適合「地址」、「電話」這類關鍵字查詢
+        Args:
+            k1 (float): 詞頻飽和參數
+            b (float): 文檔長度歸一化參數
+        """
+        self.k1 = k1
+        self.b = b
+        self.ids: List[str] = []
+        self.documents: List[str] = []
+        self.doc_lengths: List[int] = []
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        self.avg_length = 0.0
+        self.version: Optional[str] = None
+
+    def build(self, ids: List[str], documents: List[str], version: str = None):
+        self.ids = list(ids)
+        self.documents = list(documents)
+        self.version = version
+        postings = defaultdict(list)
+        self.doc_lengths = []
+        for doc_index, document in enumerate(self.documents):
+            counts = Counter(tokenize(document))
+            self.doc_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                postings[term].append((doc_index, tf))
+        self.postings = dict(postings)
+        self.avg_length = sum(self.doc_lengths) / len(self.doc_lengths) if self.doc_lengths else 0.0
+
+    def _idf(self, term: str) -> float:
+        df = len(self.postings.get(term, ()))
+        n = len(self.documents)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, k: int = 3) -> Tuple[List[Tuple[str, float]], float, int]:
+        """返回 (文檔, BM25 分數) 列表、最高分文檔覆蓋的查詢詞比例，以及它命中的詞數
+        覆蓋率按全部查詢詞計算，索引中沒有的詞也算在分母內，
+        「今日天氣點樣」只碰巧命中「今日」時覆蓋率很低，不會被當成明確命中。
+        """
+        query_terms = set(tokenize(query))
+        terms = {term for term in query_terms if term in self.postings}
+        if not terms or not self.documents:
+            return [], 0.0, 0
+        scores: Dict[int, float] = defaultdict(float)
+        matched: Dict[int, int] = defaultdict(int)
+        for term in terms:
+            idf = self._idf(term)
+            for doc_index, tf in self.postings.get(term, ()):
+                length_norm = 1 - self.b + self.b * self.doc_lengths[doc_index] / (self.avg_length or 1)
+                scores[doc_index] += idf * tf * (self.k1 + 1) / (tf + self.k1 * length_norm)
+                matched[doc_index] += 1
+        if not scores:
+            return [], 0.0, 0
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        top_matched = matched[ranked[0][0]]
+        return [(self.documents[i], score) for i, score in ranked], top_matched / len(query_terms), top_matched
+
+    def save(self, path: str):
+        # 唯一的臨時文件加文件鎖，多個 worker 同時重建時不會互相覆蓋
+        directory = os.path.dirname(path)
+        with file_lock(directory):
+            atomic_write_json(path, {
+                "version": self.version,
+                "k1": self.k1,
+                "b": self.b,
+                "ids": self.ids,
+                "documents": self.documents,
+                "doc_lengths": self.doc_lengths,
+                "postings": self.postings,
+            })
+
+    @classmethod
+    def load(cls, path: str) -> Optional["LexicalIndex"]:
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        index = cls(k1=data["k1"], b=data["b"])
+        index.version = data["version"]
+        index.ids = data["ids"]
+        index.documents = data["documents"]
+        index.doc_lengths = data["doc_lengths"]
+        index.postings = {term: [tuple(p) for p in postings] for term, postings in data["postings"].items()}
+        index.avg_length = sum(index.doc_lengths) / len(index.doc_lengths) if index.doc_lengths else 0.0
+        return index
+
+
+def lexical_index_path(collection_name: str = DEFAULT_COLLECTION) -> str:
+    return os.path.join(os.getenv('VECTOR_INDEX_PATH', './vector_index'), collection_name, "lexical.json")
+
+
+def build_lexical_index(collection, version: str = None) -> LexicalIndex:
+    """從集合建立詞彙索引並保存到磁碟（匯入完成後調用）"""
+    if version is None:
+        version = str((collection.metadata or {}).get("ingest_version", "0"))
+    data = collection.get(include=["documents"])
+    index = LexicalIndex()
+    index.build(data["ids"], data["documents"], version)
+    index.save(lexical_index_path(collection.name))
+    logging.info(f"已建立詞彙索引: {len(index.documents)} 個文檔，{len(index.postings)} 個詞")
+    return index
+
+
+_indexes: Dict[str, LexicalIndex] = {}
+_index_lock = threading.Lock()
+
+
+def get_lexical_index(collection_name: str = DEFAULT_COLLECTION) -> LexicalIndex:
+    """返回與集合當前匯入版本一致的詞彙索引；版本不同時重新建立"""
+    registry = get_registry()
+    version = registry.get_collection_version(collection_name)
+    with _index_lock:
+        index = _indexes.get(collection_name)
+        if index is None:
+            index = LexicalIndex.load(lexical_index_path(collection_name))
+        if index is None or index.version != version:
+            index = build_lexical_index(registry.get_collection(collection_name), version)
+        _indexes[collection_name] = index
+        return index
@@ -0,0 +1,118 @@
+import json
+import logging
+import os
+import threading
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from rag.registry import get_registry, DEFAULT_COLLECTION
+from rag.snapshot_io import current_snapshot_dir, file_lock, new_snapshot_dir, publish_snapshot
+
+
+class NumpyVectorIndex:
+    # 快照在集合目錄下的子目錄，子類使用不同的文件格式
+    subdir = ""
+
+    def __init__(self, snapshot_dir: str = None, collection_name: str = DEFAULT_COLLECTION):
+        """從 ChromaDB 集合導出的進程內向量索引
+        所有向量存為一個連續、L2 歸一化的 float32 矩陣，查詢只需一次矩陣向量乘法。
+        快照以 .npy 保存在磁碟上，啟動時 memory-map 載入。
+        每次導出寫入一個新的快照目錄，再由 CURRENT 文件一次切換，讀者不會讀到新舊混合的快照。
+        Args:
+            snapshot_dir (str): 快照目錄
+            collection_name (str): 導出的集合名稱
+        """
+        self.collection_name = collection_name
+        self.snapshot_dir = os.path.join(
+            snapshot_dir or os.getenv('VECTOR_INDEX_PATH', './vector_index'),
+            collection_name,
+            self.subdir
+        )
+        self.vectors: Optional[np.ndarray] = None
+        self.ids: List[str] = []
+        self.documents: List[str] = []
+        self.version: Optional[str] = None
+
+    def _snapshot_files(self) -> List[str]:
+        return ["vectors.npy"]
+
+    def _load_vectors(self, directory: str):
+        self.vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r")
+
+    def _save_vectors(self, directory: str, vectors: np.ndarray):
+        np.save(os.path.join(directory, "vectors.npy"), vectors)
+
+    def load(self) -> bool:
+        """載入 CURRENT 指向的快照，沒有快照時返回 False"""
+        directory = current_snapshot_dir(self.snapshot_dir)
+        files = self._snapshot_files() + ["documents.json"]
+        if directory is None or not all(os.path.exists(os.path.join(directory, name)) for name in files):
+            return False
+        with open(os.path.join(directory, "documents.json"), encoding="utf-8") as f:
+            data = json.load(f)
+        self._load_vectors(directory)
+        self.ids = data["ids"]
+        self.documents = data["documents"]
+        self.version = data.get("version")
+        return True
+
+    def export(self, collection=None, version: str = None):
+        """把集合中的向量和文檔導出為快照並載入"""
+        registry = get_registry()
+        collection = collection or registry.get_collection(self.collection_name)
+        if version is None:
+            version = str((collection.metadata or {}).get("ingest_version", "0"))
+        data = collection.get(include=["embeddings", "documents"])
+        self.build(data["ids"], data["documents"], data["embeddings"], version)
+
+    def build(self, ids: List[str], documents: List[str], embeddings, version: str = None):
+        """把向量和文檔寫成快照並載入"""
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.size:
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        vectors = np.ascontiguousarray(vectors)
+
+        # 向量和文檔寫入同一個未發佈的目錄，寫完後一次切換 CURRENT；多個 worker 依次導出
+        with file_lock(self.snapshot_dir):
+            directory = new_snapshot_dir(self.snapshot_dir)
+            self._save_vectors(directory, vectors)
+            with open(os.path.join(directory, "documents.json"), "w", encoding="utf-8") as f:
+                json.dump({"ids": list(ids), "documents": list(documents), "version": version},
+                          f, ensure_ascii=False)
+            publish_snapshot(self.snapshot_dir, directory)
+        logging.info(f"已導出 {len(ids)} 個向量到 {self.snapshot_dir}（版本 {version}）")
+        self.load()
+
+    def search(self, query_vector: np.ndarray, k: int = 3) -> List[Tuple[str, float]]:
+        """返回相似度最高的 k 個 (文檔, 餘弦相似度)"""
+        if self.vectors is None or not len(self.documents):
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        scores = self.vectors @ query
+        k = min(k, scores.shape[0])
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.documents[i], float(scores[i])) for i in top]
+
+
+_indexes = {}
+_index_lock = threading.Lock()
+
+
+def get_numpy_index(collection_name: str = DEFAULT_COLLECTION,
+                    index_class=NumpyVectorIndex) -> NumpyVectorIndex:
+    """返回與集合當前匯入版本一致的索引；版本不同時重新導出"""
+    version = get_registry().get_collection_version(collection_name)
+    with _index_lock:
+        index = _indexes.get((index_class, collection_name))
+        if index is None:
+            index = index_class(collection_name=collection_name)
+            index.load()
+            _indexes[(index_class, collection_name)] = index
+        if index.version != version:
+            # 其他 worker 可能已經導出了這個版本
+            if not (index.load() and index.version == version):
+                index.export(version=version)
+        return index
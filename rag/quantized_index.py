@@ -0,0 +1,97 @@
+import os
+from typing import List, Tuple
+
+import numpy as np
+
+from rag.registry import DEFAULT_COLLECTION
+from rag.numpy_index import NumpyVectorIndex
+
+# 沒有 np.bitwise_count（NumPy < 2.0）時使用的每字節 1 的個數表
+_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint8)
+
+
+def sign_words(vectors: np.ndarray) -> np.ndarray:
+    """把每個向量的符號位打包成 uint64 字，不足 64 位的部分補零"""
+    bits = np.packbits(np.atleast_2d(vectors) > 0, axis=1)
+    padding = -bits.shape[1] % 8
+    if padding:
+        bits = np.pad(bits, ((0, 0), (0, padding)))
+    return np.ascontiguousarray(bits).view(np.uint64)
+
+
+def _popcount(words: np.ndarray) -> np.ndarray:
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words)
+    return _POPCOUNT[words.view(np.uint8)].reshape(len(words), 8).sum(axis=1, dtype=np.uint8)
+
+
+def hamming_distances(signs: np.ndarray, query_words: np.ndarray) -> np.ndarray:
+    """每個向量與查詢的漢明距離；signs 按字存放（形狀為 字數 x 向量數），每次處理一整列連續內存"""
+    distances = _popcount(np.bitwise_xor(signs[0], query_words[0])).astype(np.uint16)
+    for row, word in zip(signs[1:], query_words[1:]):
+        distances += _popcount(np.bitwise_xor(row, word))
+    return distances
+
+
+class QuantizedVectorIndex(NumpyVectorIndex):
+    subdir = "quantized"
+
+    def __init__(self, snapshot_dir: str = None, collection_name: str = DEFAULT_COLLECTION,
+                 rerank_factor: int = None):
+        """壓縮的磁碟向量索引：符號位二進制編碼 + float16 向量
+        查詢先用漢明距離掃描符號位編碼選出候選，再用候選的 float16 向量計算餘弦相似度排序。
+        掃描只讀每個向量（維度 / 8）字節的符號位；float16 向量以 memory-map 載入，只有候選行會被讀入，
+        多個 worker 進程共用同一份頁面緩存。
+        Args:
+            snapshot_dir (str): 快照目錄
+            collection_name (str): 導出的集合名稱
+            rerank_factor (int): 候選數量 = k * rerank_factor
+        """
+        super().__init__(snapshot_dir, collection_name)
+        self.rerank_factor = rerank_factor or int(os.getenv('QUANTIZED_RERANK_FACTOR', '20'))
+        self.signs = None
+
+    def _snapshot_files(self) -> List[str]:
+        return ["vectors_f16.npy", "signs.npy"]
+
+    def _load_vectors(self, directory: str):
+        self.vectors = np.load(os.path.join(directory, "vectors_f16.npy"), mmap_mode="r")
+        self.signs = np.load(os.path.join(directory, "signs.npy"), mmap_mode="r")
+
+    def _save_vectors(self, directory: str, vectors: np.ndarray):
+        if vectors.ndim != 2:
+            vectors = vectors.reshape(0, 0)
+        np.save(os.path.join(directory, "vectors_f16.npy"), vectors.astype(np.float16))
+        # 轉置存放，掃描時每個字是一段連續內存
+        np.save(os.path.join(directory, "signs.npy"), np.ascontiguousarray(sign_words(vectors).T))
+
+    def nbytes(self) -> int:
+        """索引文件佔用的字節數（不含文檔文本）"""
+        return sum(array.nbytes for array in (self.vectors, self.signs) if array is not None)
+
+    def scan_nbytes(self) -> int:
+        """每次查詢都要完整掃描的字節數（符號位編碼）"""
+        return self.signs.nbytes if self.signs is not None else 0
+
+    def search(self, query_vector: np.ndarray, k: int = 3) -> List[Tuple[str, float]]:
+        """返回相似度最高的 k 個 (文檔, 餘弦相似度)"""
+        if self.signs is None or not len(self.documents):
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        total = self.signs.shape[1]
+        k = min(k, total)
+
+        # 第一步：符號位漢明距離篩選候選
+        candidates_count = min(total, k * self.rerank_factor)
+        if candidates_count < total:
+            distances = hamming_distances(self.signs, sign_words(query)[0])
+            candidates = np.sort(np.argpartition(distances, candidates_count - 1)[:candidates_count])
+        else:
+            candidates = np.arange(total)
+
+        # 第二步：只讀取候選行的 float16 向量重新排序
+        scores = self.vectors[candidates].astype(np.float32) @ query
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.documents[candidates[i]], float(scores[i])) for i in top]
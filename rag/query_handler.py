@@ -1,40 +1,113 @@
-import chromadb
-from chromadb.utils import embedding_functions
-import os
-from dotenv import load_dotenv
 import logging
+import os
+from typing import List, Tuple
+from rag.registry import get_registry
+from rag.numpy_index import get_numpy_index, NumpyVectorIndex
+from rag.quantized_index import QuantizedVectorIndex
+from rag.lexical_index import get_lexical_index
+
+# Reciprocal Rank Fusion 的平滑常數
+RRF_K = 60
 
 class QueryHandler:
     def __init__(self):
-        load_dotenv()
-        self.embedding_function = embedding_functions.SentenceTransformerEmbeddingFunction(
-            model_name='sentence-transformers/all-MiniLM-L6-v2'
-        )
-        self.client = chromadb.PersistentClient(path=os.getenv('VECTOR_DB_PATH'))
-        self.collection = self.client.get_collection(
-            name="restaurant_info",
-            embedding_function=self.embedding_function
-        )
+        # 模型和 ChromaDB 客戶端由註冊表共用，建立 QueryHandler 不再重新載入
+        registry = get_registry()
+        self.registry = registry
+        # VECTOR_BACKEND=numpy 使用進程內 NumPy 索引，quantized 使用壓縮索引，默認使用 ChromaDB
+        self.backend = os.getenv('VECTOR_BACKEND', 'chroma').lower()
+        # 詞彙索引命中足夠明確時直接返回，否則與向量結果融合
+        self.lexical_enabled = os.getenv('LEXICAL_SEARCH', 'true').lower() == 'true'
+        self.lexical_min_coverage = float(os.getenv('LEXICAL_MIN_COVERAGE', '0.8'))
+        self.lexical_margin = float(os.getenv('LEXICAL_MARGIN', '1.5'))
+        # 多詞查詢至少要命中的詞數，以及直接返回所需的最低 BM25 分數
+        self.lexical_min_terms = int(os.getenv('LEXICAL_MIN_TERMS', '2'))
+        self.lexical_min_score = float(os.getenv('LEXICAL_MIN_SCORE', '1.0'))
+        self.embedding_function = registry.get_embedding_function()
+        self.client = registry.get_chroma_client()
+        self.collection = registry.get_collection("restaurant_info")
     
-    def process_query(self, query_text: str, k: int = 3) -> str:
+    def search(self, query_text: str, k: int = 3, query_embedding=None) -> List[Tuple[str, float]]:
+        """
+        搜索相關文檔
+        分數的尺度取決於結果來源：只有向量結果時是餘弦相似度，詞彙索引直接命中時是 BM25 分數，
+        兩者融合時是 RRF 分數。分數只能用於同一次結果內的排序，不能套用固定閾值；
+        需要餘弦相似度時請使用 vector_search。
+        :return: 按相關性從高到低排列的 (文檔, 分數) 列表
+        """
+        lexical = []
+        if self.lexical_enabled:
+            try:
+                lexical, coverage, matched = get_lexical_index("restaurant_info").search(query_text, k * 2)
+            except Exception as e:
+                logging.error(f"詞彙索引查詢出錯: {str(e)}")
+                lexical, coverage, matched = [], 0.0, 0
+            if self._lexical_confident(lexical, coverage, matched):
+                logging.info(f"詞彙索引直接命中（覆蓋率 {coverage:.2f}）")
+                return lexical[:k]
+
+        vector = self.vector_search(query_text, k * 2 if lexical else k, query_embedding)
+        if not lexical:
+            return vector[:k]
+        return self._fuse(vector, lexical, k)
+
+    def _lexical_confident(self, lexical: List[Tuple[str, float]], coverage: float, matched: int) -> bool:
+        """最高分文檔包含了大部分查詢詞、分數足夠高，並且明顯領先第二名"""
+        if not lexical or coverage < self.lexical_min_coverage:
+            return False
+        # 只有一個查詢詞時 coverage 為 1 已代表全部命中；多詞查詢需要命中足夠多的詞
+        if matched < self.lexical_min_terms and coverage < 1.0:
+            return False
+        if lexical[0][1] < self.lexical_min_score:
+            return False
+        return len(lexical) == 1 or lexical[0][1] >= self.lexical_margin * lexical[1][1]
+
+    @staticmethod
+    def _fuse(vector: List[Tuple[str, float]], lexical: List[Tuple[str, float]], k: int) -> List[Tuple[str, float]]:
+        """用 Reciprocal Rank Fusion 合併兩種排名，兩者分數的尺度不同，只使用名次"""
+        fused = {}
+        for results in (vector, lexical):
+            for rank, (document, _) in enumerate(results):
+                fused[document] = fused.get(document, 0.0) + 1.0 / (RRF_K + rank + 1)
+        return sorted(fused.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def vector_search(self, query_text: str, k: int = 3, query_embedding=None) -> List[Tuple[str, float]]:
+        """
+        只使用向量搜索
+        :return: 按相似度從高到低排列的 (文檔, 餘弦相似度) 列表
+        """
+        if query_embedding is None:
+            # 查詢向量只放進內存緩存，不寫入磁碟
+            query_embedding = self.registry.embed([query_text], normalize=True)[0]
+        if self.backend in ("numpy", "quantized"):
+            index_class = QuantizedVectorIndex if self.backend == "quantized" else NumpyVectorIndex
+            return get_numpy_index("restaurant_info", index_class).search(query_embedding, k)
+
+        results = self.collection.query(
+            query_embeddings=[list(map(float, query_embedding))],
+            n_results=k
+        )
+        # ChromaDB 默認返回平方 L2 距離，向量已歸一化時相似度 = 1 - d / 2
+        return [
+            (document, 1 - distance / 2)
+            for document, distance in zip(results['documents'][0], results['distances'][0])
+        ]
+
+    def process_query(self, query_text: str, k: int = 3, query_embedding=None) -> str:
         """
         處理用戶查詢
         :param query_text: 用戶的問題
         :param k: 返回的相關文檔數量
+        :param query_embedding: 已計算好的問題向量，傳入時不再重新 embedding
         :return: 相關回答
         """
         try:
-            # 搜索相關文檔
-            results = self.collection.query(
-                query_texts=[query_text],
-                n_results=k
-            )
-            
-            if not results['documents'][0]:
+            results = self.search(query_text, k, query_embedding)
+            if not results:
                 return "沒有找到相關資訊。"
             
-            return "\n\n".join(results['documents'][0])
+            return "\n\n".join(document for document, _ in results)
             
         except Exception as e:
             logging.error(f"查詢處理出錯: {str(e)}")
-            return "抱歉，處理您的問題時出現錯誤。" 
\ No newline at end of file
+            return "抱歉，處理您的問題時出現錯誤。" 
@@ -0,0 +1,192 @@
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+import chromadb
+import httpx
+import numpy as np
+from chromadb.api.types import EmbeddingFunction
+from dotenv import load_dotenv
+from openai import OpenAI
+
+from document_processor.embedding_cache import EmbeddingCache
+from rag.embedding_backends import create_embedding_backend
+
+EMBEDDING_MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
+DEFAULT_COLLECTION = "restaurant_info"
+
+
+class SharedEmbeddingFunction(EmbeddingFunction):
+    """讓 ChromaDB 使用註冊表中已載入的 embedding 模型
+    ChromaDB 只在寫入文檔時調用它（查詢都傳入已計算的向量），所以向量寫入磁碟緩存。
+    """
+
+    def __init__(self, registry: "ResourceRegistry"):
+        self._registry = registry
+
+    def __call__(self, input):
+        return self._registry.embed(list(input), persist=True).tolist()
+
+
+class ResourceRegistry:
+    def __init__(self):
+        """進程內共用的重型資源：embedding 模型、ChromaDB 客戶端和 OpenAI 客戶端
+
+        每個資源只會在第一次使用時建立一次，之後所有線程共用同一個實例。
+        """
+        load_dotenv()
+        self.vector_db_path = os.getenv('VECTOR_DB_PATH', './vector_db')
+        self._lock = threading.RLock()
+        self.embedding_backend_name = os.getenv('EMBEDDING_BACKEND', 'torch').lower()
+        self._embedding_backend = None
+        self._embedding_function = None
+        self._embedding_cache: Optional[EmbeddingCache] = None
+        self._chroma_clients: Dict[str, chromadb.ClientAPI] = {}
+        self._collections: Dict[str, object] = {}
+        self._collection_loaded_at: Dict[str, float] = {}
+        self._openai_client: Optional[OpenAI] = None
+
+    def get_embedding_backend(self):
+        """返回已載入的 embedding 後端（EMBEDDING_BACKEND: torch / onnx / onnx-int8）"""
+        if self._embedding_backend is None:
+            with self._lock:
+                if self._embedding_backend is None:
+                    self._embedding_backend = create_embedding_backend(
+                        EMBEDDING_MODEL_NAME, self.embedding_backend_name
+                    )
+        return self._embedding_backend
+
+    def get_embedding_cache(self) -> Optional[EmbeddingCache]:
+        """返回持久化的 embedding 緩存；EMBEDDING_CACHE=false 時返回 None"""
+        if os.getenv('EMBEDDING_CACHE', 'true').lower() != 'true':
+            return None
+        if self._embedding_cache is None:
+            with self._lock:
+                if self._embedding_cache is None:
+                    self._embedding_cache = EmbeddingCache(
+                        directory=os.getenv('EMBEDDING_CACHE_DIR', './embedding_cache'),
+                        # 量化等後端的向量與 fp32 不同，分開緩存
+                        model_name=EMBEDDING_MODEL_NAME + (
+                            "" if self.embedding_backend_name == "torch" else "@" + self.embedding_backend_name
+                        ),
+                        dtype=os.getenv('EMBEDDING_CACHE_DTYPE', 'float16'),
+                        memory_size=int(os.getenv('EMBEDDING_CACHE_MEMORY_SIZE', '10000'))
+                    )
+        return self._embedding_cache
+
+    def embed(self, texts: List[str], normalize: bool = False, persist: bool = False) -> np.ndarray:
+        """計算文本向量，已計算過的文本直接從緩存讀取
+        Args:
+            texts (list): 文本列表
+            normalize (bool): 是否返回 L2 歸一化的向量
+            persist (bool): 新向量是否寫入磁碟緩存；只有匯入的文檔需要，用戶查詢只放進內存
+        """
+        def encode(batch):
+            return self.get_embedding_backend().encode(batch)
+
+        cache = self.get_embedding_cache()
+        vectors = (cache.encode(texts, encode, persist=persist) if cache
+                   else np.asarray(encode(texts), dtype=np.float32))
+        if normalize and len(vectors):
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.maximum(norms, 1e-12)
+        return vectors.astype(np.float32)
+
+    def get_embedding_function(self) -> SharedEmbeddingFunction:
+        """返回 ChromaDB 使用的 embedding 函數"""
+        if self._embedding_function is None:
+            with self._lock:
+                if self._embedding_function is None:
+                    self._embedding_function = SharedEmbeddingFunction(self)
+        return self._embedding_function
+
+    def get_chroma_client(self, path: str = None):
+        """返回指定路徑的 ChromaDB 客戶端，同一路徑只建立一次"""
+        path = path or self.vector_db_path
+        with self._lock:
+            client = self._chroma_clients.get(path)
+            if client is None:
+                client = chromadb.PersistentClient(path=path)
+                self._chroma_clients[path] = client
+            return client
+
+    def get_collection(self, name: str = DEFAULT_COLLECTION, create: bool = False):
+        """返回預設向量數據庫中的集合句柄"""
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is None:
+                client = self.get_chroma_client()
+                if create:
+                    collection = client.get_or_create_collection(
+                        name=name,
+                        embedding_function=self.get_embedding_function()
+                    )
+                else:
+                    collection = client.get_collection(
+                        name=name,
+                        embedding_function=self.get_embedding_function()
+                    )
+                self._collections[name] = collection
+                self._collection_loaded_at[name] = time.monotonic()
+            return collection
+
+    def invalidate_collection(self, name: str = DEFAULT_COLLECTION):
+        """集合被刪除或重建後，丟棄舊的句柄"""
+        with self._lock:
+            self._collections.pop(name, None)
+
+    def get_collection_version(self, name: str = DEFAULT_COLLECTION, max_age: float = 60) -> str:
+        """返回集合的匯入版本（由匯入流程寫入集合 metadata）
+
+        句柄超過 max_age 秒會重新獲取，以便察覺其他進程重新匯入了集合。
+        """
+        with self._lock:
+            loaded_at = self._collection_loaded_at.get(name, 0)
+            if time.monotonic() - loaded_at > max_age:
+                self._collections.pop(name, None)
+            collection = self.get_collection(name)
+        return str((collection.metadata or {}).get("ingest_version", "0"))
+
+    def get_openai_client(self) -> OpenAI:
+        """返回共用的 OpenAI 客戶端（底層使用連接池）"""
+        if self._openai_client is None:
+            with self._lock:
+                if self._openai_client is None:
+                    max_connections = int(os.getenv('OPENAI_MAX_CONNECTIONS', '20'))
+                    http_client = httpx.Client(
+                        limits=httpx.Limits(
+                            max_connections=max_connections,
+                            max_keepalive_connections=max_connections
+                        ),
+                        timeout=float(os.getenv('OPENAI_TIMEOUT', '60'))
+                    )
+                    self._openai_client = OpenAI(
+                        api_key=os.getenv('OPENAI_API_KEY'),
+                        http_client=http_client
+                    )
+        return self._openai_client
+
+    def warm(self):
+        """預先載入模型和集合，避免第一條訊息承擔載入時間"""
+        self.get_openai_client()
+        try:
+            self.get_embedding_backend()
+            self.get_collection()
+        except Exception as e:
+            logging.warning(f"預載向量資源時出錯: {str(e)}")
+
+
+_registry: Optional[ResourceRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> ResourceRegistry:
+    """返回進程內唯一的資源註冊表"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ResourceRegistry()
+    return _registry
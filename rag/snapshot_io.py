@@ -0,0 +1,78 @@
+import json
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows 沒有 fcntl，只保證單進程安全
+    fcntl = None
+
+CURRENT_FILE = "CURRENT"
+
+
+@contextmanager
+def file_lock(directory: str):
+    """目錄級的進程間排他鎖，多個 worker 同時導出快照時依次進行"""
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, ".lock"), "a") as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def atomic_write_text(path: str, text: str):
+    """寫入同目錄下的唯一臨時文件後再替換，讀者只會看到舊內容或完整的新內容"""
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def atomic_write_json(path: str, data):
+    atomic_write_text(path, json.dumps(data, ensure_ascii=False))
+
+
+def new_snapshot_dir(root: str) -> str:
+    """在 root 下建立一個尚未發佈的快照目錄，文件寫完後用 publish_snapshot 切換"""
+    return tempfile.mkdtemp(prefix="snapshot-", dir=root)
+
+
+def publish_snapshot(root: str, snapshot_dir: str, keep: int = 2):
+    """把 CURRENT 指向新快照（一次 rename），並刪除較舊的快照目錄
+    保留最近 keep 個快照，剛讀到舊 CURRENT 的讀者仍然可以打開它指向的文件。
+    """
+    atomic_write_text(os.path.join(root, CURRENT_FILE), os.path.basename(snapshot_dir))
+    snapshots = sorted(
+        (entry for entry in os.scandir(root) if entry.is_dir() and entry.name.startswith("snapshot-")),
+        key=lambda entry: entry.stat().st_mtime,
+        reverse=True
+    )
+    for entry in snapshots[keep:]:
+        if entry.path != snapshot_dir:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def current_snapshot_dir(root: str) -> Optional[str]:
+    """返回 CURRENT 指向的快照目錄，沒有已發佈的快照時返回 None"""
+    try:
+        with open(os.path.join(root, CURRENT_FILE), encoding="utf-8") as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    path = os.path.join(root, name)
+    return path if name and os.path.isdir(path) else None
@@ -0,0 +1,78 @@
+import sys
+import os
+import time
+import argparse
+import logging
+from dotenv import load_dotenv
+
+# 添加項目根目錄到 Python 路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from rag.registry import EMBEDDING_MODEL_NAME
+from rag.embedding_backends import create_embedding_backend
+
+SAMPLE_TEXTS = [
+    "你們幾點開門？",
+    "餐廳地址在哪裡？",
+    "請問有沒有素食選擇？",
+    "我想訂今晚七點四位",
+    "Do you have vegetarian options?",
+    "招牌燒鵝飯一份幾多錢？",
+    "可唔可以包場搞生日會？",
+    "What time do you close on Sundays?",
+]
+
+
+def load_texts(pdf_path: str, limit: int):
+    """優先使用知識庫 PDF 的段落，沒有時使用示例句子"""
+    if pdf_path and os.path.exists(pdf_path):
+        from rag.ingestion import extract_pages
+        import pdfplumber
+
+        with pdfplumber.open(pdf_path) as pdf:
+            page_count = len(pdf.pages)
+        texts = [p for _, paragraphs in extract_pages(pdf_path, 0, page_count) for p in paragraphs]
+        if texts:
+            return (texts * (limit // len(texts) + 1))[:limit]
+    return (SAMPLE_TEXTS * (limit // len(SAMPLE_TEXTS) + 1))[:limit]
+
+
+def normalize(vectors):
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def benchmark(backends, texts, batch_size: int, threads: int):
+    baseline = None
+    print(f"文本數量: {len(texts)}，batch_size={batch_size}，threads={threads or '默認'}")
+    print(f"{'後端':<12}{'載入 (s)':>10}{'文本/秒':>12}{'平均 cos':>12}{'最低 cos':>12}")
+    for name in backends:
+        start = time.perf_counter()
+        backend = create_embedding_backend(EMBEDDING_MODEL_NAME, name, batch_size, threads)
+        load_seconds = time.perf_counter() - start
+
+        backend.encode(texts[:batch_size])  # 預熱
+        start = time.perf_counter()
+        vectors = normalize(backend.encode(texts))
+        throughput = len(texts) / (time.perf_counter() - start)
+
+        if baseline is None:
+            baseline = vectors
+        agreement = np.sum(vectors * baseline, axis=1)
+        print(f"{name:<12}{load_seconds:>10.2f}{throughput:>12.1f}{agreement.mean():>12.4f}{agreement.min():>12.4f}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="比較 embedding 後端的吞吐量和與 fp32 基準的餘弦一致度")
+    parser.add_argument("--backends", default="torch,onnx,onnx-int8",
+                        help="逗號分隔的後端列表，第一個作為基準")
+    parser.add_argument("--texts", type=int, default=512, help="測試文本數量")
+    parser.add_argument("--batch-size", type=int, default=32, help="每批文本數量")
+    parser.add_argument("--threads", type=int, default=None, help="intra-op 線程數")
+    parser.add_argument("--pdf", default=os.getenv('PDF_SOURCE_PATH'), help="用於取樣文本的 PDF")
+    args = parser.parse_args()
+
+    benchmark(args.backends.split(","), load_texts(args.pdf, args.texts), args.batch_size, args.threads)
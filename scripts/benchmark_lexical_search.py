@@ -0,0 +1,78 @@
+import sys
+import os
+import time
+import argparse
+import logging
+from dotenv import load_dotenv
+
+# 添加項目根目錄到 Python 路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from rag.query_handler import QueryHandler
+from rag.lexical_index import get_lexical_index
+
+# (查詢, 相關段落必須包含的關鍵字)
+SAMPLE_QUERIES = [
+    ("地址", "地址"),
+    ("你哋地址喺邊？", "地址"),
+    ("電話", "電話"),
+    ("電話號碼幾多？", "電話"),
+    ("營業時間", "營業"),
+    ("你哋幾點開門？", "營業"),
+    ("有冇停車場？", "停車"),
+    ("招牌菜係咩？", "招牌"),
+    ("有冇素食？", "素"),
+    ("可唔可以包場？", "包場"),
+]
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q) * 1000) if values else 0.0
+
+
+def benchmark(k: int, rounds: int):
+    load_dotenv()
+    handler = QueryHandler()
+    index = get_lexical_index("restaurant_info")
+
+    # 只評估知識庫中確實存在相關段落的查詢
+    queries = [(query, keyword) for query, keyword in SAMPLE_QUERIES
+               if any(keyword in document for document in index.documents)]
+    if not queries:
+        print("知識庫中沒有與示例查詢相關的段落")
+        return
+
+    results = {}
+    for name, search in (("vector", handler.vector_search), ("hybrid", handler.search)):
+        times, hits = [], 0
+        for round_number in range(rounds):
+            for query, keyword in queries:
+                start = time.perf_counter()
+                documents = [document for document, _ in search(query, k)]
+                times.append(time.perf_counter() - start)
+                if round_number == 0 and any(keyword in document for document in documents):
+                    hits += 1
+        results[name] = (times, hits / len(queries))
+
+    lexical_only = sum(
+        1 for query, _ in queries
+        if handler._lexical_confident(*index.search(query, k * 2))
+    )
+
+    print(f"文檔數量: {len(index.documents)}，查詢數量: {len(queries)}，k={k}，重複 {rounds} 次")
+    print(f"{'路徑':<8}{'p50 (ms)':>12}{'p95 (ms)':>12}{'recall@' + str(k):>12}")
+    for name, (times, recall) in results.items():
+        print(f"{name:<8}{percentile(times, 50):>12.3f}{percentile(times, 95):>12.3f}{recall:>12.2%}")
+    print(f"只用詞彙索引即可回答的查詢: {lexical_only}/{len(queries)}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(description="比較純向量搜索和詞彙+向量混合搜索的延遲與召回率")
+    parser.add_argument("--k", type=int, default=3, help="每次查詢返回的文檔數量")
+    parser.add_argument("--rounds", type=int, default=10, help="每條查詢重複次數")
+    args = parser.parse_args()
+
+    benchmark(args.k, args.rounds)
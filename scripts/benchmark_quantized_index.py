@@ -0,0 +1,91 @@
+import sys
+import os
+import time
+import argparse
+import logging
+import tempfile
+from dotenv import load_dotenv
+
+# 添加項目根目錄到 Python 路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from rag.numpy_index import NumpyVectorIndex
+from rag.quantized_index import QuantizedVectorIndex
+
+
+def load_corpus(synthetic: int, dim: int, queries: int):
+    """返回 (ids, 向量, 查詢向量)；synthetic > 0 時生成隨機數據模擬大型知識庫"""
+    rng = np.random.default_rng(42)
+    if synthetic:
+        # 帶有簇結構的隨機向量，比均勻分佈更接近真實 embedding
+        centers = rng.normal(size=(max(synthetic // 50, 1), dim))
+        vectors = centers[rng.integers(0, len(centers), synthetic)] + 0.5 * rng.normal(size=(synthetic, dim))
+        ids = [f"doc_{i}" for i in range(synthetic)]
+    else:
+        from rag.registry import get_registry
+
+        data = get_registry().get_collection("restaurant_info").get(include=["embeddings"])
+        ids, vectors = data["ids"], np.asarray(data["embeddings"])
+    vectors = np.asarray(vectors, dtype=np.float32)
+    # 查詢使用加了噪聲的文檔向量
+    picks = rng.integers(0, len(vectors), queries)
+    query_vectors = vectors[picks] + 0.3 * rng.normal(size=(queries, vectors.shape[1])).astype(np.float32)
+    return ids, vectors, query_vectors
+
+
+def timed_search(index, query_vectors, k):
+    times, results = [], []
+    for query in query_vectors:
+        start = time.perf_counter()
+        results.append([document for document, _ in index.search(query, k)])
+        times.append(time.perf_counter() - start)
+    return np.array(times) * 1000, results
+
+
+def benchmark(synthetic: int, dim: int, queries: int, k: int, rerank_factors):
+    load_dotenv()
+    ids, vectors, query_vectors = load_corpus(synthetic, dim, queries)
+
+    with tempfile.TemporaryDirectory() as snapshot_dir:
+        exact = NumpyVectorIndex(snapshot_dir=snapshot_dir, collection_name="benchmark")
+        # 文檔內容使用 id，召回率按 id 比較
+        exact.build(ids, ids, vectors)
+        exact_times, exact_results = timed_search(exact, query_vectors, k)
+
+        print(f"向量數量: {len(ids)}，維度: {vectors.shape[1]}，查詢: {queries}，k={k}")
+        exact_p50 = np.percentile(exact_times, 50)
+        print(f"{'索引':<20}{'大小 (MB)':>12}{'掃描 (MB)':>12}{'p50 (ms)':>12}{'p95 (ms)':>12}"
+              f"{'對比精確':>10}{'recall@' + str(k):>12}")
+        print(f"{'exact float32':<20}{exact.vectors.nbytes / 1e6:>12.2f}{exact.vectors.nbytes / 1e6:>12.2f}"
+              f"{exact_p50:>12.3f}{np.percentile(exact_times, 95):>12.3f}{1:>10.2f}x{1:>12.2%}")
+
+        for factor in rerank_factors:
+            index = QuantizedVectorIndex(snapshot_dir=snapshot_dir, collection_name="benchmark",
+                                         rerank_factor=factor)
+            index.build(ids, ids, vectors)
+            times, results = timed_search(index, query_vectors, k)
+            recall = np.mean([
+                len(set(found) & set(expected)) / len(expected)
+                for found, expected in zip(results, exact_results)
+            ])
+            p50 = np.percentile(times, 50)
+            name = f"sign+f16 x{factor}"
+            print(f"{name:<20}{index.nbytes() / 1e6:>12.2f}{index.scan_nbytes() / 1e6:>12.2f}"
+                  f"{p50:>12.3f}{np.percentile(times, 95):>12.3f}{exact_p50 / p50:>10.2f}x{recall:>12.2%}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(description="比較量化索引和精確索引的大小、延遲和召回率")
+    parser.add_argument("--synthetic", type=int, default=0,
+                        help="生成指定數量的隨機向量，0 表示使用 restaurant_info 集合")
+    parser.add_argument("--dim", type=int, default=384, help="隨機向量的維度")
+    parser.add_argument("--queries", type=int, default=200, help="查詢數量")
+    parser.add_argument("--k", type=int, default=3, help="每次查詢返回的文檔數量")
+    parser.add_argument("--rerank-factors", default="10,20,40", help="逗號分隔的候選倍數")
+    args = parser.parse_args()
+
+    benchmark(args.synthetic, args.dim, args.queries, args.k,
+              [int(factor) for factor in args.rerank_factors.split(",")])
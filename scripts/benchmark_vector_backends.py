@@ -0,0 +1,81 @@
+import sys
+import os
+import time
+import argparse
+import logging
+from dotenv import load_dotenv
+
+# 添加項目根目錄到 Python 路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from rag.registry import get_registry
+from rag.numpy_index import NumpyVectorIndex
+
+SAMPLE_QUERIES = [
+    "你們幾點開門？",
+    "餐廳地址在哪裡？",
+    "有什麼招牌菜？",
+    "有素食選擇嗎？",
+    "可以包場嗎？",
+    "有沒有兒童餐？",
+    "可以帶寵物嗎？",
+    "有停車位嗎？",
+    "套餐價格多少？",
+    "甜品有什麼？",
+]
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q) * 1000) if values else 0.0
+
+
+def benchmark(queries, k: int, rounds: int):
+    load_dotenv()
+    registry = get_registry()
+    collection = registry.get_collection("restaurant_info")
+
+    # 向量只計算一次，兩種後端比較的是純檢索耗時
+    vectors = registry.embed(queries, normalize=True)
+
+    start = time.perf_counter()
+    index = NumpyVectorIndex()
+    index.export(collection)
+    export_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index = NumpyVectorIndex()
+    index.load()
+    load_seconds = time.perf_counter() - start
+
+    chroma_times, numpy_times = [], []
+    overlap = []
+    for _ in range(rounds):
+        for vector in vectors:
+            start = time.perf_counter()
+            chroma_docs = collection.query(query_embeddings=[vector.tolist()], n_results=k)['documents'][0]
+            chroma_times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            numpy_docs = [doc for doc, _ in index.search(vector, k)]
+            numpy_times.append(time.perf_counter() - start)
+
+            overlap.append(len(set(chroma_docs) & set(numpy_docs)) / max(len(chroma_docs), 1))
+
+    print(f"文檔數量: {len(index.documents)}，查詢次數: {len(chroma_times)}，k={k}")
+    print(f"快照導出: {export_seconds * 1000:.1f}ms，快照載入: {load_seconds * 1000:.2f}ms")
+    print(f"{'後端':<8}{'p50 (ms)':>12}{'p95 (ms)':>12}{'p99 (ms)':>12}")
+    for name, times in (("chroma", chroma_times), ("numpy", numpy_times)):
+        print(f"{name:<8}{percentile(times, 50):>12.3f}{percentile(times, 95):>12.3f}{percentile(times, 99):>12.3f}")
+    print(f"top-{k} 結果重合率: {np.mean(overlap):.2%}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="比較 ChromaDB 和 NumPy 向量索引的查詢速度")
+    parser.add_argument("--k", type=int, default=3, help="每次查詢返回的文檔數量")
+    parser.add_argument("--rounds", type=int, default=20, help="每條查詢重複次數")
+    args = parser.parse_args()
+
+    benchmark(SAMPLE_QUERIES, args.k, args.rounds)
@@ -0,0 +1,36 @@
+import sys
+import os
+import argparse
+import logging
+from dotenv import load_dotenv
+
+# 添加項目根目錄到 Python 路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models.chat_history import ChatHistory
+from app.models.migrations import run_migrations, check_query_plans
+
+
+def main(db_path: str) -> int:
+    """在指定數據庫（默認為臨時空數據庫）上檢查熱點查詢的執行計劃，有查詢沒有使用索引時返回 1"""
+    load_dotenv()
+    chat_history = ChatHistory(db_path=db_path)
+    chat_history.init_db()
+    run_migrations(chat_history)
+
+    failed = 0
+    for name, (ok, plan) in check_query_plans(chat_history).items():
+        print(f"{'✅' if ok else '❌'} {name}")
+        for step in plan:
+            print(f"    {step}")
+        failed += not ok
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(description="查詢計劃回歸檢查：確認歷史和訂位查詢使用索引而不是全表掃描")
+    parser.add_argument("--db-path", default=":memory:", help="數據庫路徑，默認使用內存數據庫")
+    args = parser.parse_args()
+
+    sys.exit(main(args.db_path))
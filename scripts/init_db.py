@@ -7,6 +7,7 @@ from dotenv import load_dotenv
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app.models.chat_history import ChatHistory
+from app.models.migrations import run_migrations, get_schema_version
 
 def init_database():
     load_dotenv()
@@ -32,6 +33,13 @@ def init_database():
         # 初始化數據庫表
         chat_history.init_db()
         
+        # 套用尚未執行的數據庫遷移（索引等）
+        applied = run_migrations(chat_history)
+        logging.info(
+            f"數據庫結構版本: {get_schema_version(chat_history)}"
+            + (f"（本次套用 {applied}）" if applied else "")
+        )
+        
         # 添加測試數據
         chat_history.add_chat_record(
             wa_id="test_user",
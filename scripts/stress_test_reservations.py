@@ -0,0 +1,105 @@
+import sys
+import os
+import time
+import random
+import argparse
+import logging
+import tempfile
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+# 添加項目根目錄到 Python 路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models.chat_history import ChatHistory
+from app.models.migrations import run_migrations
+from app.services.reservation_capacity import ReservationCapacity, slot_of
+
+DATE = "2025-12-24"
+TIMES = ["18:00", "18:10", "18:30", "18:45", "19:00", "19:15", "19:30", "20:00", "20:20", "21:00"]
+
+
+def book_many(db_path: str, attempts: int, max_per_slot: int, seed: int):
+    """在一個進程中用多個線程並發訂位，返回 (成功數, 滿額數, 耗時列表)"""
+    capacity = ReservationCapacity(ChatHistory(db_path=db_path), max_per_slot)
+    rng = random.Random(seed)
+    requests = [rng.choice(TIMES) for _ in range(attempts)]
+
+    def attempt(i):
+        start = time.perf_counter()
+        booked, _ = capacity.book(f"user_{seed}_{i}", "壓力測試", DATE, requests[i], 2)
+        return booked, time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(attempt, range(attempts)))
+    booked = sum(1 for ok, _ in results if ok)
+    return booked, attempts - booked, [seconds for _, seconds in results]
+
+
+def _worker(args):
+    return book_many(*args)
+
+
+def stress_test(processes: int, attempts: int, max_per_slot: int, daily: int):
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, "stress.db")
+        chat_history = ChatHistory(db_path=db_path)
+        chat_history.init_db()
+        run_migrations(chat_history)
+
+        # 多進程 + 多線程同時搶同一天的少數時段
+        start = time.perf_counter()
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.map(_worker, [(db_path, attempts, max_per_slot, seed) for seed in range(processes)])
+        elapsed = time.perf_counter() - start
+
+        booked = sum(result[0] for result in results)
+        rejected = sum(result[1] for result in results)
+        latencies = sorted(seconds for result in results for seconds in result[2])
+
+        with chat_history.get_db_connection() as conn:
+            rows = conn.execute(
+                'SELECT reservation_time FROM table_reservations WHERE reservation_date = ? AND status != ?',
+                (DATE, '已取消')
+            ).fetchall()
+            counters = dict(conn.execute(
+                'SELECT slot, booked FROM reservation_slots WHERE reservation_date = ?', (DATE,)
+            ).fetchall())
+
+        per_slot = {}
+        for (time_str,) in rows:
+            per_slot[slot_of(time_str)] = per_slot.get(slot_of(time_str), 0) + 1
+        overbooked = {slot: count for slot, count in per_slot.items() if count > max_per_slot}
+        mismatched = {slot for slot in set(per_slot) | set(counters) if per_slot.get(slot, 0) != counters.get(slot, 0)}
+
+        print(f"並發訂位: {processes} 個進程 x {attempts} 次嘗試，每時段上限 {max_per_slot}")
+        print(f"成功 {booked}，時段已滿 {rejected}，耗時 {elapsed:.2f}s")
+        print(f"訂位延遲 p50 {latencies[len(latencies) // 2] * 1000:.2f}ms，"
+              f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f}ms")
+
+        # 大量訂位後的容量檢查仍然是單次主鍵查詢
+        capacity = ReservationCapacity(chat_history, daily)
+        for i in range(daily):
+            capacity.book(f"bulk_{i}", "批量", "2025-12-25", f"{11 + i % 11:02d}:{(i * 7) % 60:02d}", 2)
+        start = time.perf_counter()
+        for _ in range(1000):
+            capacity.occupancy("2025-12-25", "19:00")
+        print(f"{daily} 個訂位的日子，容量查詢平均 {(time.perf_counter() - start) * 1000:.3f}µs")
+
+        if overbooked or mismatched:
+            print(f"❌ 超賣時段: {overbooked}，計數不一致: {sorted(mismatched)}")
+            return 1
+        print("✅ 沒有超賣，時段計數與訂位記錄一致")
+        return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(description="並發訂位壓力測試：驗證時段容量不會被超賣")
+    parser.add_argument("--processes", type=int, default=4, help="並發進程數量")
+    parser.add_argument("--attempts", type=int, default=200, help="每個進程的訂位嘗試次數")
+    parser.add_argument("--max-per-slot", type=int, default=3, help="每個時段的容量上限")
+    parser.add_argument("--daily", type=int, default=5000, help="容量查詢測試中一天的訂位數量")
+    args = parser.parse_args()
+
+    sys.exit(stress_test(args.processes, args.attempts, args.max_per_slot, args.daily))
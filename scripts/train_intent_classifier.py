@@ -0,0 +1,105 @@
+import sys
+import os
+import math
+import time
+import random
+import logging
+import argparse
+from typing import Dict, List, Tuple
+from dotenv import load_dotenv
+
+# 添加項目根目錄到 Python 路徑
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models.chat_history import ChatHistory
+from app.services.intent_classifier import EmbeddingIntentClassifier, SEED_EXAMPLES
+
+
+def stratified_split(examples: Dict[str, List[str]], fraction: float, seed: int = 42):
+    """每個類別各留出 fraction 的樣本作為評估集；只有一個樣本的類別全部用於訓練"""
+    rng = random.Random(seed)
+    train, holdout = {}, []
+    for label, texts in examples.items():
+        texts = list(texts)
+        rng.shuffle(texts)
+        count = math.ceil(len(texts) * fraction) if len(texts) > 1 else 0
+        holdout.extend((label, text) for text in texts[:count])
+        train[label] = texts[count:]
+    return train, holdout
+
+
+def merge_examples(*sources: Dict[str, List[str]]) -> Dict[str, List[str]]:
+    labels = set().union(*sources)
+    return {label: [text for source in sources for text in source.get(label, [])] for label in labels}
+
+
+def evaluate(classifier: EmbeddingIntentClassifier, labelled: List[Tuple[str, str]], title: str):
+    avoided = agreed = 0
+    start = time.monotonic()
+    for label, text in labelled:
+        result = classifier.predict(text)
+        if result["confidence"] >= classifier.threshold:
+            avoided += 1
+            agreed += result["category"] == label
+    avg_local_ms = (time.monotonic() - start) / len(labelled) * 1000
+
+    print(f"\n評估報告（{title}）:")
+    print(f"  評估訊息數: {len(labelled)}")
+    print(f"  信心閾值: {classifier.threshold}")
+    print(f"  可避免的 LLM 調用: {avoided} ({avoided / len(labelled):.1%})")
+    if avoided:
+        print(f"  本地分類與 LLM 一致率: {agreed / avoided:.1%}")
+    print(f"  本地分類平均耗時: {avg_local_ms:.1f}ms")
+
+
+def train_intent_classifier(db_path: str, limit_per_category: int, report_only: bool = False,
+                            holdout_fraction: float = 0.2, seed: int = 42):
+    load_dotenv()
+    chat_history = ChatHistory(db_path=db_path)
+    classifier = EmbeddingIntentClassifier()
+
+    # 讀取由 LLM 標註過的訊息
+    db_examples = EmbeddingIntentClassifier.load_examples_from_db(chat_history, limit_per_category)
+    labelled = [(label, text) for label, texts in db_examples.items() for text in texts]
+
+    if report_only:
+        # 現有模型可能已用這些記錄訓練過，數字只反映樣本內表現
+        if labelled:
+            evaluate(classifier, labelled, "現有模型，樣本內")
+        else:
+            print("數據庫中沒有可評估的標註記錄")
+        return
+
+    # 先用留出集評估：模型沒見過這些記錄，一致率才有參考價值
+    train_split, holdout = stratified_split(db_examples, holdout_fraction, seed)
+    if holdout:
+        classifier.train(merge_examples(SEED_EXAMPLES, train_split))
+        evaluate(classifier, holdout, f"留出 {holdout_fraction:.0%}")
+    else:
+        print("數據庫中沒有足夠的標註記錄可以留出評估")
+
+    # 評估完成後用全部樣本重新訓練並保存
+    counts = classifier.train(merge_examples(SEED_EXAMPLES, db_examples))
+    classifier.save()
+    print("\n✅ 本地分類模型訓練完成（使用全部樣本）")
+    for label, count in sorted(counts.items()):
+        print(f"  {label}: {count} 個樣本")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    parser = argparse.ArgumentParser(description="從 chat_history 重新訓練本地意圖分類器")
+    parser.add_argument("--db-path", default=os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'db', 'chat_history.db'
+    ))
+    parser.add_argument("--limit-per-category", type=int, default=500)
+    parser.add_argument("--report-only", action="store_true", help="只評估現有模型，不重新訓練")
+    parser.add_argument("--holdout", type=float, default=0.2, help="每個類別留作評估的比例")
+    parser.add_argument("--seed", type=int, default=42, help="劃分評估集的隨機種子")
+    args = parser.parse_args()
+
+    train_intent_classifier(args.db_path, args.limit_per_category, args.report_only, args.holdout, args.seed)
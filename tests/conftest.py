@@ -0,0 +1,4 @@
+import os
+
+# openai_service 在導入時建立客戶端，測試中不會真的調用 OpenAI
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
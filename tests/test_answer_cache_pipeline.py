@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from app.services.pipeline import MessagePipeline
+from app.services.semantic_cache import SemanticAnswerCache
+from app.utils import whatsapp_utils
+
+
+class FakeRegistry:
+    def get_collection_version(self):
+        return "v1"
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    calls = {"retrieve": 0, "shared": [], "assistant": 0, "thread": []}
+    cache = SemanticAnswerCache(threshold=0.9)
+    monkeypatch.setattr(cache, "embed", lambda text: np.array([1.0, 0.0], dtype=np.float32))
+    monkeypatch.setattr(whatsapp_utils, "get_answer_cache", lambda: cache)
+    monkeypatch.setattr(whatsapp_utils, "get_registry", lambda: FakeRegistry())
+
+    def retrieve(message_body, query_vector=None, k=3):
+        calls["retrieve"] += 1
+        return "營業時間：11:00-22:00"
+
+    def shared(message_body, context):
+        calls["shared"].append(context)
+        return "我哋 11 點開門"
+
+    def assistant(*args, **kwargs):
+        calls["assistant"] += 1
+        return "私人回覆"
+
+    monkeypatch.setattr(whatsapp_utils, "retrieve_context", retrieve)
+    monkeypatch.setattr(whatsapp_utils, "generate_shared_response", shared)
+    monkeypatch.setattr(whatsapp_utils, "openai_generate_response", assistant)
+    monkeypatch.setattr(whatsapp_utils, "append_to_thread",
+                        lambda wa_id, name, question, answer: calls["thread"].append((wa_id, question, answer)))
+    return calls
+
+
+def run(wa_id, text):
+    def classify(ctx):
+        ctx.classification = {"category": "restaurant_info"}
+
+    pipeline = MessagePipeline([
+        ("parse", whatsapp_utils.parse_stage),
+        ("classify", classify),
+        ("answer_cache", whatsapp_utils.answer_cache_stage),
+        ("retrieve", whatsapp_utils.retrieve_stage),
+        ("generate", whatsapp_utils.generate_stage),
+        ("thread_sync", whatsapp_utils.thread_sync_stage),
+    ])
+    message = {"id": f"m-{wa_id}", "type": "text", "text": {"body": text}}
+    return pipeline.run(message, {"wa_id": wa_id})
+
+
+def test_cacheable_answers_are_generated_without_the_customer_thread(calls):
+    ctx = run("alice", "幾點開門")
+
+    assert ctx.response == "我哋 11 點開門"
+    assert calls["shared"] == ["營業時間：11:00-22:00"]
+    assert calls["assistant"] == 0
+    assert calls["thread"] == [("alice", "幾點開門", "我哋 11 點開門")]
+
+
+def test_cache_hit_skips_retrieval_and_is_recorded_on_the_thread(calls):
+    run("alice", "幾點開門")
+    ctx = run("bob", "幾點開門呀")
+
+    assert ctx.answer_source == "cache"
+    assert ctx.response == "我哋 11 點開門"
+    assert calls["retrieve"] == 1
+    assert len(calls["shared"]) == 1
+    assert calls["thread"][-1] == ("bob", "幾點開門呀", "我哋 11 點開門")
@@ -0,0 +1,89 @@
+import threading
+
+import pytest
+
+from app.models.chat_history import ChatHistory
+from app.models.migrations import prepare_database
+from app.services.chat_logger import WriteBehindChatLogger
+
+
+@pytest.fixture
+def chat_history(tmp_path):
+    chat_history = ChatHistory(db_path=str(tmp_path / "chat_history.db"))
+    prepare_database(chat_history)
+    yield chat_history
+    chat_history.close()
+
+
+def count_records(chat_history, wa_id=None):
+    with chat_history.get_db_connection() as conn:
+        if wa_id is None:
+            return conn.execute('SELECT COUNT(*) FROM chat_history').fetchone()[0]
+        return conn.execute('SELECT COUNT(*) FROM chat_history WHERE wa_id = ?', (wa_id,)).fetchone()[0]
+
+
+def test_commit_durability_writes_concurrent_records(chat_history):
+    logger = WriteBehindChatLogger(chat_history, batch_size=50, flush_interval=0.01, durability="commit")
+    results = []
+
+    def write(worker):
+        for i in range(20):
+            results.append(logger.log(f"user_{worker}", "測試", f"問題 {i}", f"回答 {i}", category="others"))
+
+    threads = [threading.Thread(target=write, args=(worker,)) for worker in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    logger.shutdown()
+
+    assert all(results) and len(results) == 100
+    assert count_records(chat_history) == 100
+    assert logger.stats()["records"] == 100
+
+
+def test_log_after_writer_stopped_writes_synchronously(chat_history):
+    logger = WriteBehindChatLogger(chat_history, durability="none")
+    logger.shutdown()
+
+    assert logger.log("late_user", "測試", "你好", "你好！")
+    assert count_records(chat_history, "late_user") == 1
+    assert logger.stats()["fallback_sync_writes"] == 1
+
+
+@pytest.mark.parametrize("durability", ["none", "commit"])
+def test_writer_survives_a_failing_batch(chat_history, monkeypatch, durability):
+    logger = WriteBehindChatLogger(chat_history, flush_interval=0.01, durability=durability)
+    original_flush = logger._flush
+    calls = []
+
+    def flaky_flush(batch):
+        calls.append(len(batch))
+        if len(calls) == 1:
+            raise RuntimeError("disk full")
+        return original_flush(batch)
+
+    monkeypatch.setattr(logger, "_flush", flaky_flush)
+
+    first = logger.log("user_a", "測試", "第一條", "回覆")
+    # 與失敗記錄同批的 flush 會返回 False
+    logger.flush()
+    second = logger.log("user_a", "測試", "第二條", "回覆")
+    assert logger.flush()
+    logger.shutdown()
+
+    # 第一批失敗，寫入線程仍然存活並寫入之後的記錄
+    assert first is (True if durability == "none" else False)
+    assert second is True
+    assert count_records(chat_history, "user_a") == 1
+    assert logger.stats()["writer_errors"] == 1
+
+
+def test_commit_log_does_not_hang_when_writer_dies(chat_history, monkeypatch):
+    logger = WriteBehindChatLogger(chat_history, durability="commit")
+    # 模擬寫入線程在處理記錄之前已經退出
+    logger.shutdown()
+    monkeypatch.setattr(logger._thread, "is_alive", iter([True, False, False]).__next__)
+
+    assert logger.log("user_b", "測試", "你好", "你好！")
+    assert count_records(chat_history, "user_b") == 1
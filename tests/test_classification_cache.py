@@ -0,0 +1,13 @@
+from app.services.classification_cache import normalize_text
+
+
+def test_whitespace_between_cjk_characters_is_removed():
+    assert normalize_text("幾點 開門") == normalize_text("幾點開門")
+    assert normalize_text("幾點　開門？") == normalize_text("幾點開門")
+    assert normalize_text("幾點，開門") == normalize_text("幾點開門")
+
+
+def test_whitespace_next_to_latin_words_is_kept():
+    assert normalize_text("Opening  Hours") == "opening hours"
+    assert normalize_text("幾點 open") == normalize_text("幾點 OPEN")
+    assert normalize_text("happy hour 幾點") == "happy hour 几点"
@@ -0,0 +1,101 @@
+import os
+
+import numpy as np
+import pytest
+
+from document_processor.embedding_cache import EmbeddingCache
+
+DIM = 8
+
+
+def fake_encode(texts):
+    """每個文本對應一個確定的向量，方便比較緩存讀回的結果"""
+    return np.asarray([np.full(DIM, sum(map(ord, text)) / 100) for text in texts], dtype=np.float32)
+
+
+def expected(texts):
+    return fake_encode(texts)
+
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    return str(tmp_path)
+
+
+def open_cache(cache_dir):
+    return EmbeddingCache(cache_dir, "test-model", dtype="float32")
+
+
+def test_vectors_survive_reopen(cache_dir):
+    texts = ["a", "bb", "ccc"]
+    first = open_cache(cache_dir).encode(texts, fake_encode)
+
+    calls = []
+    reopened = open_cache(cache_dir)
+    again = reopened.encode(texts, lambda batch: calls.append(batch) or fake_encode(batch))
+
+    assert calls == []
+    np.testing.assert_allclose(again, first)
+
+
+def test_partial_vector_row_is_truncated(cache_dir):
+    cache = open_cache(cache_dir)
+    cache.encode(["a", "bb"], fake_encode)
+    # 模擬寫入向量中途崩潰：只寫了半行，索引行還沒寫
+    with open(cache.vectors_path, "ab") as f:
+        f.write(b"\x00" * (DIM * 4 // 2))
+
+    reopened = open_cache(cache_dir)
+    assert os.path.getsize(reopened.vectors_path) == 2 * DIM * 4
+    vectors = reopened.encode(["dddd", "eeeee"], fake_encode)
+    np.testing.assert_allclose(vectors, expected(["dddd", "eeeee"]))
+
+    # 新的行號接在完整的行之後，所有文本都讀回正確的向量
+    final = open_cache(cache_dir)
+    np.testing.assert_allclose(final.encode(["a", "bb"], fake_encode), expected(["a", "bb"]))
+    np.testing.assert_allclose(final.encode(["dddd", "eeeee"], fake_encode), expected(["dddd", "eeeee"]))
+    assert final.stats()["misses"] == 0
+
+
+def test_partial_index_line_does_not_break_open(cache_dir):
+    cache = open_cache(cache_dir)
+    cache.encode(["a"], fake_encode)
+    with open(cache.index_path, "a") as f:
+        f.write("deadbeef\t")
+
+    reopened = open_cache(cache_dir)
+    reopened.encode(["bb"], fake_encode)
+
+    with open(reopened.index_path) as f:
+        lines = f.read().splitlines()
+    assert len(lines) == 2
+    assert all(len(line.split("\t")) == 2 for line in lines)
+    np.testing.assert_allclose(open_cache(cache_dir).encode(["a", "bb"], fake_encode), expected(["a", "bb"]))
+
+
+def test_malformed_index_line_is_skipped(cache_dir):
+    cache = open_cache(cache_dir)
+    cache.encode(["a"], fake_encode)
+    with open(cache.index_path, "a") as f:
+        f.write("garbage\n")
+
+    reopened = open_cache(cache_dir)
+    assert reopened.stats()["disk_entries"] == 1
+    np.testing.assert_allclose(reopened.encode(["a"], fake_encode), expected(["a"]))
+
+
+def test_unpersisted_texts_stay_in_memory_only(cache_dir):
+    cache = open_cache(cache_dir)
+    cache.encode(["corpus"], fake_encode)
+    size = os.path.getsize(cache.vectors_path)
+
+    calls = []
+    vectors = cache.encode(["query"], lambda batch: calls.append(batch) or fake_encode(batch), persist=False)
+    np.testing.assert_allclose(vectors, expected(["query"]))
+    assert os.path.getsize(cache.vectors_path) == size
+    assert cache.stats()["disk_entries"] == 1
+
+    # 同一進程內重複的查詢仍由內存 LRU 命中
+    cache.encode(["query"], lambda batch: calls.append(batch) or fake_encode(batch), persist=False)
+    assert calls == [["query"]]
+    assert open_cache(cache_dir).stats()["disk_entries"] == 1
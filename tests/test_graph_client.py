@@ -0,0 +1,134 @@
+import json
+import socket
+import threading
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from app.services import graph_client
+from app.services.graph_client import GraphAPIClient, compute_backoff, parse_retry_after
+
+
+class StubGraphHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.server.received.append(json.loads(self.rfile.read(length) or b"{}"))
+        status, headers = self.server.script.pop(0) if self.server.script else (200, {})
+        body = json.dumps({"messages": [{"id": "wamid.test"}]} if status == 200 else {"error": {}}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def graph_server():
+    """本地模擬的 Graph API；server.script 按順序指定每次請求的 (狀態碼, 標頭)"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubGraphHandler)
+    server.script = []
+    server.received = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """記錄重試等待時間而不真的等待"""
+    recorded = []
+    monkeypatch.setattr(graph_client.time, "sleep", recorded.append)
+    return recorded
+
+
+def make_client(base_url, **kwargs):
+    return GraphAPIClient("token", "v18.0", "12345", base_url=base_url, **kwargs)
+
+
+def server_url(server):
+    host, port = server.server_address
+    return f"http://{host}:{port}"
+
+
+def test_retries_429_and_5xx_then_succeeds(graph_server, sleeps):
+    graph_server.script = [(429, {"Retry-After": "2"}), (503, {}), (200, {})]
+    client = make_client(server_url(graph_server), max_retries=3, backoff_base=0.5)
+
+    response = client.send(json.dumps({"to": "85290000000"}))
+
+    assert response.status_code == 200
+    assert len(graph_server.received) == 3
+    assert client.stats()["retries"] == 2
+    assert client.stats()["failures"] == 0
+    # 第一次按 Retry-After 等待，第二次使用指數退避（attempt=1，上限 base * 2）
+    assert sleeps[0] == 2.0
+    assert 0 <= sleeps[1] <= 1.0
+
+
+def test_retry_after_is_capped_by_backoff_max(graph_server, sleeps):
+    graph_server.script = [(429, {"Retry-After": "120"}), (200, {})]
+    client = make_client(server_url(graph_server), backoff_max=8.0)
+
+    client.send("{}")
+
+    assert sleeps == [8.0]
+
+
+def test_does_not_retry_non_retryable_4xx(graph_server, sleeps):
+    graph_server.script = [(400, {})]
+    client = make_client(server_url(graph_server), max_retries=3)
+
+    with pytest.raises(requests.HTTPError):
+        client.send("{}")
+
+    assert len(graph_server.received) == 1
+    assert sleeps == []
+    assert client.stats()["failures"] == 1
+
+
+def test_gives_up_after_max_retries(graph_server, sleeps):
+    graph_server.script = [(500, {})] * 5
+    client = make_client(server_url(graph_server), max_retries=2)
+
+    with pytest.raises(requests.HTTPError):
+        client.send("{}")
+
+    assert len(graph_server.received) == 3
+    assert len(sleeps) == 2
+    assert client.stats()["failures"] == 1
+
+
+def test_retries_connection_errors(sleeps):
+    # 取得一個沒有服務監聽的端口
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    client = make_client(f"http://127.0.0.1:{port}", max_retries=2, timeout=1)
+
+    with pytest.raises(requests.ConnectionError):
+        client.send("{}")
+
+    assert client.stats()["requests"] == 3
+    assert len(sleeps) == 2
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+    # HTTP 日期格式：已經過去的時間不需要等待
+    assert parse_retry_after(formatdate(0, usegmt=True)) == 0.0
+
+
+def test_compute_backoff_stays_within_cap():
+    assert all(0 <= compute_backoff(attempt, 0.5, 4.0) <= 4.0 for attempt in range(10))
+    assert compute_backoff(0, 0.5, 4.0, retry_after=1.5) == 1.5
@@ -0,0 +1,151 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import rag.document_processor as document_processor
+import rag.ingestion as ingestion
+from rag.document_processor import DocumentProcessor
+
+
+class FakeVector(list):
+    def tolist(self):
+        return list(self)
+
+
+class FakeCollection:
+    def __init__(self, documents):
+        self.name = "restaurant_info"
+        self.metadata = {"ingest_version": "1"}
+        self.docs = {
+            DocumentProcessor.document_id(text): (text, metadata) for text, metadata in documents
+        }
+        self.updated = []
+
+    def get(self, include=None):
+        ids = list(self.docs)
+        return {"ids": ids, "metadatas": [self.docs[doc_id][1] for doc_id in ids]}
+
+    def upsert(self, ids, documents, metadatas, embeddings=None):
+        for doc_id, text, metadata in zip(ids, documents, metadatas):
+            self.docs[doc_id] = (text, metadata)
+
+    def update(self, ids, metadatas):
+        self.updated.extend(ids)
+
+    def delete(self, ids):
+        for doc_id in ids:
+            del self.docs[doc_id]
+
+    def modify(self, metadata):
+        self.metadata = metadata
+
+
+class FakeRegistry:
+    def __init__(self, collection):
+        self.collection = collection
+
+    def get_collection(self, name, create=False):
+        return self.collection
+
+    def embed(self, texts, normalize=False, persist=False):
+        return [FakeVector([0.0, 1.0]) for _ in texts]
+
+    def invalidate_collection(self, name):
+        pass
+
+
+class FakePage:
+    def __init__(self, text):
+        self.text = text
+
+    def extract_text(self):
+        return self.text
+
+
+class FakePdf:
+    def __init__(self, pages):
+        self.pages = [FakePage(text) for text in pages]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+@pytest.fixture
+def pdfs(tmp_path, monkeypatch):
+    """a.pdf 和 b.pdf 各有一頁；返回的字典可以把文件設為打開失敗或提取失敗"""
+    contents = {"a.pdf": ["菜單\n\n牛肉麵"], "b.pdf": ["營業時間\n\n11:00 - 22:00"]}
+    failures = {}
+    for name in contents:
+        (tmp_path / name).write_bytes(b"")
+    opened = {}
+
+    def fake_open(path):
+        name = os.path.basename(path)
+        opened[name] = opened.get(name, 0) + 1
+        # 第一次打開用於計算頁數，第二次是子任務提取頁面
+        if failures.get(name) == "open" or (failures.get(name) == "extract" and opened[name] > 1):
+            raise OSError(f"cannot read {name}")
+        return FakePdf(contents[name])
+
+    monkeypatch.setattr(ingestion.pdfplumber, "open", fake_open)
+    # 測試中用線程代替進程，假的 pdfplumber 才會生效
+    monkeypatch.setattr(ingestion, "ProcessPoolExecutor", ThreadPoolExecutor)
+    monkeypatch.setattr(document_processor, "build_lexical_index", lambda collection: None)
+    return tmp_path, failures
+
+
+def make_ingestion(monkeypatch, collection):
+    monkeypatch.setattr(ingestion, "get_registry", lambda: FakeRegistry(collection))
+    return ingestion.StreamingIngestion(workers=1, batch_size=2)
+
+
+def existing_documents():
+    return [
+        ("菜單", {"source": "a.pdf", "page": 1}),
+        ("牛肉麵", {"source": "a.pdf", "page": 1}),
+        ("營業時間", {"source": "b.pdf", "page": 1}),
+        ("11:00 - 22:00", {"source": "b.pdf", "page": 1}),
+        ("已下架的菜式", {"source": "a.pdf", "page": 1}),
+    ]
+
+
+def test_complete_pass_deletes_stale_documents(pdfs, monkeypatch):
+    directory, _ = pdfs
+    collection = FakeCollection(existing_documents())
+    stats = make_ingestion(monkeypatch, collection).run(str(directory))
+
+    assert stats["deleted"] == 1
+    assert stats["failed_files"] == 0
+    assert DocumentProcessor.document_id("已下架的菜式") not in collection.docs
+
+
+@pytest.mark.parametrize("failure", ["open", "extract"])
+def test_failed_file_keeps_existing_documents(pdfs, monkeypatch, failure):
+    directory, failures = pdfs
+    failures["b.pdf"] = failure
+    collection = FakeCollection(existing_documents())
+    stats = make_ingestion(monkeypatch, collection).run(str(directory))
+
+    assert stats["failed_files"] == 1
+    assert stats["deleted"] == 0
+    assert len(collection.docs) == 5
+    assert DocumentProcessor.document_id("營業時間") in collection.docs
+
+
+def test_inserted_paragraph_only_adds_the_new_chunk(pdfs, monkeypatch):
+    directory, _ = pdfs
+    contents = {"a.pdf": ["新菜式\n\n菜單\n\n牛肉麵"], "b.pdf": ["營業時間\n\n11:00 - 22:00"]}
+    monkeypatch.setattr(ingestion.pdfplumber, "open",
+                        lambda path: FakePdf(contents[os.path.basename(path)]))
+    collection = FakeCollection(existing_documents()[:4])
+    stats = make_ingestion(monkeypatch, collection).run(str(directory))
+
+    # 前面插入段落不會改寫後面已存在段落的 metadata
+    assert stats["added"] == 1
+    assert stats["unchanged"] == 4
+    assert collection.updated == []
+    assert collection.docs[DocumentProcessor.document_id("新菜式")][1] == {"source": "a.pdf", "page": 1}
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from app.services import intent_classifier
+
+
+@pytest.fixture(autouse=True)
+def fresh_loader(monkeypatch, tmp_path):
+    monkeypatch.setattr(intent_classifier, "_intent_classifier", None)
+    monkeypatch.setattr(intent_classifier, "_intent_classifier_unavailable", False)
+    monkeypatch.setenv("INTENT_MODEL_PATH", str(tmp_path / "intent_centroids.npz"))
+    monkeypatch.delenv("LOCAL_INTENT_CLASSIFIER", raising=False)
+
+
+def test_disabled_without_trained_centroids(monkeypatch):
+    created = []
+    monkeypatch.setattr(intent_classifier, "EmbeddingIntentClassifier",
+                        lambda **kwargs: created.append(kwargs))
+    assert intent_classifier.get_intent_classifier() is None
+    assert intent_classifier.get_intent_classifier() is None
+    # 沒有訓練好的模型時不會用示例句子建立分類器
+    assert created == []
+
+
+def test_load_failure_is_remembered(monkeypatch, tmp_path):
+    np.savez(str(tmp_path / "intent_centroids.npz"), labels=np.array(["others"]),
+             centroids=np.ones((1, 4), dtype=np.float32))
+    attempts = []
+
+    def failing(**kwargs):
+        attempts.append(kwargs)
+        raise OSError("broken model file")
+
+    monkeypatch.setattr(intent_classifier, "EmbeddingIntentClassifier", failing)
+    assert intent_classifier.get_intent_classifier() is None
+    assert intent_classifier.get_intent_classifier() is None
+    assert len(attempts) == 1
+
+
+def test_trained_centroids_enable_the_classifier(tmp_path):
+    np.savez(str(tmp_path / "intent_centroids.npz"), labels=np.array(["others", "reservation"]),
+             centroids=np.eye(2, 4, dtype=np.float32))
+    classifier = intent_classifier.get_intent_classifier()
+    assert classifier is not None
+    assert classifier.labels == ["others", "reservation"]
+    assert intent_classifier.get_intent_classifier() is classifier
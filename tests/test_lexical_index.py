@@ -0,0 +1,57 @@
+import pytest
+
+from rag.lexical_index import LexicalIndex, tokenize
+from rag.query_handler import QueryHandler
+
+DOCUMENTS = [
+    "餐廳地址：香港中環皇后大道中100號",
+    "訂座電話：2345 6789，WhatsApp 同樣可以訂座",
+    "今日精選：黑松露牛肉麵，只限午市供應",
+    "營業時間：星期一至日 11:00 - 22:00",
+]
+
+
+@pytest.fixture
+def index():
+    index = LexicalIndex()
+    index.build([f"doc_{i}" for i in range(len(DOCUMENTS))], DOCUMENTS)
+    return index
+
+
+@pytest.fixture
+def handler():
+    # 只測試判斷邏輯，不建立 ChromaDB 和模型
+    handler = QueryHandler.__new__(QueryHandler)
+    handler.lexical_min_coverage = 0.8
+    handler.lexical_margin = 1.5
+    handler.lexical_min_terms = 2
+    handler.lexical_min_score = 1.0
+    return handler
+
+
+def test_tokenize_uses_cjk_bigrams():
+    assert tokenize("營業時間") == ["營業", "業時", "時間"]
+    assert tokenize("WhatsApp 2345") == ["whatsapp", "2345"]
+
+
+def test_coverage_counts_out_of_vocabulary_terms(index):
+    results, coverage, matched = index.search("今日天氣點樣")
+    # 只碰巧命中「今日」，其餘四個詞不在索引中
+    assert results[0][0] == DOCUMENTS[2]
+    assert matched == 1
+    assert coverage == pytest.approx(1 / 5)
+
+
+def test_incidental_match_falls_back_to_vector_search(index, handler):
+    assert not handler._lexical_confident(*index.search("今日天氣點樣"))
+
+
+def test_keyword_query_uses_lexical_fast_path(index, handler):
+    results, coverage, matched = index.search("營業時間")
+    assert results[0][0] == DOCUMENTS[3]
+    assert coverage == 1.0
+    assert handler._lexical_confident(results, coverage, matched)
+
+
+def test_unknown_query_returns_nothing(index):
+    assert index.search("停車場") == ([], 0.0, 0)
@@ -0,0 +1,93 @@
+import os
+import threading
+
+import numpy as np
+import pytest
+
+from rag.numpy_index import NumpyVectorIndex
+from rag.quantized_index import QuantizedVectorIndex, hamming_distances, sign_words
+
+
+def snapshot(version: int, count: int = 50, dim: int = 16):
+    """每個版本的文檔內容帶版本號，文檔數量也隨版本變化，方便檢查是否混合"""
+    count += version
+    rng = np.random.default_rng(version)
+    vectors = rng.normal(size=(count, dim)).astype(np.float32)
+    ids = [f"doc_{i}" for i in range(count)]
+    documents = [f"v{version}-{i}" for i in range(count)]
+    return ids, documents, vectors
+
+
+@pytest.mark.parametrize("index_class", [NumpyVectorIndex, QuantizedVectorIndex])
+def test_search_returns_nearest_document(tmp_path, index_class):
+    index = index_class(snapshot_dir=str(tmp_path))
+    ids, documents, vectors = snapshot(1)
+    index.build(ids, documents, vectors, version="1")
+
+    results = index.search(vectors[7], k=3)
+    assert results[0][0] == documents[7]
+
+    reloaded = index_class(snapshot_dir=str(tmp_path))
+    assert reloaded.load()
+    assert reloaded.version == "1"
+    assert reloaded.search(vectors[7], k=1)[0][0] == documents[7]
+
+
+def test_concurrent_exports_never_mix_snapshots(tmp_path):
+    errors = []
+    stop = threading.Event()
+
+    def export(version):
+        try:
+            NumpyVectorIndex(snapshot_dir=str(tmp_path)).build(*snapshot(version), version=str(version))
+        except Exception as e:
+            errors.append(e)
+
+    def read():
+        # 讀者每次載入的向量和文檔都必須屬於同一個版本
+        while not stop.is_set():
+            index = NumpyVectorIndex(snapshot_dir=str(tmp_path))
+            try:
+                loaded = index.load()
+            except FileNotFoundError:
+                # 快照剛被清理，下次會讀到新的 CURRENT
+                continue
+            if loaded:
+                version = int(index.version)
+                if not all(document.startswith(f"v{version}-") for document in index.documents) \
+                        or len(index.vectors) != len(index.documents):
+                    errors.append(AssertionError(f"snapshot {version} is mixed"))
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    writers = [threading.Thread(target=export, args=(version,)) for version in range(1, 9)]
+    for thread in writers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    stop.set()
+    reader.join()
+
+    assert errors == []
+    index = NumpyVectorIndex(snapshot_dir=str(tmp_path))
+    assert index.load()
+    assert index.documents[0] == f"v{index.version}-0"
+    # 只保留最近的快照目錄，不留下臨時文件
+    root = os.path.join(str(tmp_path), "restaurant_info")
+    snapshots = [name for name in os.listdir(root) if name.startswith("snapshot-")]
+    assert len(snapshots) <= 2
+    assert not [name for name in os.listdir(root) if name.endswith(".tmp")]
+
+
+@pytest.mark.parametrize("vectorised", [True, False])
+def test_hamming_distances_match_bit_count(monkeypatch, vectorised):
+    if not vectorised:
+        # NumPy < 2.0 沒有 bitwise_count，改用查表
+        monkeypatch.delattr(np, "bitwise_count", raising=False)
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(200, 100)).astype(np.float32)
+    query = rng.normal(size=100).astype(np.float32)
+
+    distances = hamming_distances(np.ascontiguousarray(sign_words(vectors).T), sign_words(query)[0])
+    expected = ((vectors > 0) != (query > 0)).sum(axis=1)
+    np.testing.assert_array_equal(distances, expected)
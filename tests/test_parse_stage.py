@@ -0,0 +1,16 @@
+from app.services.pipeline import MessagePipeline
+from app.utils import whatsapp_utils
+
+
+def test_non_text_messages_stop_the_pipeline_cleanly():
+    errors = []
+    pipeline = MessagePipeline([
+        ("parse", whatsapp_utils.parse_stage),
+        ("generate", lambda ctx: errors.append("should not run")),
+    ])
+    pipeline.on_error(lambda ctx, error: errors.append(error))
+    for message in ({"id": "img", "type": "image", "image": {"id": "media"}},
+                    {"id": "re", "type": "reaction", "reaction": {"emoji": "👍"}}):
+        ctx = pipeline.run(message, {"wa_id": "alice"})
+        assert ctx.halt_reason == "unsupported_type"
+    assert errors == []
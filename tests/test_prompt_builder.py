@@ -0,0 +1,25 @@
+from app.services.prompt_builder import PromptBuilder
+
+
+def test_oversized_top_chunk_is_truncated_instead_of_dropped():
+    builder = PromptBuilder(context_budget=10)
+    top = "營業時間" * 20
+    context = builder.pack_chunks([(top, 0.9), ("短片段" * 10, 0.5)])
+
+    assert context
+    assert top.startswith(context)
+    assert builder.count(context) <= 10
+
+
+def test_chunks_are_packed_by_score_within_budget():
+    builder = PromptBuilder()
+    budget = builder.count("高分片段") + builder.count("中分片段")
+    context = builder.pack_chunks(budget=budget, chunks=[("低分片段", 0.1), ("高分片段", 0.9), ("中分片段", 0.5)])
+    assert context == "高分片段\n\n中分片段"
+
+
+def test_explicit_zero_budget_is_not_replaced_by_default():
+    builder = PromptBuilder(context_budget=1500, history_budget=1000)
+    assert builder.pack_chunks([("營業時間", 1.0)], budget=0) == ""
+    assert builder.pack_history([{"content": "你好"}], budget=0) == []
+    assert PromptBuilder(context_budget=0).context_budget == 0
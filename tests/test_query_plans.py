@@ -0,0 +1,37 @@
+import pytest
+
+from app.models.chat_history import ChatHistory
+from app.models.migrations import QUERY_PLAN_CHECKS, check_query_plans, prepare_database
+
+
+@pytest.fixture(scope="module")
+def chat_history(tmp_path_factory):
+    chat_history = ChatHistory(db_path=str(tmp_path_factory.mktemp("db") / "chat_history.db"))
+    prepare_database(chat_history)
+    # 有一定數據量並執行 ANALYZE 後，查詢規劃器的選擇才接近生產環境
+    with chat_history.get_db_connection() as conn:
+        conn.executemany(
+            'INSERT INTO chat_history (wa_id, user_name, message, response) VALUES (?, ?, ?, ?)',
+            [(f"user_{i % 50}", "測試", f"問題 {i}", f"回答 {i}") for i in range(2000)]
+        )
+        conn.executemany(
+            'INSERT INTO table_reservations (wa_id, user_name, reservation_date, reservation_time, '
+            'number_of_people) VALUES (?, ?, ?, ?, ?)',
+            [(f"user_{i}", "測試", f"2025-01-{i % 28 + 1:02d}", f"{18 + i % 4}:{i % 60:02d}", 2)
+             for i in range(500)]
+        )
+        conn.execute('ANALYZE')
+    yield chat_history
+    chat_history.close()
+
+
+@pytest.mark.parametrize("name", [check[0] for check in QUERY_PLAN_CHECKS])
+def test_hot_queries_use_indexes(chat_history, name):
+    ok, plan = check_query_plans(chat_history)[name]
+    assert ok, f"{name} 沒有使用預期的索引: {plan}"
+
+
+def test_checked_queries_still_run(chat_history):
+    # 檢查的 SQL 就是方法實際執行的語句
+    assert len(chat_history.get_user_history("user_1", limit=5)) == 5
+    assert chat_history.get_reservations_by_date("2025-01-01")
@@ -0,0 +1,119 @@
+import threading
+
+import pytest
+
+from app.models.chat_history import ChatHistory
+from app.models.migrations import prepare_database, run_migrations
+from app.services.reservation_capacity import ReservationCapacity, slot_of
+
+DATE = "2025-12-24"
+
+
+@pytest.fixture
+def chat_history(tmp_path):
+    chat_history = ChatHistory(db_path=str(tmp_path / "chat_history.db"))
+    prepare_database(chat_history)
+    yield chat_history
+    chat_history.close()
+
+
+def slot_counts(chat_history, date=DATE):
+    with chat_history.get_db_connection() as conn:
+        rows = conn.execute(
+            'SELECT reservation_time FROM table_reservations WHERE reservation_date = ? AND status != ?',
+            (date, '已取消')
+        ).fetchall()
+        counters = dict(conn.execute(
+            'SELECT slot, booked FROM reservation_slots WHERE reservation_date = ?', (date,)
+        ).fetchall())
+    bookings = {}
+    for (time_str,) in rows:
+        bookings[slot_of(time_str)] = bookings.get(slot_of(time_str), 0) + 1
+    return bookings, counters
+
+
+def test_slot_of():
+    assert slot_of("19:10") == 38
+    assert slot_of("19:30") == 39
+    assert slot_of("9:30") == slot_of("09:30") == 19
+    assert slot_of("19:10:00") == 38
+
+
+def test_concurrent_bookings_never_exceed_capacity(chat_history):
+    capacity = ReservationCapacity(chat_history, max_per_slot=3)
+    results = []
+    lock = threading.Lock()
+
+    def book(worker):
+        # 每個線程使用自己的連接，同時搶 19:00 - 19:29 這個時段
+        for i in range(5):
+            booked, _ = capacity.book(f"user_{worker}_{i}", "測試", DATE, f"19:{(worker + i) % 30:02d}", 2)
+            with lock:
+                results.append(booked)
+        chat_history.close()
+
+    threads = [threading.Thread(target=book, args=(worker,)) for worker in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    bookings, counters = slot_counts(chat_history)
+    assert sum(results) == 3
+    assert bookings == counters == {38: 3}
+
+
+def test_full_slot_does_not_block_other_slots(chat_history):
+    capacity = ReservationCapacity(chat_history, max_per_slot=1)
+    assert capacity.book("a", "A", DATE, "19:00", 2)[0]
+    assert capacity.book("b", "B", DATE, "19:20", 2) == (False, None)
+    assert capacity.book("c", "C", DATE, "19:30", 2)[0]
+    assert capacity.occupancy(DATE, "19:15") == 1
+
+
+def test_cancelling_frees_the_slot(chat_history):
+    capacity = ReservationCapacity(chat_history, max_per_slot=1)
+    _, reservation_id = capacity.book("a", "A", DATE, "19:00", 2)
+
+    assert capacity.update_status(reservation_id, "已取消")
+    assert capacity.occupancy(DATE, "19:00") == 0
+    assert capacity.book("b", "B", DATE, "19:10", 2)[0]
+    # 時段已被別人訂滿時，不能恢復已取消的訂位
+    assert not capacity.update_status(reservation_id, "已確認")
+    assert capacity.occupancy(DATE, "19:00") == 1
+    with chat_history.get_db_connection() as conn:
+        status = conn.execute('SELECT status FROM table_reservations WHERE id = ?', (reservation_id,)).fetchone()
+    assert status == ("已取消",)
+
+
+def test_restoring_a_booking_reclaims_a_free_slot(chat_history):
+    capacity = ReservationCapacity(chat_history, max_per_slot=1)
+    _, reservation_id = capacity.book("a", "A", DATE, "19:00", 2)
+    assert capacity.update_status(reservation_id, "已取消")
+    assert capacity.update_status(reservation_id, "已確認")
+    assert capacity.occupancy(DATE, "19:00") == 1
+    bookings, counters = slot_counts(chat_history)
+    assert bookings == counters == {38: 1}
+
+
+def test_capacity_defaults_to_env(monkeypatch, chat_history):
+    monkeypatch.setenv("MAX_BOOKINGS_PER_SLOT", "5")
+    assert ReservationCapacity(chat_history).max_per_slot == 5
+
+
+def test_migration_backfills_counters_with_slot_of(tmp_path):
+    chat_history = ChatHistory(db_path=str(tmp_path / "legacy.db"))
+    chat_history.init_db()
+    # 遷移前寫入的訂位，時間格式不一定補零
+    for time_str, status in [("9:30", "已確認"), ("09:45", "待確認"), ("19:00", "已取消")]:
+        with chat_history.get_db_connection() as conn:
+            conn.execute(
+                'INSERT INTO table_reservations (wa_id, user_name, reservation_date, reservation_time, '
+                'number_of_people, status) VALUES (?, ?, ?, ?, ?, ?)',
+                ("legacy", "舊客", DATE, time_str, 2, status)
+            )
+    run_migrations(chat_history)
+
+    bookings, counters = slot_counts(chat_history)
+    assert bookings == counters == {19: 2}
+    chat_history.close()
@@ -0,0 +1,57 @@
+import queue
+import threading
+import time
+
+from app.services.sharded_executor import ShardedExecutor
+
+
+class SlowQueue(queue.Queue):
+    """入隊前稍作停頓，放大檢查 _stopping 和入隊之間的時間窗口"""
+
+    def put_nowait(self, item):
+        time.sleep(0.001)
+        super().put_nowait(item)
+
+
+def test_tasks_accepted_during_shutdown_always_resolve():
+    for _ in range(5):
+        executor = ShardedExecutor(num_shards=2, max_queue_per_shard=10000, max_pending_per_key=10000)
+        for shard in executor._shards:
+            shard.queue = SlowQueue()
+        executor.start()
+        accepted = []
+        start = threading.Event()
+
+        def submit(worker):
+            start.wait()
+            for i in range(500):
+                try:
+                    accepted.append(executor.submit(f"user_{worker}_{i % 7}", lambda: None))
+                except RuntimeError:
+                    return
+                except queue.Full:
+                    continue
+
+        threads = [threading.Thread(target=submit, args=(worker,)) for worker in range(4)]
+        for thread in threads:
+            thread.start()
+        start.set()
+        time.sleep(0.02)
+        executor.shutdown(timeout=10)
+        for thread in threads:
+            thread.join()
+
+        # 被接收的任務都排在停止標記之前，一定會被執行
+        assert all(future.done() for future in accepted)
+
+
+def test_submit_after_shutdown_is_rejected():
+    executor = ShardedExecutor(num_shards=1)
+    executor.start()
+    executor.shutdown()
+    try:
+        executor.submit("a", lambda: None)
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("submit after shutdown should raise")
@@ -0,0 +1,48 @@
+import pytest
+
+from app.models.chat_history import ChatHistory
+from app.models.thread_store import ThreadStore
+
+
+@pytest.fixture
+def chat_history(tmp_path):
+    chat_history = ChatHistory(db_path=str(tmp_path / "chat_history.db"))
+    chat_history.init_db()
+    yield chat_history
+    chat_history.close()
+
+
+def backdate(chat_history, wa_id, days):
+    with chat_history.get_db_connection() as conn:
+        conn.execute(
+            "UPDATE assistant_threads SET last_used_at = datetime('now', ?) WHERE wa_id = ?",
+            (f"-{days} days", wa_id)
+        )
+        conn.commit()
+
+
+def thread_rows(chat_history):
+    with chat_history.get_db_connection() as conn:
+        return {row[0] for row in conn.execute("SELECT wa_id FROM assistant_threads")}
+
+
+def test_expired_threads_are_purged_every_n_sets(monkeypatch, chat_history, tmp_path):
+    monkeypatch.setenv("THREAD_PURGE_EVERY", "3")
+    store = ThreadStore(chat_history, ttl_hours=24, legacy_shelve_path=str(tmp_path / "none"))
+    store.set("old", "thread_old")
+    backdate(chat_history, "old", 2)
+
+    store.set("a", "thread_a")
+    assert "old" in thread_rows(chat_history)
+    store.set("b", "thread_b")
+    assert thread_rows(chat_history) == {"a", "b"}
+
+
+def test_expired_threads_are_purged_on_startup(chat_history, tmp_path):
+    store = ThreadStore(chat_history, ttl_hours=24, legacy_shelve_path=str(tmp_path / "none"))
+    store.set("old", "thread_old")
+    store.set("fresh", "thread_fresh")
+    backdate(chat_history, "old", 2)
+
+    ThreadStore(chat_history, ttl_hours=24, legacy_shelve_path=str(tmp_path / "none"))
+    assert thread_rows(chat_history) == {"fresh"}
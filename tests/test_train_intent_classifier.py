@@ -0,0 +1,32 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+from train_intent_classifier import merge_examples, stratified_split  # noqa: E402
+
+
+def test_holdout_is_stratified_and_disjoint_from_training():
+    examples = {"menu": [f"m{i}" for i in range(10)], "hours": [f"h{i}" for i in range(5)], "other": ["o"]}
+    train, holdout = stratified_split(examples, 0.2, seed=1)
+
+    held = {}
+    for label, text in holdout:
+        held.setdefault(label, []).append(text)
+    assert len(held["menu"]) == 2
+    assert len(held["hours"]) == 1
+    # 只有一個樣本的類別不留出，否則訓練集裡沒有這個類別
+    assert "other" not in held and train["other"] == ["o"]
+    for label, texts in examples.items():
+        assert not set(train[label]) & set(held.get(label, []))
+        assert sorted(train[label] + held.get(label, [])) == sorted(texts)
+
+
+def test_split_is_deterministic_for_a_seed():
+    examples = {"menu": [f"m{i}" for i in range(20)]}
+    assert stratified_split(examples, 0.2, seed=7) == stratified_split(examples, 0.2, seed=7)
+
+
+def test_merge_examples_keeps_labels_from_every_source():
+    merged = merge_examples({"menu": ["a"]}, {"menu": ["b"], "hours": ["c"]})
+    assert merged == {"menu": ["a", "b"], "hours": ["c"]}
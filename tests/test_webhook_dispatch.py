@@ -0,0 +1,30 @@
+import time
+from concurrent.futures import Future
+
+from app.utils.whatsapp_utils import dispatch_whatsapp_messages
+
+
+class FakePool:
+    """fast 的訊息立即完成，其他訊息一直沒有結果（模擬卡住的 OpenAI 調用）"""
+
+    def submit(self, key, message, contact):
+        future = Future()
+        if message["text"]["body"] == "fast":
+            future.set_result(None)
+        return future
+
+
+def payload(*bodies):
+    messages = [{"id": f"m{i}", "from": f"u{i}", "type": "text", "text": {"body": body}}
+                for i, body in enumerate(bodies)]
+    contacts = [{"wa_id": f"u{i}"} for i in range(len(bodies))]
+    return {"object": "whatsapp_business_account",
+            "entry": [{"changes": [{"value": {"messages": messages, "contacts": contacts}}]}]}
+
+
+def test_sync_dispatch_stops_waiting_at_the_deadline():
+    start = time.monotonic()
+    results = dispatch_whatsapp_messages(payload("fast", "stuck", "stuck"), FakePool(), timeout=0.2)
+
+    assert time.monotonic() - start < 1.0
+    assert [result["status"] for result in results] == ["ok", "timeout", "timeout"]
@@ -1,14 +1,14 @@
-import chromadb
 import os
 from dotenv import load_dotenv
+from rag.registry import get_registry
 
 class VectorStore:
     def __init__(self):
         load_dotenv()
         vector_db_path = os.getenv('VECTOR_DB_PATH', './vector_db')
         
-        # 使用新的客戶端配置方式
-        self.client = chromadb.PersistentClient(path=vector_db_path)
+        # 同一路徑的客戶端由註冊表共用
+        self.client = get_registry().get_chroma_client(vector_db_path)
     
     def store_embeddings(self, collection_name, documents, embeddings):
         """
@@ -6,6 +6,7 @@ from rag.query_handler import QueryHandler
 
 class WebhookHandler:
     def __init__(self):
+        # 以下組件透過註冊表共用同一個模型和 ChromaDB 客戶端
         self.doc_processor = DocumentProcessor()
         self.embedding_gen = EmbeddingGenerator()
         self.vector_store = VectorStore()